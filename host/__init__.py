@@ -0,0 +1,58 @@
+# Runs the display code on a Linux or macOS host instead of a CircuitPython board.
+#
+#     import host
+#     host.install()
+#
+# install() registers stand-ins for the CircuitPython modules the code imports (ulab, board, analogbufio, analogio,
+# digitalio, neopixel and adafruit_dotstar) and puts src on the import path.  The stand-ins are numpy backed; see
+# ulab_shim, audio, pixels and hardware.  python -m host.simulate runs every board class from code.py.
+#
+# The host directory is not copied to CIRCUITPY.
+import builtins
+import os
+import sys
+import types
+import typing
+
+from host import audio, hardware, pixels, ulab_shim
+
+src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+_installed = False
+
+
+def install() -> None:
+    '''
+    Register the host stand-ins in sys.modules and add src to sys.path.  Safe to call more than once.
+    '''
+    global _installed
+    if _installed:
+        return
+
+    modules = ulab_shim.build_modules()
+    modules['board'] = hardware.build_board()
+    modules['digitalio'] = hardware.build_digitalio()
+    modules['analogbufio'] = audio.build_analogbufio()
+    modules['analogio'] = audio.build_analogio()
+
+    neopixel = types.ModuleType('neopixel')
+    neopixel.NeoPixel = pixels.NeoPixel
+    modules['neopixel'] = neopixel
+
+    dotstar = types.ModuleType('adafruit_dotstar')
+    dotstar.DotStar = pixels.DotStar
+    modules['adafruit_dotstar'] = dotstar
+
+    for name, module in modules.items():
+        sys.modules.setdefault(name, module)
+
+    # MicroPython does not evaluate annotations, so src uses Any and Callable without importing typing, which
+    # CircuitPython does not ship.  CPython evaluates class and function annotations, so give it the names.
+    for name in ('Any', 'Callable'):
+        if not hasattr(builtins, name):
+            setattr(builtins, name, getattr(typing, name))
+
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+
+    _installed = True
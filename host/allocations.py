@@ -0,0 +1,116 @@
+# Check that the SpectrumPipeline allocates nothing per frame after warm-up, apart from what ulab always allocates.
+#
+#     python -m host.allocations
+#
+# Every sampling preset in code.py is run in float and in fixed point.  Each frame, a push and a process, is measured
+# with tracemalloc, counting memory that was freed again before the frame finished.  ulab's FFT, and the filter of
+# decimated presets, always return new arrays, so a frame may allocate what those calls allocate on their own and
+# small_object_bytes more for array views and Python numbers.  Nothing that grows with the recording is allowed.
+# Exits with status 1 if any preset allocates more.
+import argparse
+import array
+import math
+import sys
+import tracemalloc
+
+import host
+
+# Views of the work arrays, and the floats and ints a frame creates, which are the same whatever the recording size
+small_object_bytes = 1024
+
+
+def measure(call, num_calls: int) -> int:
+    '''
+    :return: The largest number of bytes a single call allocated, counting memory freed before it returned
+    '''
+    largest = 0
+    tracemalloc.start()
+    try:
+        for i in range(num_calls):
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call()
+            largest = max(largest, tracemalloc.get_traced_memory()[1] - start_bytes)
+    finally:
+        tracemalloc.stop()
+
+    return largest
+
+
+def library_bytes(pipeline, num_calls: int) -> int:
+    '''
+    Bytes the ulab calls a frame cannot avoid allocate by themselves: the FFT of the packed recording, or the filter
+    of a decimated preset.  The filter's output is freed by the end of push, before process runs the FFT.
+    '''
+    import ulab.numpy as np
+    from ulab.scipy import signal
+
+    settings = pipeline.settings
+    samples = np.zeros(settings.analysis_size, dtype=np.int16 if settings.fixed_point else np.float)
+    largest = measure(lambda: np.fft.fft(samples[0::2], samples[1::2]), num_calls)
+
+    decimator = pipeline._decimator
+    if decimator is not None:
+        work = decimator._work
+        zi = decimator._zi
+        largest = max(largest, measure(lambda: signal.sosfilt(decimator._sos, work, zi=zi), num_calls))
+
+    return largest
+
+
+def check_settings(settings, num_warmup_frames: int, num_frames: int) -> tuple[int, int]:
+    '''
+    :return: The largest number of bytes a frame allocated after warm-up, and the most it is allowed
+    '''
+    import recording
+    from spectrum_pipeline import SpectrumPipeline
+
+    frequencies = recording.get_frequencies(settings)
+    pipeline = SpectrumPipeline(settings, recording.get_frequency_index(frequencies, settings.frequency_cutoff))
+
+    hop = array.array('H', [0] * settings.hop_size)
+    for i in range(settings.hop_size):
+        hop[i] = 32768 + int(8000 * math.sin(2.0 * math.pi * 440.0 * i / settings.sample_rate))
+
+    # Fill the window, then run a few more frames so every lazily built table exists
+    while not pipeline.is_ready:
+        pipeline.push(hop)
+    for i in range(num_warmup_frames):
+        pipeline.push(hop)
+        pipeline.process()
+
+    def frame():
+        pipeline.push(hop)
+        pipeline.process()
+
+    frame_bytes = measure(frame, num_frames)
+    return frame_bytes, library_bytes(pipeline, num_frames) + small_object_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check the SpectrumPipeline does not allocate per frame')
+    parser.add_argument('--frames', type=int, default=20, help='Frames measured for each preset')
+    parser.add_argument('--warmup', type=int, default=8, help='Frames run before measuring')
+    args = parser.parse_args()
+
+    host.install()
+    from host.simulate import load_code
+
+    code = load_code()
+    failures = 0
+    for name, settings in code.sampling_settings.items():
+        for fixed_point in (False, True):
+            frame_bytes, allowed_bytes = check_settings(settings.copy(fixed_point=fixed_point), args.warmup,
+                                                        args.frames)
+            failed = frame_bytes > allowed_bytes
+            failures += failed
+            print(f'{"FAIL" if failed else "ok  "} {name:20} {"fixed point" if fixed_point else "float":11} '
+                  f'{frame_bytes:6} bytes per frame, at most {allowed_bytes}')
+
+    if failures:
+        print(f'{failures} presets allocate more per frame than ulab does')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import types
+import wave
+import numpy
+
+# Mid scale of the 16 bit ADC, where silence sits
+adc_mid_scale = 1 << 15
+
+
+class SignalSource:
+    '''
+    Produces ADC readings for BufferedIn.  Subclasses return float samples from -1 to 1, which are scaled into the
+    unsigned 16 bit range analogbufio reports.
+    '''
+
+    def __init__(self, amplitude: float = 0.5):
+        '''
+        :param amplitude: Fraction of the ADC's range a full scale signal uses.  A microphone rarely swings the
+        whole range.
+        '''
+        self.amplitude = amplitude
+
+    def read_float(self, num_samples: int, sample_rate: int) -> numpy.ndarray:
+        raise NotImplementedError()
+
+    def read(self, num_samples: int, sample_rate: int) -> numpy.ndarray:
+        '''
+        :return: num_samples uint16 ADC readings
+        '''
+        samples = self.read_float(num_samples, sample_rate) * (self.amplitude * (adc_mid_scale - 1)) + adc_mid_scale
+        return numpy.clip(samples, 0, (1 << 16) - 1).astype(numpy.uint16)
+
+
+class GeneratorSource(SignalSource):
+    '''
+    Samples a function of time.  The function is given the time of each sample in seconds and returns samples from
+    -1 to 1, so a tone is lambda t: numpy.sin(2 * numpy.pi * 440 * t).
+    '''
+
+    def __init__(self, func, amplitude: float = 0.5):
+        super().__init__(amplitude)
+        self.func = func
+        self._i_sample = 0
+
+    def read_float(self, num_samples: int, sample_rate: int) -> numpy.ndarray:
+        t = (numpy.arange(num_samples) + self._i_sample) / sample_rate
+        self._i_sample += num_samples
+        return numpy.asarray(self.func(t), dtype=numpy.float64)
+
+
+class WavSource(SignalSource):
+    '''
+    Plays a WAV file, mixed to mono and resampled to the ADC's sample rate.  Loops at the end of the file.
+    '''
+
+    def __init__(self, path: str, amplitude: float = 0.5):
+        super().__init__(amplitude)
+        self.path = path
+        self.samples, self.file_sample_rate = read_wav(path)
+        self._resampled = None
+        self._resampled_rate = None
+        self._position = 0
+
+    def _resample(self, sample_rate: int) -> numpy.ndarray:
+        if self._resampled_rate != sample_rate:
+            if sample_rate == self.file_sample_rate:
+                self._resampled = self.samples
+            else:
+                num_samples = max(1, int(len(self.samples) * sample_rate / self.file_sample_rate))
+                file_times = numpy.arange(len(self.samples)) / self.file_sample_rate
+                self._resampled = numpy.interp(numpy.arange(num_samples) / sample_rate, file_times, self.samples)
+            self._resampled_rate = sample_rate
+            self._position = 0
+
+        return self._resampled
+
+    def read_float(self, num_samples: int, sample_rate: int) -> numpy.ndarray:
+        samples = self._resample(sample_rate)
+        indicies = (numpy.arange(num_samples) + self._position) % len(samples)
+        self._position = (self._position + num_samples) % len(samples)
+        return samples[indicies]
+
+
+def read_wav(path: str) -> tuple[numpy.ndarray, int]:
+    '''
+    Read an 8, 16 or 32 bit PCM WAV file
+    :return: Mono samples from -1 to 1, and the file's sample rate
+    '''
+    with wave.open(path, 'rb') as wav:
+        num_channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        samples = (numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.float64) - 128) / 128
+    elif sample_width == 2:
+        samples = numpy.frombuffer(data, dtype='<i2').astype(numpy.float64) / (1 << 15)
+    elif sample_width == 4:
+        samples = numpy.frombuffer(data, dtype='<i4').astype(numpy.float64) / (1 << 31)
+    else:
+        raise ValueError(f'Unsupported WAV sample width: {sample_width} bytes')
+
+    samples = samples.reshape(-1, num_channels).mean(axis=1)
+    if len(samples) == 0:
+        raise ValueError(f'{path} has no samples')
+
+    return samples, sample_rate
+
+
+def default_source() -> SignalSource:
+    '''A tone sweeping up through the audible range over a few seconds, over a little noise'''
+    rng = numpy.random.default_rng(0)
+    sweep_s = 4.0
+
+    def sweep(t):
+        # Exponential sweep from 50Hz to 8kHz, restarting every sweep_s seconds
+        phase_t = t % sweep_s
+        ratio = 8000 / 50
+        phase = 2 * numpy.pi * 50 * sweep_s / numpy.log(ratio) * (ratio ** (phase_t / sweep_s) - 1)
+        return 0.8 * numpy.sin(phase) + 0.05 * rng.standard_normal(len(t))
+
+    return GeneratorSource(sweep)
+
+
+_source = None
+
+
+def set_source(source: SignalSource | None) -> None:
+    '''Choose what every BufferedIn and AnalogIn reads.  None goes back to default_source.'''
+    global _source
+    _source = source
+
+
+def get_source() -> SignalSource:
+    global _source
+    if _source is None:
+        _source = default_source()
+    return _source
+
+
+class BufferedIn:
+    '''
+    Stands in for analogbufio.BufferedIn.  readinto returns immediately rather than taking as long as the samples
+    would take to record, so the simulator runs faster than real time.
+    '''
+
+    def __init__(self, pin, *, sample_rate: int):
+        self.pin = pin
+        self.sample_rate = sample_rate
+
+    def readinto(self, buffer, loop: bool = False) -> int:
+        samples = get_source().read(len(buffer), self.sample_rate)
+        buffer[:] = type(buffer)(buffer.typecode, samples.tobytes()) if hasattr(buffer, 'typecode') else samples
+        return len(buffer)
+
+    def deinit(self) -> None:
+        pass
+
+
+class AnalogIn:
+    '''Stands in for analogio.AnalogIn, one sample per read of value'''
+
+    def __init__(self, pin, sample_rate: int = 20000):
+        self.pin = pin
+        self.sample_rate = sample_rate
+
+    @property
+    def value(self) -> int:
+        return int(get_source().read(1, self.sample_rate)[0])
+
+    def deinit(self) -> None:
+        pass
+
+
+def build_analogbufio() -> types.ModuleType:
+    analogbufio = types.ModuleType('analogbufio')
+    analogbufio.BufferedIn = BufferedIn
+    return analogbufio
+
+
+def build_analogio() -> types.ModuleType:
+    analogio = types.ModuleType('analogio')
+    analogio.AnalogIn = AnalogIn
+    return analogio
@@ -0,0 +1,281 @@
+# Time every display mode with every display config and sampling preset from code.py.
+#
+#     python -m host.benchmark --output before.json
+#     python -m host.benchmark --output after.json
+#     python -m host.benchmark --compare before.json after.json
+#
+# Each case draws the same precomputed spectra, so runs on the same machine are comparable.  The spectra come from
+# recording one of synthetic_signals.standard_signals, 'music' by default, through the SpectrumPipeline for each
+# sampling preset.  --compare prints
+# every case that got slower or allocates more, and exits with status 1 if any did.
+import argparse
+import gc
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy
+
+import host
+
+display_class_names = ('BasicDisplay', 'GraphDisplay', 'FadeDisplay', 'WaterfallDisplay')
+# Module each display class is in.  code.py only imports them when a board selects one of their modes.
+display_class_modules = {'BasicDisplay': 'basic_display', 'GraphDisplay': 'graph_display',
+                         'FadeDisplay': 'fade_display', 'WaterfallDisplay': 'waterfall_display'}
+
+# Changes smaller than these are treated as noise by --compare
+default_fps_tolerance = 0.10  # Fraction of the old frames per second
+default_p95_tolerance = 0.15  # Fraction of the old 95th percentile frame time
+default_alloc_tolerance = 256  # Bytes per frame
+
+# Synthetic signal the spectra are recorded from
+default_signal = 'music'
+
+
+def load_display_class(display_class_name: str):
+    '''Import a display class by name, after host.install()'''
+    return getattr(importlib.import_module(display_class_modules[display_class_name]), display_class_name)
+
+
+def build_spectra(settings, num_spectra: int, signal_name: str = default_signal,
+                  num_warmup_frames: int = 8) -> list[numpy.ndarray]:
+    '''
+    Record a synthetic signal through a fresh pipeline and keep the spectra it produces
+    :param settings: RecordingSettings to record and analyze with
+    :param signal_name: Key of synthetic_signals.standard_signals
+    '''
+    import recording
+    import synthetic_signals
+    from sound_rec import SampleCapture
+    from spectrum_pipeline import SpectrumPipeline
+
+    frequencies = recording.get_frequencies(settings)
+    max_freq_index = recording.get_frequency_index(frequencies, settings.frequency_cutoff)
+
+    signal = synthetic_signals.standard_signals(settings)[signal_name]
+    capture = SampleCapture(signal, settings.hop_size, sample_rate=settings.sample_rate)
+    pipeline = SpectrumPipeline(settings, max_freq_index)
+    capture.capture()
+    pipeline.calibrate(capture.latest_frame())
+
+    spectra = []
+    i_frame = 0
+    while len(spectra) < num_spectra:
+        capture.capture()
+        pipeline.push(capture.latest_frame())
+        if pipeline.is_ready:
+            spectrum = pipeline.process()
+            if i_frame >= num_warmup_frames:
+                spectra.append(numpy.array(spectrum))
+            i_frame += 1
+
+    return spectra
+
+
+def summarize_frame_times(frame_ns: list[int]) -> dict:
+    '''min, mean, median, 95th percentile and max frame time in microseconds'''
+    frame_us = numpy.array(frame_ns, dtype=numpy.float64) / 1000
+    return {'min': float(frame_us.min()), 'mean': float(frame_us.mean()), 'p50': float(numpy.percentile(frame_us, 50)),
+            'p95': float(numpy.percentile(frame_us, 95)), 'max': float(frame_us.max())}
+
+
+def measure_allocations(display_mode, spectra: list[numpy.ndarray], num_frames: int) -> dict:
+    '''
+    Draw frames with tracemalloc running, which is too slow to do while timing
+    :return: Mean and largest number of bytes a frame allocated, counting memory that was freed before it finished
+    '''
+    tracemalloc.start()
+    try:
+        frame_bytes = []
+        for i_frame in range(num_frames):
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            display_mode.show(spectra[i_frame % len(spectra)])
+            frame_bytes.append(tracemalloc.get_traced_memory()[1] - start_bytes)
+    finally:
+        tracemalloc.stop()
+
+    return {'mean_bytes': float(numpy.mean(frame_bytes)), 'max_bytes': int(max(frame_bytes))}
+
+
+def benchmark_case(code, display_class_name: str, display_settings, spectra: list[numpy.ndarray], num_frames: int,
+                   num_repeats: int, num_alloc_frames: int) -> dict:
+    '''Build one display mode on its own simulated strip, warm it up, then time it'''
+    from host.pixels import PixelStrip
+
+    pixels = PixelStrip(display_settings.num_neo_rows * display_settings.num_neo_cols, auto_write=False)
+    display_mode = load_display_class(display_class_name)(pixels, display_settings)
+
+    # The first frames prime the display ranges and build lazily compiled tables
+    for spectrum in spectra:
+        display_mode.show(spectrum)
+
+    # Time several repeats and rate the case by its fastest, like timeit, so other work on the machine only
+    # shows up in the frame time distribution.  Collections are left to happen between repeats.
+    frame_ns = []
+    best_repeat_ns = None
+    for i_repeat in range(num_repeats):
+        gc.collect()
+        gc.disable()
+        try:
+            repeat_start_ns = time.perf_counter_ns()
+            for i_frame in range(num_frames):
+                start_ns = time.perf_counter_ns()
+                display_mode.show(spectra[i_frame % len(spectra)])
+                frame_ns.append(time.perf_counter_ns() - start_ns)
+            repeat_ns = time.perf_counter_ns() - repeat_start_ns
+        finally:
+            gc.enable()
+
+        if best_repeat_ns is None or repeat_ns < best_repeat_ns:
+            best_repeat_ns = repeat_ns
+
+    return {'fps': num_frames * 1000000000 / max(best_repeat_ns, 1),
+            'frame_us': summarize_frame_times(frame_ns),
+            'allocations': measure_allocations(display_mode, spectra, num_alloc_frames),
+            'frames_sent': display_mode.framebuffer.frames_sent if display_mode.framebuffer is not None else None}
+
+
+def case_key(case: dict) -> str:
+    return f'{case["display_config"]} | {case["sampling"]} | {case["display"]}'
+
+
+def run_benchmarks(num_frames: int = 100, num_repeats: int = 5, num_spectra: int = 32, num_alloc_frames: int = 20,
+                   name_filter: str | None = None, signal_name: str = default_signal) -> dict:
+    '''
+    Time every combination of display config, sampling preset and display class
+    :param name_filter: Only run cases whose key contains this text
+    '''
+    from host.simulate import load_code
+
+    code = load_code()
+    cases = []
+    for sampling_name, settings in code.sampling_settings.items():
+        spectra = None
+        for config_name, display_settings in code.display_configs.items():
+            for display_class_name in display_class_names:
+                case = {'display_config': config_name, 'sampling': sampling_name, 'display': display_class_name}
+                if name_filter is not None and name_filter not in case_key(case):
+                    continue
+
+                if spectra is None:
+                    code.filterbank.set_bin_width(code.recording.get_frequencies(settings)[1])
+                    spectra = build_spectra(settings, num_spectra, signal_name)
+
+                try:
+                    # Configs with more columns than frequency ranges divide by zero in empty groups
+                    with warnings.catch_warnings(), numpy.errstate(all='ignore'):
+                        warnings.simplefilter('ignore')
+                        case.update(benchmark_case(code, display_class_name, display_settings, spectra, num_frames,
+                                                   num_repeats, num_alloc_frames))
+                except Exception as e:
+                    case['error'] = f'{type(e).__name__}: {e}'
+
+                cases.append(case)
+                print(format_case(case), flush=True)
+
+    return {'meta': {'python': platform.python_version(), 'numpy': numpy.__version__, 'machine': platform.machine(),
+                     'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'num_frames': num_frames, 'num_repeats': num_repeats, 'num_spectra': num_spectra,
+                     'signal': signal_name},
+            'cases': cases}
+
+
+def format_case(case: dict) -> str:
+    if 'error' in case:
+        return f'{case_key(case)}: {case["error"]}'
+
+    frame_us = case['frame_us']
+    return f'{case_key(case)}: {case["fps"]:8.1f} fps  mean {frame_us["mean"]:7.1f}us  ' \
+           f'p95 {frame_us["p95"]:7.1f}us  max {frame_us["max"]:7.1f}us  ' \
+           f'alloc {case["allocations"]["mean_bytes"]:7.0f}B/frame'
+
+
+def compare_results(old: dict, new: dict, fps_tolerance: float = default_fps_tolerance,
+                    p95_tolerance: float = default_p95_tolerance,
+                    alloc_tolerance: int = default_alloc_tolerance) -> list[str]:
+    '''
+    :return: A description of every regression from old to new.  Cases missing from either file are skipped.
+    '''
+    old_cases = {case_key(case): case for case in old['cases']}
+    regressions = []
+    for new_case in new['cases']:
+        key = case_key(new_case)
+        old_case = old_cases.get(key)
+        if old_case is None or 'error' in old_case:
+            continue
+
+        if 'error' in new_case:
+            regressions.append(f'{key}: now fails with {new_case["error"]}')
+            continue
+
+        if new_case['fps'] < old_case['fps'] * (1 - fps_tolerance):
+            regressions.append(f'{key}: fps {old_case["fps"]:0.1f} -> {new_case["fps"]:0.1f}')
+
+        old_p95 = old_case['frame_us']['p95']
+        new_p95 = new_case['frame_us']['p95']
+        if new_p95 > old_p95 * (1 + p95_tolerance):
+            regressions.append(f'{key}: p95 frame time {old_p95:0.1f}us -> {new_p95:0.1f}us')
+
+        old_bytes = old_case['allocations']['mean_bytes']
+        new_bytes = new_case['allocations']['mean_bytes']
+        if new_bytes > old_bytes + alloc_tolerance:
+            regressions.append(f'{key}: allocations {old_bytes:0.0f}B -> {new_bytes:0.0f}B per frame')
+
+    return regressions
+
+
+def print_comparison(old: dict, new: dict) -> None:
+    '''Print the fps change of every case both files contain'''
+    old_cases = {case_key(case): case for case in old['cases']}
+    for new_case in new['cases']:
+        old_case = old_cases.get(case_key(new_case))
+        if old_case is None or 'error' in old_case or 'error' in new_case:
+            continue
+
+        change = new_case['fps'] / old_case['fps'] - 1
+        print(f'{case_key(new_case)}: {old_case["fps"]:8.1f} -> {new_case["fps"]:8.1f} fps ({change:+6.1%})')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark every display mode, display config and sampling preset')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--frames', type=int, default=100, help='Frames to time in each repeat of a case')
+    parser.add_argument('--repeats', type=int, default=5, help='Times to repeat each case.  The fastest is kept.')
+    parser.add_argument('--filter', help='Only run cases whose "config | sampling | display" key contains this text')
+    parser.add_argument('--signal', default=default_signal,
+                        help='Name of the synthetic signal to record the spectra from.  See synthetic_signals.py')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files')
+    parser.add_argument('--fps-tolerance', type=float, default=default_fps_tolerance)
+    parser.add_argument('--p95-tolerance', type=float, default=default_p95_tolerance)
+    parser.add_argument('--alloc-tolerance', type=int, default=default_alloc_tolerance)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+
+        print_comparison(old, new)
+        regressions = compare_results(old, new, args.fps_tolerance, args.p95_tolerance, args.alloc_tolerance)
+        print(f'{len(regressions)} regressions')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1 if regressions else 0)
+
+    host.install()
+    results = run_benchmarks(args.frames, args.repeats, name_filter=args.filter, signal_name=args.signal)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f'Wrote {len(results["cases"])} cases to {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# Record what the LEDs should show for scripted input, then check the code draws the same frames.
+#
+#     python -m host.golden --check                      every frame must match the committed golden frames exactly
+#     python -m host.golden --check --tolerance 2        or within 2 steps of every color channel
+#     python -m host.golden --record                     when the expected frames change on purpose
+#
+# --record draws every frame with the reference renderers in host.reference, which set one pixel at a time, and
+# --check draws them with the displays' own array code.  The golden file is committed in host/golden_frames/, so
+# every commit is checked against the same frames rather than ones recorded from its own code.
+#
+# The input is a script of synthetic signals recorded through the SpectrumPipeline for a few sampling presets.  The
+# spectra are saved with the frames and replayed on --check, so changes to the pipeline do not show up as rendering
+# differences.  --end-to-end records the spectra again with the current pipeline instead.
+#
+# Every display class is drawn with every display config in code.py, and so is every display mode of each board
+# class, with its own colormap and smoothing.
+import argparse
+import json
+import os
+import sys
+import warnings
+
+import numpy
+
+import host
+from host.benchmark import display_class_names, load_display_class
+from host.reference import use_reference_renderer
+
+default_golden_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_frames', 'golden_frames.npz')
+
+# Sampling presets the frames are recorded with.  Decimated and full rate presets have different bin widths.
+golden_sampling_names = ('Mids', 'Low Frequency')
+
+# Signals from synthetic_signals.standard_signals and how many frames of each to record, in order
+golden_script = (('silence', 12), ('tone', 12), ('sweep', 24), ('drums', 24), ('silence to loud', 12), ('music', 24))
+
+
+def record_spectra(settings, script=golden_script, num_warmup_frames: int = 8) -> numpy.ndarray:
+    '''
+    Play each signal of the script into one pipeline, so the window carries over from one signal to the next
+    :return: num_frames x num_bins array of spectra
+    '''
+    import recording
+    import synthetic_signals
+    from spectrum_pipeline import SpectrumPipeline
+
+    frequencies = recording.get_frequencies(settings)
+    max_freq_index = recording.get_frequency_index(frequencies, settings.frequency_cutoff)
+    pipeline = SpectrumPipeline(settings, max_freq_index)
+    signals = synthetic_signals.standard_signals(settings)
+
+    # Fill the window with the first signal before recording
+    first_signal = signals[script[0][0]]
+    pipeline.calibrate(first_signal.read())
+    while not pipeline.is_ready:
+        pipeline.push(first_signal.read())
+    for i in range(num_warmup_frames):
+        pipeline.push(first_signal.read())
+
+    spectra = []
+    for signal_name, num_frames in script:
+        signal = signals[signal_name]
+        for i in range(num_frames):
+            pipeline.push(signal.read())
+            spectra.append(numpy.array(pipeline.process()))
+
+    return numpy.array(spectra)
+
+
+def draw_frames(display_mode, spectra: numpy.ndarray) -> numpy.ndarray:
+    '''
+    :return: num_frames x num_pixels x 3 uint8 array of what the pixels showed after each spectrum was drawn
+    '''
+    pixels = display_mode.pixels
+    frames = numpy.zeros((len(spectra), len(pixels), 3), dtype=numpy.uint8)
+    # Configs with more columns than frequency ranges divide by zero in empty groups
+    with warnings.catch_warnings(), numpy.errstate(all='ignore'):
+        warnings.simplefilter('ignore')
+        for i_frame, spectrum in enumerate(spectra):
+            display_mode.show(spectrum)
+            frames[i_frame] = pixels.shown
+
+    return frames
+
+
+def build_cases(code):
+    '''
+    :return: Yields the key of each case and a function that builds its display mode
+    '''
+    from host.pixels import PixelStrip
+
+    for config_name, display_settings in code.display_configs.items():
+        for display_class_name in display_class_names:
+            def build(display_settings=display_settings, display_class_name=display_class_name):
+                pixels = PixelStrip(display_settings.num_neo_rows * display_settings.num_neo_cols, auto_write=False)
+                return load_display_class(display_class_name)(pixels, display_settings)
+
+            yield f'{config_name} | {display_class_name}', build
+
+    for board_name in ('NeoPixelFeatherWing', 'NeoPixel32x8Matrix', 'DotStarFeatherWing'):
+        num_modes = len(getattr(code, board_name)().display_modes)
+        for i_mode in range(num_modes):
+            # Build the whole board each time so every mode starts from a fresh strip
+            def build(board_name=board_name, i_mode=i_mode):
+                return getattr(code, board_name)().display_modes[i_mode]
+
+            yield f'{board_name} | {i_mode}', build
+
+
+def record(path: str = default_golden_path) -> dict:
+    '''
+    Draw every case with the reference renderers and save the frames, along with the spectra they were drawn from
+    :return: Case key -> frames
+    '''
+    from host.simulate import load_code
+
+    code = load_code()
+    arrays = {}
+    index = []
+    for sampling_name in golden_sampling_names:
+        settings = code.sampling_settings[sampling_name]
+        bin_width = float(code.recording.get_frequencies(settings)[1])
+        spectra = record_spectra(settings)
+        arrays[f'spectra_{len(index)}'] = spectra
+        index.append({'sampling': sampling_name, 'bin_width': bin_width, 'spectra': f'spectra_{len(index)}',
+                      'cases': {}})
+
+        code.filterbank.set_bin_width(bin_width)
+        for case_key, build in build_cases(code):
+            array_name = f'frames_{len(arrays)}'
+            display_mode = build()
+            use_reference_renderer(display_mode)
+            arrays[array_name] = draw_frames(display_mode, spectra)
+            index[-1]['cases'][case_key] = array_name
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    numpy.savez_compressed(path, index=numpy.array(json.dumps(index)), **arrays)
+    return arrays
+
+
+def compare_frames(expected: numpy.ndarray, actual: numpy.ndarray, tolerance: int = 0) -> str | None:
+    '''
+    :param tolerance: Largest difference allowed in any color channel of any pixel
+    :return: None if the frames match, otherwise a description of the first difference
+    '''
+    if expected.shape != actual.shape:
+        return f'shape {expected.shape} != {actual.shape}'
+
+    difference = numpy.abs(expected.astype(numpy.int16) - actual.astype(numpy.int16))
+    frame_differences = difference.reshape(len(difference), -1).max(axis=1)
+    bad_frames = numpy.nonzero(frame_differences > tolerance)[0]
+    if len(bad_frames) == 0:
+        return None
+
+    i_frame = int(bad_frames[0])
+    i_pixel = int(numpy.argmax(difference[i_frame].max(axis=1)))
+    expected_color = tuple(int(c) for c in expected[i_frame, i_pixel])
+    actual_color = tuple(int(c) for c in actual[i_frame, i_pixel])
+    return f'{len(bad_frames)}/{len(expected)} frames differ by up to {int(frame_differences.max())}, first at ' \
+           f'frame {i_frame} pixel {i_pixel}: {expected_color} != {actual_color}'
+
+
+def check(path: str = default_golden_path, tolerance: int = 0, end_to_end: bool = False) -> list[str]:
+    '''
+    Draw every recorded case with the current code and compare it with the recorded frames
+    :param end_to_end: Record the spectra with the current pipeline instead of replaying the saved ones
+    :return: A description of every case that does not match.  Empty if they all do.
+    '''
+    from host.simulate import load_code
+
+    code = load_code()
+    with numpy.load(path) as golden:
+        index = json.loads(str(golden['index']))
+        golden_arrays = {name: golden[name] for name in golden.files if name != 'index'}
+
+    failures = []
+    num_checked = 0
+    for preset in index:
+        settings = code.sampling_settings[preset['sampling']]
+        spectra = record_spectra(settings) if end_to_end else golden_arrays[preset['spectra']]
+        code.filterbank.set_bin_width(preset['bin_width'])
+
+        builders = dict(build_cases(code))
+        for case_key, array_name in preset['cases'].items():
+            key = f'{case_key} | {preset["sampling"]}'
+            if case_key not in builders:
+                failures.append(f'{key}: no longer exists')
+                continue
+
+            difference = compare_frames(golden_arrays[array_name], draw_frames(builders[case_key](), spectra),
+                                        tolerance)
+            num_checked += 1
+            if difference is not None:
+                failures.append(f'{key}: {difference}')
+
+    print(f'Checked {num_checked} cases against {path}, tolerance {tolerance}: {len(failures)} differ')
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Record or check the frames every display mode draws')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--record', action='store_true', help='Save the frames the reference renderers draw')
+    action.add_argument('--check', action='store_true', help='Compare the current code with the saved frames')
+    parser.add_argument('--path', default=default_golden_path, help='Golden frame file')
+    parser.add_argument('--tolerance', type=int, default=0,
+                        help='Largest difference allowed in a color channel.  0 requires identical frames.')
+    parser.add_argument('--end-to-end', action='store_true',
+                        help='Record the spectra with the current pipeline rather than replaying the saved spectra')
+    args = parser.parse_args()
+
+    host.install()
+    if args.record:
+        arrays = record(args.path)
+        print(f'Recorded {sum(name.startswith("frames_") for name in arrays)} cases to {args.path}')
+        return
+
+    failures = check(args.path, args.tolerance, args.end_to_end)
+    for failure in failures:
+        print(f'  {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import types
+
+
+class Pin:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'board.{self.name}'
+
+
+class Direction:
+    INPUT = 0
+    OUTPUT = 1
+
+
+class Pull:
+    UP = 0
+    DOWN = 1
+
+
+class DigitalInOut:
+    '''
+    A pin that reads as not pressed unless the simulator sets value.  Buttons in code.py are pulled down, so False is
+    released.
+    '''
+
+    def __init__(self, pin: Pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.value = False
+
+    def switch_to_input(self, pull=None) -> None:
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def switch_to_output(self, value: bool = False, drive_mode=None) -> None:
+        self.direction = Direction.OUTPUT
+        self.value = value
+
+    def deinit(self) -> None:
+        pass
+
+
+def build_board() -> types.ModuleType:
+    '''A board module whose pin names are created on first use, so any Feather pin name works'''
+    board = types.ModuleType('board')
+    pins = {}
+
+    def get_pin(name: str) -> Pin:
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name not in pins:
+            pins[name] = Pin(name)
+        return pins[name]
+
+    board.__getattr__ = get_pin
+    return board
+
+
+def build_digitalio() -> types.ModuleType:
+    digitalio = types.ModuleType('digitalio')
+    digitalio.DigitalInOut = DigitalInOut
+    digitalio.Direction = Direction
+    digitalio.Pull = Pull
+    return digitalio
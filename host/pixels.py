@@ -0,0 +1,107 @@
+import numpy
+
+
+class PixelStrip:
+    '''
+    Stands in for neopixel.NeoPixel and adafruit_dotstar.DotStar.  The colors live in a num_pixels x 3 uint8 numpy
+    array, so a simulator can read whole frames without decoding pixel by pixel.  Brightness is stored but not applied,
+    the frame holds the colors the display code asked for.
+
+    Like adafruit_pixelbuf, a slice takes either one color per pixel or a flat sequence of bpp values per pixel, read
+    as (r, g, b, w) colors, and raises ValueError for any other length.  The w byte is not stored.
+    '''
+
+    _colors: numpy.ndarray  # num_pixels x 3 uint8 RGB, in pixel index order
+    _shown: numpy.ndarray  # Copy of _colors taken by the last show()
+
+    @property
+    def colors(self) -> numpy.ndarray:
+        '''Colors written so far, including any not yet shown'''
+        return self._colors
+
+    @property
+    def shown(self) -> numpy.ndarray:
+        '''Colors as of the last call to show, which is what a real strip would display'''
+        return self._shown
+
+    @property
+    def num_shows(self) -> int:
+        return self._num_shows
+
+    def __init__(self, n: int, brightness: float = 1.0, auto_write: bool = True, bpp: int = 3,
+                 byteorder: str = 'GRB'):
+        self.n = n
+        self.bpp = bpp
+        self.byteorder = byteorder
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self._colors = numpy.zeros((n, 3), dtype=numpy.uint8)
+        self._shown = numpy.zeros((n, 3), dtype=numpy.uint8)
+        self._num_shows = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    @staticmethod
+    def _to_rgb(color) -> tuple[int, int, int]:
+        '''Accept a packed 0xRRGGBB integer or an (r, g, b) tuple, like the pixel libraries do'''
+        if isinstance(color, (int, numpy.integer)):
+            return (int(color) >> 16) & 0xFF, (int(color) >> 8) & 0xFF, int(color) & 0xFF
+
+        return int(color[0]), int(color[1]), int(color[2])
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            selected = self._colors[index]
+            if len(value) == len(selected) * self.bpp:
+                if isinstance(value, (bytes, bytearray, memoryview)):
+                    flat = numpy.frombuffer(value, dtype=numpy.uint8)
+                else:
+                    flat = numpy.array(value, dtype=numpy.uint8)
+                flat = flat.reshape(len(selected), self.bpp)
+                selected[:] = flat[:, 0:3]
+            elif len(value) == len(selected):
+                selected[:] = [self._to_rgb(color) for color in value]
+            else:
+                raise ValueError(f'Unmatched number of items on RHS (expected {len(selected)} or '
+                                 f'{len(selected) * self.bpp}, got {len(value)})')
+        else:
+            self._colors[index] = self._to_rgb(value)
+
+        if self.auto_write:
+            self.show()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [tuple(int(c) for c in color) for color in self._colors[index]]
+
+        return tuple(int(c) for c in self._colors[index])
+
+    def fill(self, color) -> None:
+        self._colors[:] = self._to_rgb(color)
+        if self.auto_write:
+            self.show()
+
+    def show(self) -> None:
+        self._shown[:] = self._colors
+        self._num_shows += 1
+
+    def deinit(self) -> None:
+        pass
+
+
+class NeoPixel(PixelStrip):
+    def __init__(self, pin, n: int, *, bpp: int = 3, brightness: float = 1.0, auto_write: bool = True,
+                 pixel_order=None):
+        super().__init__(n, brightness=brightness, auto_write=auto_write, bpp=bpp,
+                         byteorder=pixel_order or ('GRBW' if bpp == 4 else 'GRB'))
+        self.pin = pin
+
+
+class DotStar(PixelStrip):
+    def __init__(self, clock, data, n: int, *, brightness: float = 1.0, auto_write: bool = True, pixel_order=None,
+                 baudrate: int = 4000000):
+        # adafruit_dotstar's byte orders start with P, the brightness byte each pixel has
+        super().__init__(n, brightness=brightness, auto_write=auto_write, bpp=4, byteorder=pixel_order or 'PBGR')
+        self.clock = clock
+        self.data = data
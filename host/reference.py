@@ -0,0 +1,77 @@
+# Reference renderers that draw each pixel on its own, for host.golden to record frames with.
+#
+# The displays draw whole frames with array operations.  These draw the same values one pixel at a time, the way the
+# displays did before they were vectorized, so the golden frames do not come from the code they check.  Only the
+# drawing is replaced.  Aggregating, normalizing and smoothing still run in the display, and colors still come from
+# the display's colormap tables.
+import math
+
+from host.benchmark import load_display_class
+
+
+class ReferenceBarGraph:
+    '''
+    Stands in for BarGraphRasterizer.  Each column is lit to its height one pixel at a time, the body of the bar in the
+    value's full color and the top pixel dimmed.
+    '''
+
+    def __init__(self, pixels, pixel_map: tuple[tuple[int]], cmap):
+        self._pixels = pixels
+        self._pixel_map = pixel_map
+        self._colormap = cmap
+
+    def draw(self, values) -> None:
+        for i_col, col_map in enumerate(self._pixel_map):
+            value = float(values[i_col])
+            num_leds = min(int(math.ceil(len(col_map) * value)), len(col_map))
+            level = self._colormap.level(value)
+            body = tuple(int(c) for c in self._colormap.lut[level])
+            top = tuple(int(c) for c in self._colormap.dimmed_lut[level])
+            for i_row, i_pixel in enumerate(col_map):
+                if i_row < num_leds - 1:
+                    self._pixels[i_pixel] = body
+                elif i_row == num_leds - 1:
+                    self._pixels[i_pixel] = top
+                else:
+                    self._pixels[i_pixel] = (0, 0, 0)
+
+        self._pixels.show()
+
+
+class ReferenceWaterfall:
+    '''
+    Stands in for WaterfallDisplay._draw_row.  Keeps the colors of the rows shown, newest first, and sets every pixel
+    from them each frame.
+    '''
+
+    def __init__(self, display):
+        self._display = display
+        self._rows = []
+
+    def draw_row(self, norm_values) -> None:
+        display = self._display
+        packed_colors = display._colormap.packed_dimmed_colors
+        self._rows.insert(0, [packed_colors[display._colormap.level(float(value))] for value in norm_values])
+        del self._rows[display.num_rows:]
+
+        for i_row in range(display.num_rows):
+            for i_col in range(display.num_cols):
+                color = self._rows[i_row][i_col] if i_row < len(self._rows) else 0
+                display.pixels[display.pixel_indexer(i_row, i_col, display.settings)] = color
+
+        display.pixels.show()
+
+
+def use_reference_renderer(display_mode) -> None:
+    '''
+    Make a display mode draw one pixel at a time.  BasicDisplay already can, it is what whole_frame=False builds.
+    '''
+    if isinstance(display_mode, load_display_class('BasicDisplay')):
+        display_mode._framebuffer = None
+    elif isinstance(display_mode, (load_display_class('GraphDisplay'), load_display_class('FadeDisplay'))):
+        display_mode._rasterizer = ReferenceBarGraph(display_mode.pixels, display_mode._pixel_map,
+                                                     display_mode._colormap)
+    elif isinstance(display_mode, load_display_class('WaterfallDisplay')):
+        display_mode._draw_row = ReferenceWaterfall(display_mode).draw_row
+    else:
+        raise ValueError(f'No reference renderer for {type(display_mode).__name__}')
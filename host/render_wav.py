@@ -0,0 +1,295 @@
+# Render a WAV file into the frames a display mode would show, without a board and faster than real time.
+#
+#     python -m host.render_wav song.wav --board DotStarFeatherWing --mode 0 --output song
+#     python -m host.render_wav song.wav --config "8x32 Graph" --display FadeDisplay --settings Highs
+#
+# Writes song.npz, holding the frames, the spectra and the time of each frame, and song.png, an animated PNG of the
+# LEDs laid out in rows and columns.
+#
+# Every spectrum is calculated up front.  The recording is centered, and decimated when the settings call for it, in
+# one pass.  A strided view then presents every analysis window as a row of a 2-D array without copying, so the FFT
+# of a whole batch of windows is one call.  The spectra match SpectrumPipeline's floating point path.  Only drawing
+# the display is done frame by frame, because display modes keep state between frames.
+import argparse
+import math
+import os
+import struct
+import time
+import zlib
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+import host
+from host import audio
+
+# Windows transformed in each batch, to bound the memory the batched FFT uses
+default_batch_size = 2048
+
+# Highest frame rate of the animated image
+max_image_fps = 30
+
+
+def wav_to_adc(path: str, sample_rate: int, level: float = 0.5) -> numpy.ndarray:
+    '''
+    Read a WAV file as the ADC would record it
+    :param level: Fraction of the ADC's range from the middle to either end a full scale sample uses
+    :return: uint16 ADC readings at sample_rate
+    '''
+    samples, file_sample_rate = audio.read_wav(path)
+    if file_sample_rate != sample_rate:
+        num_samples = int(len(samples) * sample_rate / file_sample_rate)
+        samples = numpy.interp(numpy.arange(num_samples) / sample_rate,
+                               numpy.arange(len(samples)) / file_sample_rate, samples)
+
+    adc = samples * (level * (audio.adc_mid_scale - 1)) + audio.adc_mid_scale
+    return numpy.clip(adc, 0, (1 << 16) - 1).astype(numpy.uint16)
+
+
+def choose_frames(num_windows: int, hop_s: float, fps: float | None) -> numpy.ndarray:
+    '''
+    Pick the windows the display draws.  Like the scheduler, each frame draws the newest spectrum at its frame time.
+    :param hop_s: Time between windows
+    :param fps: Frames per second.  None draws every window.
+    :return: Index of the window drawn by each frame
+    '''
+    if fps is None:
+        return numpy.arange(num_windows)
+
+    frame_times = numpy.arange(0, num_windows * hop_s, 1.0 / fps)
+    # Window k is complete hop_s * (k + 1) seconds after its first hop started filling the analysis window
+    windows = numpy.floor(frame_times / hop_s).astype(numpy.int64)
+    return windows[windows < num_windows]
+
+
+def calculate_spectra(adc: numpy.ndarray, settings, num_bins: int, fps: float | None = None,
+                      batch_size: int = default_batch_size) -> tuple[numpy.ndarray, numpy.ndarray]:
+    '''
+    Calculate the spectrum of every window the display draws, as SpectrumPipeline would
+    :param adc: uint16 ADC readings
+    :param num_bins: Bins calculated by the pipeline, including bin 0
+    :return: num_frames x (num_bins - 1) normalized spectra, and the time in seconds each frame is drawn
+    '''
+    import ema
+    import recording
+    from spectrum_pipeline import build_peak_levels
+
+    hop_size = settings.hop_size
+    adc = adc[:len(adc) - len(adc) % hop_size]
+    if len(adc) < hop_size:
+        raise ValueError('The recording is shorter than one hop')
+
+    if settings.decimation > 1:
+        # The Decimator keeps its filter state between calls, so filtering the whole recording at once is the same
+        # as filtering it a hop at a time
+        samples = numpy.asarray(recording.Decimator(settings).process(adc), dtype=numpy.float64)
+    else:
+        samples = adc.astype(numpy.float64)
+
+    chunk_size = hop_size // settings.decimation
+    window_size = settings.analysis_size
+    chunks_per_window = (window_size + chunk_size - 1) // chunk_size
+    num_chunks = len(samples) // chunk_size
+    num_windows = num_chunks - chunks_per_window + 1
+    if num_windows < 1:
+        raise ValueError('The recording is shorter than one analysis window')
+
+    hop_s = hop_size / settings.sample_rate
+    i_windows = choose_frames(num_windows, hop_s, fps)
+    hanning = numpy.asarray(recording.calculate_hanning_filter(window_size), dtype=numpy.float64)
+
+    # Each chunk is centered with the DC offset the pipeline follows.  The first chunk's average starts it, and each
+    # frame drawn adds the window's Hanning weighted average, which SpectrumPipeline.process reads from bin 0.
+    samples = samples[:num_chunks * chunk_size]
+    chunks = samples.reshape(num_chunks, chunk_size)
+    # The number of frames drawn when each chunk completes a window, which can be more than one without fps
+    frames_at_chunk = numpy.bincount(i_windows + chunks_per_window - 1, minlength=num_chunks)
+    dc_weight = float(hanning.sum())
+    dc_offset = ema.EMA(num_samples=256, smooth=1)
+    dc_offset.reset(float(numpy.mean(chunks[0])))
+    for i_chunk, chunk in enumerate(chunks):
+        chunk -= dc_offset.ema_value
+        end = (i_chunk + 1) * chunk_size
+        for i in range(frames_at_chunk[i_chunk]):
+            dc_offset.add(dc_offset.ema_value + float(numpy.dot(samples[end - window_size:end], hanning)) / dc_weight)
+
+    # The first window is complete once chunks_per_window chunks are pushed.  Each window after it is one chunk later.
+    first_start = chunks_per_window * chunk_size - window_size
+    windows = sliding_window_view(samples[first_start:], window_size)[::chunk_size][:num_windows]
+
+    # Gain follows the largest centered sample magnitude pushed since the previous frame, as in SpectrumPipeline.push
+    chunk_peaks = numpy.abs(samples[:num_chunks * chunk_size]).reshape(num_chunks, chunk_size).max(axis=1)
+    peak_ends = i_windows + chunks_per_window
+    peak_starts = numpy.concatenate(([0], peak_ends[:-1]))
+    frame_peaks = numpy.maximum.reduceat(chunk_peaks[:peak_ends[-1]], peak_starts)
+    # A frame drawing the same window as the frame before it has no new samples
+    frame_peaks[peak_starts >= peak_ends] = 0
+    peak_levels = build_peak_levels()
+    gains = numpy.ones(len(i_windows))
+    for i_frame, peak in enumerate(frame_peaks):
+        if peak > 0:
+            peak_levels.add(frame_peaks[i_frame:i_frame + 1])
+        if not peak_levels.is_empty:
+            gains[i_frame] = peak_levels.levels[0][0]  # The 98th percentile
+
+    spectra = numpy.zeros((len(i_windows), num_bins - 1))
+    for i_batch in range(0, len(i_windows), batch_size):
+        batch = i_windows[i_batch:i_batch + batch_size]
+        # Indexing the strided view copies only the windows that are drawn
+        magnitudes = numpy.abs(numpy.fft.rfft(windows[batch] * hanning, axis=1)[:, 1:num_bins])
+        spectra[i_batch:i_batch + len(batch)] = magnitudes / gains[i_batch:i_batch + len(batch), numpy.newaxis]
+
+    return spectra, (i_windows + chunks_per_window) * hop_s
+
+
+def draw(display_mode, spectra: numpy.ndarray) -> numpy.ndarray:
+    '''
+    :return: num_frames x num_pixels x 3 uint8 array of what the pixels showed after each frame
+    '''
+    pixels = display_mode.pixels
+    frames = numpy.zeros((len(spectra), len(pixels), 3), dtype=numpy.uint8)
+    for i_frame, spectrum in enumerate(spectra):
+        display_mode.show(spectrum)
+        frames[i_frame] = pixels.shown
+    return frames
+
+
+def layout_frames(frames: numpy.ndarray, settings, scale: int = 8, gap: int = 1):
+    '''
+    Arrange each frame's pixels in the display's rows and columns, row 0 at the bottom, each LED a scale x scale
+    square.  Images are made one at a time, since a long recording has too many frames to hold as images.
+    :return: Yields a height x width x 3 uint8 image for each frame
+    '''
+    num_rows = settings.num_rows
+    num_cols = settings.num_cols
+    pixel_grid = numpy.array([[settings.indexer(num_rows - 1 - i_row, i_col, settings) for i_col in range(num_cols)]
+                              for i_row in range(num_rows)])
+
+    # Each image pixel reads the LED it belongs to, or a dark line between LEDs so they read as separate lights
+    rows = numpy.arange(num_rows * scale)
+    cols = numpy.arange(num_cols * scale)
+    image_pixels = pixel_grid[rows[:, numpy.newaxis] // scale, cols[numpy.newaxis, :] // scale]
+    dark = (rows[:, numpy.newaxis] % scale >= scale - gap) | (cols[numpy.newaxis, :] % scale >= scale - gap)
+    for frame in frames:
+        image = frame[image_pixels]
+        image[dark] = 0
+        yield image
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def write_apng(path: str, images, num_frames: int, fps: float) -> None:
+    '''
+    Write an animated PNG with the standard library.  Browsers and most image viewers play them.
+    :param images: Iterable of num_frames height x width x 3 uint8 images, all the same size
+    '''
+    delay_ms = max(1, int(round(1000 / fps)))
+    chunks = [_png_chunk(b'acTL', struct.pack('>II', num_frames, 0))]
+
+    sequence = 0
+    for i_frame, image in enumerate(images):
+        height, width = image.shape[:2]
+        if i_frame == 0:
+            chunks.insert(0, _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        chunks.append(_png_chunk(b'fcTL', struct.pack('>IIIIIHHBB', sequence, width, height, 0, 0, delay_ms, 1000,
+                                                         0, 0)))
+        sequence += 1
+        # Each scanline starts with filter type 0
+        raw = numpy.concatenate((numpy.zeros((height, 1), dtype=numpy.uint8), image.reshape(height, width * 3)),
+                                axis=1)
+        data = zlib.compress(raw.tobytes(), 1)
+        if i_frame == 0:
+            chunks.append(_png_chunk(b'IDAT', data))
+        else:
+            chunks.append(_png_chunk(b'fdAT', struct.pack('>I', sequence) + data))
+            sequence += 1
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(b''.join(chunks))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def build_display_mode(code, board_name: str | None, i_mode: int, config_name: str | None,
+                       display_class_name: str | None):
+    '''Either a display mode of a board class, or a display class drawn with a display config'''
+    from host.benchmark import load_display_class
+    from host.pixels import PixelStrip
+
+    if config_name is not None:
+        display_settings = code.display_configs[config_name]
+        pixels = PixelStrip(display_settings.num_neo_rows * display_settings.num_neo_cols, auto_write=False)
+        return load_display_class(display_class_name or 'GraphDisplay')(pixels, display_settings)
+
+    return getattr(code, board_name or 'DotStarFeatherWing')().display_modes[i_mode]
+
+
+def render(wav_path: str, output: str, display_mode, settings, fps: float | None, level: float = 0.5,
+           scale: int = 8) -> dict:
+    '''
+    Render a WAV file with a display mode and write output.npz and output.png
+    :return: The arrays written to output.npz
+    '''
+    import filterbank
+    import recording
+
+    start_ns = time.monotonic_ns()
+    frequencies = recording.get_frequencies(settings)
+    num_bins = recording.get_frequency_index(frequencies, settings.frequency_cutoff)
+    filterbank.set_bin_width(frequencies[1])
+
+    adc = wav_to_adc(wav_path, settings.sample_rate, level)
+    spectra, frame_times = calculate_spectra(adc, settings, num_bins, fps)
+    spectra_ns = time.monotonic_ns()
+
+    with numpy.errstate(all='ignore'):
+        frames = draw(display_mode, spectra)
+    draw_ns = time.monotonic_ns()
+
+    arrays = {'frames': frames, 'spectra': spectra.astype(numpy.float32), 'frame_times': frame_times}
+    numpy.savez_compressed(output + '.npz', **arrays)
+
+    # Viewers do not play animations much faster than 30fps, so faster renders keep every few frames in the image
+    playback_fps = fps if fps is not None else settings.sample_rate / settings.hop_size
+    step = max(1, int(math.ceil(playback_fps / max_image_fps)))
+    image_frames = frames[::step]
+    write_apng(output + '.png', layout_frames(image_frames, display_mode.settings, scale), len(image_frames),
+               playback_fps / step)
+    end_ns = time.monotonic_ns()
+
+    audio_s = len(adc) / settings.sample_rate
+    print(f'{audio_s:0.1f}s of audio, {len(frames)} frames: spectra {(spectra_ns - start_ns) / 1e9:0.2f}s '
+          f'draw {(draw_ns - spectra_ns) / 1e9:0.2f}s write {(end_ns - draw_ns) / 1e9:0.2f}s')
+    return arrays
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Render a WAV file into LED frames')
+    parser.add_argument('wav', help='WAV file to render')
+    parser.add_argument('--output', help='Path of the output files, without extension.  Defaults to the WAV\'s path.')
+    parser.add_argument('--board', help='Board class in code.py.  Defaults to DotStarFeatherWing.')
+    parser.add_argument('--mode', type=int, default=0, help='Index of the board\'s display mode')
+    parser.add_argument('--config', help='Key of display_configs in code.py, instead of a board\'s display mode')
+    parser.add_argument('--display', help='Display class used with --config.  Defaults to GraphDisplay.')
+    parser.add_argument('--settings', help='Key of sampling_settings in code.py.  Defaults to code.py\'s choice.')
+    parser.add_argument('--fps', type=float, help='Frames per second.  Defaults to code.py\'s TARGET_FPS.')
+    parser.add_argument('--every-window', action='store_true', help='Draw a frame for every hop instead')
+    parser.add_argument('--level', type=float, default=0.5, help='Fraction of the ADC range a full scale sample uses')
+    parser.add_argument('--scale', type=int, default=8, help='Size of each LED in the animated PNG')
+    args = parser.parse_args()
+
+    from host.simulate import load_code
+
+    host.install()
+    code = load_code(args.settings)
+    display_mode = build_display_mode(code, args.board, args.mode, args.config, args.display)
+    fps = None if args.every_window else (args.fps or code.TARGET_FPS)
+    output = args.output or os.path.splitext(args.wav)[0]
+    render(args.wav, output, display_mode, code.sample_settings, fps, args.level, args.scale)
+    print(f'Wrote {output}.npz and {output}.png')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Run code.py's board classes on the host, faster than real time.
+#
+#     python -m host.simulate                       every board, every display mode, the default tone sweep
+#     python -m host.simulate --wav song.wav --board DotStarFeatherWing --frames 500
+#     python -m host.simulate --run 10              run code.py's own Run() loop for 10 seconds
+import argparse
+import asyncio
+import importlib.util
+import os
+import time
+
+import host
+
+board_class_names = ('NeoPixelFeatherWing', 'NeoPixel32x8Matrix', 'DotStarFeatherWing')
+
+
+def load_code(settings_name: str | None = None):
+    '''
+    Import src/code.py as a module.  It is loaded under another name because the standard library already has a
+    module called code.  code.py only starts its main loop when run as __main__, so importing it just builds the
+    displays.
+    :param settings_name: Optional key of code.sampling_settings to use instead of the default
+    '''
+    host.install()
+    spec = importlib.util.spec_from_file_location('circuitpy_code', os.path.join(host.src_dir, 'code.py'))
+    code = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(code)
+    if settings_name is not None:
+        code.sample_settings = code.sampling_settings[settings_name]
+
+    return code
+
+
+def simulate_display_mode(code, display_mode, num_frames: int) -> tuple[float, float]:
+    '''
+    Feed num_frames hops of audio through the pipeline and draw each spectrum with display_mode
+    :return: Frames drawn per second, and how many times faster than real time the frames were drawn
+    '''
+    import analogbufio
+    import recording
+    from sound_rec import SampleCapture
+    from spectrum_pipeline import SpectrumPipeline
+
+    settings = code.sample_settings
+    frequencies = recording.get_frequencies(settings)
+    max_freq_index = recording.get_frequency_index(frequencies, settings.frequency_cutoff)
+    code.filterbank.set_bin_width(frequencies[1])
+
+    capture = SampleCapture(analogbufio.BufferedIn(code.MIC_PIN, sample_rate=settings.sample_rate),
+                            settings.hop_size, sample_rate=settings.sample_rate)
+    pipeline = SpectrumPipeline(settings, max_freq_index)
+
+    # Like code.py, start without calibrating and let the pipeline follow the DC offset
+    while not pipeline.is_ready:
+        capture.capture()
+        pipeline.push(capture.latest_frame())
+
+    start_ns = time.monotonic_ns()
+    for i in range(num_frames):
+        capture.capture()
+        pipeline.push(capture.latest_frame())
+        display_mode.show(pipeline.process())
+    elapsed_s = max(time.monotonic_ns() - start_ns, 1) / 1000000000
+
+    audio_s = num_frames * settings.hop_size / settings.sample_rate
+    return num_frames / elapsed_s, audio_s / elapsed_s
+
+
+def simulate_boards(code, board_names=board_class_names, num_frames: int = 200) -> None:
+    '''Print the frame rate of every display mode of each board class'''
+    for board_name in board_names:
+        board_display = getattr(code, board_name)()
+        print(f'{board_name}:')
+        for i_mode, display_mode in enumerate(board_display.display_modes):
+            pixels = display_mode.pixels
+            num_shows = pixels.num_shows
+            fps, speed = simulate_display_mode(code, display_mode, num_frames)
+            print(f'  {i_mode}: {type(display_mode).__name__:<16} {fps:8.1f} fps {speed:6.1f}x real time  '
+                  f'shows: {pixels.num_shows - num_shows} lit: {int((pixels.shown.max(axis=1) > 0).sum())}/{len(pixels)}')
+
+
+def run_code(code, seconds: float) -> None:
+    '''Run code.py's own main loop, with its scheduler and buttons, for a while'''
+    try:
+        asyncio.run(asyncio.wait_for(code.Run(), seconds))
+    except asyncio.TimeoutError:
+        pass
+
+    print(f'{type(code.display_mode).__name__}: {code.display_mode.framebuffer}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run the CircuitPython display code on this computer')
+    parser.add_argument('--wav', help='WAV file to play into the microphone.  Defaults to a tone sweep.')
+    parser.add_argument('--board', action='append', choices=board_class_names,
+                        help='Board class to simulate, may be repeated.  Defaults to all of them.')
+    parser.add_argument('--frames', type=int, default=200, help='Frames to draw with each display mode')
+    parser.add_argument('--settings', help='Key of sampling_settings in code.py to record with')
+    parser.add_argument('--run', type=float, metavar='SECONDS', help='Run code.py\'s Run() loop instead')
+    args = parser.parse_args()
+
+    host.install()
+    from host import audio
+    if args.wav is not None:
+        audio.set_source(audio.WavSource(args.wav))
+
+    code = load_code(args.settings)
+    if args.run is not None:
+        run_code(code, args.run)
+    else:
+        simulate_boards(code, args.board or board_class_names, args.frames)
+
+
+if __name__ == '__main__':
+    main()
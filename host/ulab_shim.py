@@ -0,0 +1,135 @@
+import array
+import sys
+import types
+import numpy
+
+try:
+    import scipy.signal as scipy_signal
+except ImportError:
+    scipy_signal = None
+
+
+class _NdArrayType(type):
+    '''
+    Stands in for ulab.numpy.ndarray.  ulab lets code build an array with ndarray(iterable), test isinstance against
+    it and subscript it in annotations, such as ndarray[float].  numpy.ndarray only allows the isinstance test.
+    '''
+
+    def __instancecheck__(cls, value):
+        return isinstance(value, numpy.ndarray)
+
+    def __call__(cls, *args, **kwargs):
+        return numpy.array(*args, **kwargs)
+
+    def __getitem__(cls, item):
+        return cls
+
+
+class ndarray(metaclass=_NdArrayType):
+    pass
+
+
+class _ArrayFunction:
+    '''numpy.array, but also subscriptable so annotations such as np.array[float] evaluate'''
+
+    def __call__(self, *args, **kwargs):
+        return numpy.array(*args, **kwargs)
+
+    def __getitem__(self, item):
+        return ndarray
+
+
+def _fft(real, imag=None):
+    '''ulab returns the real and imaginary parts of the FFT as separate arrays'''
+    values = numpy.asarray(real, dtype=numpy.float64)
+    if imag is not None:
+        values = values + 1j * numpy.asarray(imag, dtype=numpy.float64)
+
+    result = numpy.fft.fft(values)
+    return result.real.copy(), result.imag.copy()
+
+
+def _ifft(real, imag=None):
+    values = numpy.asarray(real, dtype=numpy.float64)
+    if imag is not None:
+        values = values + 1j * numpy.asarray(imag, dtype=numpy.float64)
+
+    result = numpy.fft.ifft(values)
+    return result.real.copy(), result.imag.copy()
+
+
+def _spectrogram(real, imag=None, scratchpad=None, out=None, log=False):
+    '''Magnitude of the FFT, like ulab.utils.spectrogram'''
+    values = numpy.asarray(real, dtype=numpy.float64)
+    if imag is not None:
+        values = values + 1j * numpy.asarray(imag, dtype=numpy.float64)
+
+    magnitude = numpy.abs(numpy.fft.fft(values))
+    if log:
+        magnitude = numpy.log(magnitude)
+
+    if out is not None:
+        out[:] = magnitude
+        return out
+
+    return magnitude
+
+
+def _sosfilt(sos, x, zi=None):
+    '''
+    ulab.scipy.signal.sosfilt.  Like scipy it returns (y, zf) when initial conditions are passed.  Uses scipy when
+    it is installed and a direct form II transposed loop otherwise.
+    '''
+    sos = numpy.asarray(sos, dtype=numpy.float64)
+    x = numpy.asarray(x, dtype=numpy.float64)
+    if scipy_signal is not None:
+        if zi is None:
+            return scipy_signal.sosfilt(sos, x)
+        return scipy_signal.sosfilt(sos, x, zi=numpy.asarray(zi, dtype=numpy.float64))
+
+    state = numpy.zeros((len(sos), 2)) if zi is None else numpy.array(zi, dtype=numpy.float64)
+    y = x.copy()
+    for i_section, (b0, b1, b2, a0, a1, a2) in enumerate(sos):
+        z0, z1 = state[i_section]
+        for i in range(len(y)):
+            value = y[i]
+            out = b0 * value + z0
+            z0 = b1 * value - a1 * out + z1
+            z1 = b2 * value - a2 * out
+            y[i] = out
+        state[i_section] = z0, z1
+
+    return y if zi is None else (y, state)
+
+
+def build_modules() -> dict[str, types.ModuleType]:
+    '''
+    Create ulab, ulab.numpy, ulab.utils, ulab.scipy and ulab.scipy.signal modules backed by numpy
+    '''
+    ulab_numpy = types.ModuleType('ulab.numpy')
+    for name in dir(numpy):
+        if not name.startswith('__'):
+            setattr(ulab_numpy, name, getattr(numpy, name))
+
+    # ulab's float is the board's float.  The host keeps double precision, which only makes results more accurate.
+    ulab_numpy.float = numpy.float64
+    ulab_numpy.ndarray = ndarray
+    ulab_numpy.array = _ArrayFunction()
+    ulab_numpy.fft = types.SimpleNamespace(fft=_fft, ifft=_ifft)
+
+    ulab_utils = types.ModuleType('ulab.utils')
+    ulab_utils.spectrogram = _spectrogram
+
+    ulab_signal = types.ModuleType('ulab.scipy.signal')
+    ulab_signal.sosfilt = _sosfilt
+
+    ulab_scipy = types.ModuleType('ulab.scipy')
+    ulab_scipy.signal = ulab_signal
+
+    ulab = types.ModuleType('ulab')
+    ulab.numpy = ulab_numpy
+    ulab.utils = ulab_utils
+    ulab.scipy = ulab_scipy
+
+    return {'ulab': ulab, 'ulab.numpy': ulab_numpy, 'ulab.utils': ulab_utils, 'ulab.scipy': ulab_scipy,
+            'ulab.scipy.signal': ulab_signal}
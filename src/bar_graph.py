@@ -0,0 +1,152 @@
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
+import neopixel
+import colormap
+import stage_timing
+from framebuffer import FrameBuffer
+
+
+def map_columns_to_groups(range_indicies: np.array[int], num_cols: int) -> list[int]:
+    '''
+    Choose the group each column of a bar graph displays.  A column whose range is empty shows the next group with
+    a range instead.  Done once, when the range indicies are built, rather than every frame.
+    :param range_indicies: Range cutoffs, one more than the number of groups
+    :param num_cols: Number of columns in the bar graph
+    :return: Group index for each column that can be drawn.  May be shorter than num_cols if the ranges run out.
+    '''
+    column_groups = []
+    for i_col in range(0, num_cols):
+        i = i_col
+
+        if i + 1 >= len(range_indicies):
+            break
+
+        # Duplicate the previous columns output if there is no range available for this column
+        # This is not used when there are enough columns to display  or if the space_indicies is
+        # used on the _range_indicies
+        while range_indicies[i] == range_indicies[i + 1]:
+            i += 1
+            if i + 1 >= len(range_indicies):
+                break
+
+        if i >= len(range_indicies) or i >= num_cols:
+            break
+
+        column_groups.append(i)
+
+    return column_groups
+
+
+class BarGraphRasterizer:
+    '''
+    Draws every column of a bar graph with array operations.  Each bar is lit to a height set by its value, the body
+    of the bar in the value's full color and the top pixel dimmed by the value to simulate extra range.
+
+    The row and column of every pixel are found once, up front.  Each frame compares every pixel's row with the
+    height of its column to pick the body, top or off color, and draws the frame with a single lookup.
+    '''
+
+    _framebuffer: FrameBuffer
+    _table: np.ndarray | None  # Body colors, then top colors, then off, built on first draw
+    _pixel_column: np.ndarray  # Column of each pixel.  Pixels outside the graph use an extra column that stays off.
+    _pixel_row: np.ndarray  # Row of each pixel
+    _heights: np.ndarray  # Number of lit pixels in each column, plus the extra column
+    _levels: np.ndarray  # Colormap level of each column, plus the extra column
+    _block_offsets: np.ndarray  # Offset into the table for each height above a pixel's row, plus num_rows - 1
+    _pixel_heights: np.ndarray
+    _pixel_state: np.ndarray  # Height of a pixel's column above its row, plus num_rows - 1, as an index
+    _pixel_index: np.ndarray
+    _pixel_levels: np.ndarray
+
+    @property
+    def framebuffer(self) -> FrameBuffer:
+        return self._framebuffer
+
+    def __init__(self, pixels: neopixel.NeoPixel, pixel_map: tuple[tuple[int]], cmap: colormap.ColorMap,
+                 min_delta: int = 0):
+        '''
+        :param pixels: NeoPixel or DotStar object the frames are sent to
+        :param pixel_map: Pixel index of each row, bottom first, for each column.  See GraphDisplay._build_pixel_map
+        :param cmap: Colors of the bars
+        :param min_delta: See FrameBuffer
+        '''
+        self._framebuffer = FrameBuffer(pixels, min_delta)
+        self._colormap = cmap
+        self._table = None
+        self._num_cols = len(pixel_map)
+        self._num_rows = len(pixel_map[0])
+
+        num_pixels = self._framebuffer.num_pixels
+        self._pixel_column = np.zeros(num_pixels, dtype=np.uint16)
+        self._pixel_column[:] = self._num_cols
+        self._pixel_row = np.zeros(num_pixels)
+        for i_col in range(self._num_cols):
+            for i_row in range(self._num_rows):
+                i_pixel = pixel_map[i_col][i_row]
+                self._pixel_column[i_pixel] = i_col
+                self._pixel_row[i_pixel] = i_row
+
+        self._heights = np.zeros(self._num_cols + 1)
+        self._levels = np.zeros(self._num_cols + 1)
+        self._pixel_heights = np.zeros(num_pixels)
+        self._pixel_state = np.zeros(num_pixels, dtype=np.uint16)
+        self._pixel_index = np.zeros(num_pixels)
+        self._pixel_levels = np.zeros(num_pixels, dtype=np.uint16)
+
+        # A column's height minus a pixel's row is more than 1 for the body of a bar, 1 for the top pixel and 0 or less
+        # for pixels above the bar.  It ranges from 1 - num_rows to num_rows, so it is shifted up by num_rows - 1 to
+        # index this table of where each kind of pixel's colors start in the combined table.
+        num_levels = colormap.num_levels
+        self._block_offsets = np.zeros(2 * self._num_rows)
+        for height in range(1 - self._num_rows, self._num_rows + 1):
+            offset = 0 if height > 1 else num_levels if height == 1 else 2 * num_levels
+            self._block_offsets[height + self._num_rows - 1] = offset
+
+    def _build_table(self) -> np.ndarray:
+        '''
+        Stack the colormap's full and dimmed tables with a block of off colors, so a level plus the offset of its
+        block picks any of them
+        '''
+        return np.concatenate((self._colormap.lut, self._colormap.dimmed_lut,
+                               np.zeros((colormap.num_levels, 3), dtype=np.uint8)))
+
+    def draw(self, values: np.ndarray) -> None:
+        '''
+        Draw one bar per column and send the frame to the strip
+        :param values: Normalized value, 0 to 1, of each column
+        '''
+        start_ns = stage_timing.start()
+        if self._table is None:
+            self._table = self._build_table()
+
+        num_cols = self._num_cols
+
+        # Calculate how many LEDs in each column will be illuminated, and the color level of each column
+        heights = self._heights[:num_cols]
+        heights[:] = values
+        heights *= self._num_rows
+        heights[:] = np.ceil(heights)
+
+        levels = self._levels[:num_cols]
+        levels[:] = values
+        levels *= self._colormap.level_scale
+
+        # Spread the columns across the pixels, and add each pixel's level to the start of its block in the table.
+        # Everything is written into arrays allocated up front.
+        np.take(self._heights, self._pixel_column, out=self._pixel_heights)
+        self._pixel_heights -= self._pixel_row
+        self._pixel_heights += self._num_rows - 1
+        self._pixel_state[:] = self._pixel_heights
+        np.take(self._block_offsets, self._pixel_state, out=self._pixel_heights)
+
+        np.take(self._levels, self._pixel_column, out=self._pixel_index)
+        self._pixel_index += self._pixel_heights
+        self._pixel_levels[:] = self._pixel_index
+
+        self._framebuffer.draw_levels(self._pixel_levels, self._table)
+        stage_timing.stop('color', start_ns)
+
+        self._framebuffer.show()
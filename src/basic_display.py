@@ -1,15 +1,15 @@
-import math
 import ulab.numpy as np
 import neopixel
-from spectrum_shared import map_float_color_to_neopixel_color, \
-    map_power_to_range, map_normalized_value_to_color, log_range, float_to_indicies, get_freq_powers_by_range, \
-    linear_range, space_indicies, map_normalized_power_to_range
+from spectrum_shared import log_range, float_to_indicies, RangeAggregator, linear_range, space_indicies
 from interfaces import IDisplay
+import stage_timing
+import filterbank
+from filterbank import FilterBank
 from display_settings import DisplaySettings
+from framebuffer import FrameBuffer
 import colormap
 from standard_colormaps import default_colormap
-import display_range
-import simple_display_range
+import normalization
 
 class BasicDisplay(IDisplay):
     last_min_group_power: float
@@ -19,12 +19,24 @@ class BasicDisplay(IDisplay):
     num_cutoff_groups: int  # How many low frequency groups we ignore
     _log_range_indicies: np.array[int]
     _group_power: np.array[float]
+    _normalizer: normalization.Normalizer  # Scales _group_power to 0 to 1
+    _range_aggregator: RangeAggregator | FilterBank
+    _framebuffer: FrameBuffer | None  # None when drawing one pixel at a time
+    _values: np.array[float]  # Normalized value of each group plus an extra value for unused pixels, which stays 0
+    _source_index: np.array[int]  # For each pixel, the index in _values it displays
+    _pixel_values: np.array[float]  # _values in pixel order
+    _pixel_levels: np.array[int]  # Colormap level of each pixel
     settings: DisplaySettings
 
     @property
     def num_visible_groups(self) -> int:
         return self.num_cols * self.num_rows
 
+    @property
+    def framebuffer(self) -> FrameBuffer | None:
+        '''Holds the frames sent to the pixels and counts them.  None when drawing one pixel at a time'''
+        return self._framebuffer
+
     @property
     def num_cols(self) -> int:
         return self.settings.num_cols
@@ -41,17 +53,36 @@ class BasicDisplay(IDisplay):
     def total_groups(self) -> int:
         return self.num_groups + self.num_cutoff_groups
 
-    def __init__(self, pixels: neopixel.NeoPixel, settings: DisplaySettings, num_cutoff_groups: int = 0, cmap: colormap.ColorMap | None = None):
+    def __init__(self, pixels: neopixel.NeoPixel, settings: DisplaySettings, num_cutoff_groups: int = 0, cmap: colormap.ColorMap | None = None,
+                 whole_frame: bool = True):
+        '''
+        :param whole_frame: Color every pixel with array operations and send them to the strip at once.  When False each
+        pixel is set individually.
+        '''
         self.pixels = pixels
         self.settings = settings
-        self._display_range = simple_display_range.SimpleDisplayRange(settings.num_cols * settings.num_rows)
+        self._normalizer = normalization.build_normalizer(settings.normalization, settings.num_cols * settings.num_rows)
         self.num_cutoff_groups = num_cutoff_groups
         self._group_power = None
         self._colormap = cmap if cmap is not None else default_colormap
 
         self._range_indicies = None
+        self._range_aggregator = None
         self._pixel_map = self._build_pixel_map()
 
+        self._framebuffer = FrameBuffer(pixels, settings.min_frame_delta) if whole_frame else None
+        if self._framebuffer is not None:
+            # The frame is drawn in pixel order, so find the group each pixel shows once, up front
+            pixel_map = {}
+            for i_row in range(self.num_rows):
+                for i_col in range(self.num_cols):
+                    pixel_map[i_row * self.num_cols + i_col] = self._pixel_map[i_col][i_row]
+
+            self._values = np.zeros(self.num_visible_groups + 1)
+            self._source_index = self._framebuffer.build_source_index(pixel_map, self.num_visible_groups)
+            self._pixel_values = np.zeros(self._framebuffer.num_pixels)
+            self._pixel_levels = np.zeros(self._framebuffer.num_pixels, dtype=np.uint16)
+
     def _build_pixel_map(self):
         '''
         Create a map to index column first, row second to optimize access
@@ -90,21 +121,55 @@ class BasicDisplay(IDisplay):
     def show(self, power_spectrum):
         if self._range_indicies is None:
             self._range_indicies = self._build_range_indicies(len(power_spectrum))
+            self._range_aggregator = filterbank.build_aggregator(self.settings.filterbank_scale,
+                                                                 self._range_indicies, len(power_spectrum))
+            self._group_power = np.zeros(self._range_aggregator.num_groups)
 
-        self._group_power = get_freq_powers_by_range(power_spectrum,
-                                                     self._range_indicies,
-                                                     out=self._group_power)
+        start_ns = stage_timing.start()
+        self._range_aggregator.aggregate(power_spectrum, out=self._group_power)
+        stage_timing.stop('aggregate', start_ns)
 
 
 
-        norm_values = self._display_range.get_normalized_values(self._group_power)
+        start_ns = stage_timing.start()
+        norm_values = self._normalizer.normalize(self._group_power)
+        stage_timing.stop('normalize', start_ns)
         #print(f'{norm_values}')
         if norm_values is None:
-            self._display_range.add(self._group_power)
             return
 
         #print(f'{norm_values}')
 
+        if self._framebuffer is not None:
+            self._show_whole_frame(norm_values)
+        else:
+            self._show_per_pixel(norm_values)
+
+    def _show_whole_frame(self, norm_values: np.array[float]) -> None:
+        '''
+        Move the normalized values into pixel order, quantize them to colormap levels and look up every pixel's color
+        with array operations, then send the frame to the strip.  The normalized values are already clipped to 0 to 1.
+        '''
+        start_ns = stage_timing.start()
+        self._values[:self.num_visible_groups] = norm_values
+        np.take(self._values, self._source_index, out=self._pixel_values)
+
+        pixel_values = self._pixel_values
+        pixel_values *= self._colormap.level_scale
+        self._pixel_levels[:] = pixel_values
+
+        self._framebuffer.draw_levels(self._pixel_levels, self._colormap.dimmed_lut)
+        stage_timing.stop('color', start_ns)
+
+        self._framebuffer.show()
+
+    def _show_per_pixel(self, norm_values: np.array[float]) -> None:
+        # Look up each pixel's final color in the colormap's compiled table.  The normalized values are already
+        # clipped to 0 to 1, so they only need to be scaled to a level.
+        start_ns = stage_timing.start()
+        packed_colors = self._colormap.packed_dimmed_colors
+        level_scale = self._colormap.level_scale
+
         for i_row in range(self.num_rows):
             row_offset = i_row * self.num_cols
             for i_col in range(self.num_cols):
@@ -116,17 +181,10 @@ class BasicDisplay(IDisplay):
                     self.pixels[iPixel] = (0, 0, 0)
                     continue
 
-                i_range, norm_value = map_normalized_power_to_range(norm_value,
-                                                                    range_cutoffs=self._colormap.range_cutoffs)
-                if norm_value < 0 or norm_value > 1.0:
-                    raise ValueError(f'norm_value {norm_value}')
-
-                neo_color = map_normalized_value_to_color(normalized_value=norm_value, colormap_index=i_range,
-                                                          color_map=self._colormap.colors)
-
-                #print(f'{i}: nv: {norm_value} color: {neo_color}')
-                self.pixels[iPixel] = map_float_color_to_neopixel_color(neo_color, norm_value)
+                #print(f'{i}: nv: {norm_value}')
+                self.pixels[iPixel] = packed_colors[int(norm_value * level_scale)]
+        stage_timing.stop('color', start_ns)
 
+        start_ns = stage_timing.start()
         self.pixels.show()
-
-        self._display_range.add(self._group_power)
\ No newline at end of file
+        stage_timing.stop('show', start_ns)
\ No newline at end of file
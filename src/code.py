@@ -1,26 +1,24 @@
 # This is a sample Python script.
 import time
-import math
 
+# Boot time is reported from here to the first frame drawn
+boot_start_ns = time.monotonic_ns()
+
+import gc
 import asyncio
 import board
 import analogbufio
-import array
-import ulab.numpy as np
 import neopixel
 import digitalio
 from collections import namedtuple
 
-import ulab.utils
-import ema
-import display_diagnostic
 from recording_settings import RecordingSettings
 import recording
-from sound_rec import record_sample_array, record_sample_numpy
-from basic_display import BasicDisplay
-from waterfall_display import WaterfallDisplay
-from graph_display import GraphDisplay
-from fade_display import FadeDisplay
+from sound_rec import SampleCapture
+import filterbank
+from spectrum_pipeline import SpectrumPipeline
+from scheduler import StagedScheduler
+from lazy_display_modes import LazyDisplayModes, display_mode_factory
 from display_settings import DisplaySettings
 from pixel_indexers import *
 
@@ -46,6 +44,10 @@ display_configs = {
                                   log_scale=True),
     "6x12 Dotstar Feather Graph": DisplaySettings(num_rows=6, num_cols=12, pixel_indexer=standard_indexer,
                                                   log_scale=True),
+    # Opt in to overlapping log spaced filters, which give each of the low frequency columns its own blend of bins.
+    # Use it in place of "6x12 Dotstar Feather Graph" in a board's display modes.
+    "6x12 Dotstar Feather Graph Filterbank": DisplaySettings(num_rows=6, num_cols=12, pixel_indexer=standard_indexer,
+                                                             log_scale=True, filterbank_scale='log'),
     "12x6 Dotstar Feather Waterfall": DisplaySettings(num_rows=12, num_cols=6, pixel_indexer=rows_are_columns_indexer,
                                                       log_scale=True),
     "6x12 Dotstar Feather Waterfall": DisplaySettings(num_rows=6, num_cols=12, pixel_indexer=standard_indexer,
@@ -54,15 +56,24 @@ display_configs = {
 
 # The Electet Microphone used in this project can only sample at up to 20Khz according to its specs.  Higher values just add noise.
 sampling_settings = {
-    "Low Frequency": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=255, sample_size_exp=10),
-    "Low-Mid Frequency": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=500, sample_size_exp=10),
-    "Mids": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=4000, sample_size_exp=10),
-    "High-Mids": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=6000, sample_size_exp=10),
-    "Highs": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=10000, sample_size_exp=10),
+    # The low presets throw away most of the spectrum, so they filter and downsample the recording before the FFT.
+    # The FFT is smaller and each bin is narrower.
+    "Low Frequency": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=255, sample_size_exp=10, hop_size=256,
+                                       decimate=True),
+    "Low-Mid Frequency": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=500, sample_size_exp=10, hop_size=256,
+                                           decimate=True),
+    "Mids": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=4000, sample_size_exp=10, hop_size=256),
+    "High-Mids": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=6000, sample_size_exp=10, hop_size=256),
+    "Highs": RecordingSettings(sampling_freq_hz=20000, frequency_cutoff=10000, sample_size_exp=10, hop_size=256),
 }
 
 sample_settings = sampling_settings["Mids"]
 
+# Frames per second the display aims for.  Frames that cannot be drawn in time are skipped rather than queued.  None
+# draws every spectrum as soon as it is ready, which is at most sample_rate / hop_size frames per second.  A number
+# lower than that caps the frame rate to leave time for other work.
+TARGET_FPS = None
+
 MIC_PIN = board.A5
 
 purple_colormap = ColorMap(standard_colormaps.purple_colors, standard_colormaps.default_graph_cutoffs)
@@ -74,6 +85,8 @@ rainbow_basic_colormap = ColorMap(standard_colormaps.default_colors, standard_co
 
 
 
+# Each board's display modes are only built, and their modules imported, when the mode is selected.  See
+# lazy_display_modes.py
 class NeoPixelFeatherWing:
     @property
     def display_modes(self):
@@ -81,15 +94,17 @@ class NeoPixelFeatherWing:
 
     def __init__(self):
         NeoPixelFeatherWing._pixels = neopixel.NeoPixel(board.D6, n=4 * 8, brightness=0.05, auto_write=False)
-        self._display_modes = (
-            GraphDisplay(NeoPixelFeatherWing._pixels, display_configs["8x4 Neopixel Feather Graph"],
-                         cmap=green_colormap),
-            WaterfallDisplay(NeoPixelFeatherWing._pixels, display_configs["8x4 Neopixel Feather Waterfall"]),
-            FadeDisplay(NeoPixelFeatherWing._pixels, display_configs["8x4 Neopixel Feather Graph"],
-                        cmap=purple_colormap, smooth_factor=2.66, smooth_samples=3),
-            BasicDisplay(NeoPixelFeatherWing._pixels, display_configs["8x4 Neopixel Feather Graph"],
-                         cmap=rainbow_colormap),
-        )
+        pixels = NeoPixelFeatherWing._pixels
+        self._display_modes = LazyDisplayModes((
+            display_mode_factory('graph_display', 'GraphDisplay', pixels,
+                                 display_configs["8x4 Neopixel Feather Graph"], cmap=green_colormap),
+            display_mode_factory('waterfall_display', 'WaterfallDisplay', pixels,
+                                 display_configs["8x4 Neopixel Feather Waterfall"]),
+            display_mode_factory('fade_display', 'FadeDisplay', pixels, display_configs["8x4 Neopixel Feather Graph"],
+                                 cmap=purple_colormap, smooth_factor=2.66, smooth_samples=3),
+            display_mode_factory('basic_display', 'BasicDisplay', pixels,
+                                 display_configs["8x4 Neopixel Feather Graph"], cmap=rainbow_colormap),
+        ))
 
 
 class NeoPixel32x8Matrix:
@@ -99,13 +114,14 @@ class NeoPixel32x8Matrix:
 
     def __init__(self):
         NeoPixel32x8Matrix._pixels = neopixel.NeoPixel(board.D10, n=8 * 32, brightness=0.05, auto_write=False)
-        self._display_modes = (
-            GraphDisplay(NeoPixel32x8Matrix._pixels, display_configs["8x32 Graph"], cmap=green_colormap),
-            WaterfallDisplay(NeoPixel32x8Matrix._pixels, display_configs["32x8 Waterfall"]),
-            FadeDisplay(NeoPixel32x8Matrix._pixels, display_configs["8x32 Graph"], cmap=purple_colormap,
-                        smooth_factor=2.66,
-                        smooth_samples=3),
-        )
+        pixels = NeoPixel32x8Matrix._pixels
+        self._display_modes = LazyDisplayModes((
+            display_mode_factory('graph_display', 'GraphDisplay', pixels, display_configs["8x32 Graph"],
+                                 cmap=green_colormap),
+            display_mode_factory('waterfall_display', 'WaterfallDisplay', pixels, display_configs["32x8 Waterfall"]),
+            display_mode_factory('fade_display', 'FadeDisplay', pixels, display_configs["8x32 Graph"],
+                                 cmap=purple_colormap, smooth_factor=2.66, smooth_samples=3),
+        ))
 
 
 class DotStarFeatherWing:
@@ -115,20 +131,23 @@ class DotStarFeatherWing:
 
     def __init__(self):
         DotStarFeatherWing._dotstar = dotstar.DotStar(board.D13, board.D11, 12 * 6, brightness=.1, auto_write=False)
-        self._display_modes = (
-            GraphDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Graph"],
-                         cmap=green_colormap),
-            FadeDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Graph"],
-                        cmap=red_colormap,
-                        smooth_factor=2.5, smooth_samples=4),
-            WaterfallDisplay(DotStarFeatherWing._dotstar, display_configs["12x6 Dotstar Feather Waterfall"]),
-            WaterfallDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Waterfall"]),
-            WaterfallDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Waterfall"], cmap=green_colormap),
-            BasicDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Graph"],
-                         cmap=rainbow_colormap),
-            BasicDisplay(DotStarFeatherWing._dotstar, display_configs["6x12 Dotstar Feather Graph"],
-                         cmap=purple_basic_colormap),
-        )
+        pixels = DotStarFeatherWing._dotstar
+        self._display_modes = LazyDisplayModes((
+            display_mode_factory('graph_display', 'GraphDisplay', pixels,
+                                 display_configs["6x12 Dotstar Feather Graph"], cmap=green_colormap),
+            display_mode_factory('fade_display', 'FadeDisplay', pixels, display_configs["6x12 Dotstar Feather Graph"],
+                                 cmap=red_colormap, smooth_factor=2.5, smooth_samples=4),
+            display_mode_factory('waterfall_display', 'WaterfallDisplay', pixels,
+                                 display_configs["12x6 Dotstar Feather Waterfall"]),
+            display_mode_factory('waterfall_display', 'WaterfallDisplay', pixels,
+                                 display_configs["6x12 Dotstar Feather Waterfall"]),
+            display_mode_factory('waterfall_display', 'WaterfallDisplay', pixels,
+                                 display_configs["6x12 Dotstar Feather Waterfall"], cmap=green_colormap),
+            display_mode_factory('basic_display', 'BasicDisplay', pixels,
+                                 display_configs["6x12 Dotstar Feather Graph"], cmap=rainbow_colormap),
+            display_mode_factory('basic_display', 'BasicDisplay', pixels,
+                                 display_configs["6x12 Dotstar Feather Graph"], cmap=purple_basic_colormap),
+        ))
 
 
 # On-board DotStar for boards including Gemma, Trinket, and ItsyBitsy
@@ -146,10 +165,16 @@ display_mode = display_modes[iDisplayMode]
 def OnModeButtonDown():
     global iDisplayMode
     global display_mode
+    # Report how many frames the display mode we are leaving sent and skipped because they had not changed
+    if display_mode.framebuffer is not None:
+        print(f'{type(display_mode).__name__}: {display_mode.framebuffer}')
+
     iDisplayMode += 1
     if iDisplayMode >= len(display_modes):
         iDisplayMode = 0
 
+    # Let go of the old mode so its memory can be reused for the new one
+    display_mode = None
     display_mode = display_modes[iDisplayMode]
 
 
@@ -167,11 +192,24 @@ for i, button in enumerate(buttons):
     button.pin.switch_to_input(digitalio.Pull.DOWN)
 
 
+async def PollButtons():
+    '''
+    Check the buttons for presses, separately from drawing so a slow frame does not delay them
+    '''
+    buttons_last_state = [False] * len(buttons)
+    while True:
+        for i, button in enumerate(buttons):
+            btn_state = button.pin.value
+            btn_change = buttons_last_state[i] != btn_state
+            if btn_change and btn_state is True:
+                button.on_down_func()
+            buttons_last_state[i] = btn_state
+
+        await asyncio.sleep(0.02)
+
+
 async def Run():
     global display_mode
-    global buttons
-
-    buttons_last_state = [False] * len(buttons)
     #######################################################
     # Use reversing_row_column_indexer if your NeoPixels
     # initialize going back and forth like mowing the lawn.
@@ -187,36 +225,35 @@ async def Run():
     # help determine pixel order and if a pixel indexer
     # is addressing the pixels correctly
     #######################################################
+    # import display_diagnostic
     # display_diagnostic.ShowLightOrder(display_mode.pixels, display_mode.settings, 0.01)
     # display_diagnostic.ShowRowColumnOrder(display_mode.pixels, display_mode.settings, 0.01)
+    # display_diagnostic.BenchmarkDisplayModes(display_modes)
+    # Print min/mean/p95/max time of each stage of a frame every 5 seconds
+    # import stage_timing
+    # stage_timing.enable(report_interval_s=5)
+    #######################################################
+    # Compare the speed of the FFT engines for each sampling setting
+    # recording.benchmark_spectrum_engines(sampling_settings)
+    # Compare the speed and accuracy of the float and fixed point pipelines
+    # import spectrum_pipeline
+    # spectrum_pipeline.compare_fixed_point(sampling_settings)
+    # Compare hard edged frequency ranges with the triangular filterbank
+    # filterbank.benchmark_filterbank()
+    # Check how quickly the synthetic test signals can be generated
+    # import synthetic_signals
+    # synthetic_signals.benchmark_signals(sample_settings)
     #######################################################
-
-    # Initialize a region of memory to read microphone data into
-    mic_buffer = array.array("H", [0x0000] * sample_settings.sample_size)
 
     # analogbufio makes calls external to python to allow reading the microphone fast enough to encode high frequencies
     mic_adc_bufferio = analogbufio.BufferedIn(MIC_PIN, sample_rate=sample_settings.sample_rate)
 
-    # async tasks are a way to simplify concurrency (doing more than one set of operations).  We are asking python to
-    # read data into the microphone as a separate task from this task which is processing the sound.
-    # (Currently circuitpython is not able to run both tasks simultaneously, but hopefully tasks will be improved in
-    # later versions and doing it "right" means this code will improve if better task concurrency makes it into circuit
-    # python.)
-
-    # Get a big sample to calculate a mean buffer value
-    new_buffer_task = asyncio.create_task(
-        record_sample_array(mic_adc_bufferio, sample_settings.sample_size * 10, sample_rate=sample_settings.sample_rate,
-                            buffer=mic_buffer))
-
-    # The max_buffer_ema is used to normalize the recorded signal.  An exponential moving average (EMA) is used to slowly
-    # adjust the volume range that the microphone is focusing on.  A large number of samples in the EMA means the value
-    # will adapt slowly to changes in sound.  Smaller number of samples may adjust the range based on quiet stretces of
-    # music or conversations and then saturate the diaplay when the volume increases.
-    # The smooth factor determines how much weight is given to the more recent records.  A typical value is 2, but again
-    # the default is 1.5 to prevent the display_mode from adapting too quickly to music that has long loud/quiet periods at
-    # the cost of adapting slowly if the overall volume changes for a long period of time (example: changing the volume
-    # knob on the speaker.)
-    max_buffer_ema = ema.EMA(num_samples=500, smooth=1)
+    # The capture object owns a small pool of buffers to read microphone data into, so we never hand a buffer back
+    # to the ADC while we are still reading it.  Recording blocks and the ADC is idle while a frame is analyzed and
+    # drawn, so some audio between recordings is always missed.  print(mic_capture) reports the estimated samples lost.
+    # Each frame only records hop_size new samples.  When hop_size is smaller than sample_size the sliding window
+    # reuses the older samples so the display can update more often without losing frequency resolution.
+    mic_capture = SampleCapture(mic_adc_bufferio, sample_settings.hop_size, sample_rate=sample_settings.sample_rate)
 
     # The best results I obtained experimenting with this code was to have a high sampling rate (~22,000 Hertz) and then
     # eliminating high frequencies from the data.  This seems counter-intuitive, why collect the high frequencies if
@@ -232,7 +269,8 @@ async def Run():
     # of the first.  Wikipedia or another resource can explain in more depth why that is.)
     frequencies = recording.get_frequencies(sample_settings)
     max_freq_index = recording.get_frequency_index(frequencies, sample_settings.frequency_cutoff)
-    print(f'max freq index: {max_freq_index}')
+    filterbank.set_bin_width(frequencies[1])
+    print(f'bin width: {frequencies[1]} max freq index: {max_freq_index}')
 
     # filter_len = sample_settings.sample_size >> 1 # This is a fancy divide by 2 that ensures we still have an integer
     # hanning_filter = recording.calculate_half_hanning_filter(filter_len)
@@ -240,66 +278,36 @@ async def Run():
     # reversed_hanning_filter = hanning_filter[::-1]
     # print(f'Reverse filter: {reversed_hanning_filter}')
 
-    hanning_filter = recording.calculate_hanning_filter(sample_settings.sample_size)
-    print(f'Hanning filter, len {len(hanning_filter)}: {hanning_filter}')
+    # The pipeline owns every buffer needed to turn a recording into a spectrum: the sliding window, the optional
+    # decimator, the Hanning filter, the FFT and the volume normalization.  Its buffers are allocated once, here.
+    pipeline = SpectrumPipeline(sample_settings, max_freq_index)
 
-    # Collect the first sample so we can precalculate the signal mean
-    sample_buffer = np.array(await new_buffer_task)
-
-    max_buffer_ema.add(np.max(sample_buffer))
-    buffer_mean = int(round(np.mean(sample_buffer)))
-
-    print(f'Mean buffer value calculated as {buffer_mean}')
-
-    while True:
-        ###################
-        # Sample Collection
-        ###################
-        # print(btn_pin.value)
-
-        for i, button in enumerate(buttons):
-            btn_state = button.pin.value
-            btn_change = buttons_last_state[i] != btn_state
-            if btn_change and btn_state is True:
-                button.on_down_func()
-            buttons_last_state[i] = btn_state
-
-        # Wait for the audio sample to finish collecting
-        mic_buffer = await new_buffer_task
-
-        # Start a task to collect the audio sample
-        new_buffer_task = asyncio.create_task(
-            record_sample_array(mic_adc_bufferio, sample_settings.sample_size, sample_rate=sample_settings.sample_rate,
-                                buffer=mic_buffer))
-
-        #########################
-        # Process the audio sample
-        #########################
-
-        # Convert to a numpy.array
-        sample_buffer = np.array(mic_buffer, dtype=np.float)
-
-        # buffer_mean = int(round(np.mean(sample_buffer)))
-        # print(f'Mean buffer value calculated as {buffer_mean}')
-      # Center the floating point sample buffer so the value of 0 represents no sound
-        sample_buffer -= buffer_mean
-        max_buffer_ema.add(np.max((sample_buffer)))  # Technically should call abs here, but odds are this is close enough
-
-        sample_buffer /= max_buffer_ema.ema_value
-        #print(f'Max buffer EMA: {max_buffer_ema.ema_value}')
-
-        # Filter the window to reduce spectral leakage
-        sample_buffer *= hanning_filter
+    # async tasks are a way to simplify concurrency (doing more than one set of operations).  The scheduler records
+    # from the microphone, analyzes the sound and draws the display as separate tasks, passing only the newest data
+    # between them so a slow stage never builds up a backlog.
+    # (Currently circuitpython is not able to run both tasks simultaneously, but hopefully tasks will be improved in
+    # later versions and doing it "right" means this code will improve if better task concurrency makes it into circuit
+    # python.)
+    scheduler = StagedScheduler(mic_capture, pipeline, lambda: display_mode, target_fps=TARGET_FPS)
+    scheduler.start_capture()
 
-        # Calculate the FFT (determine which frequencies compose the recording)
-        power_spectrum = ulab.utils.spectrogram(sample_buffer)
+    # Fill the analysis window.  There is no calibration step: the pipeline follows the microphone's DC offset in
+    # every frame it analyzes, so it also keeps up when it drifts.
+    while not pipeline.is_ready:
+        pipeline.push(await mic_capture.next_frame())
+    # print(f'DC offset: {pipeline.buffer_mean} gain: {pipeline.gain} noise floor: {pipeline.noise_floor}')
 
-        # Remove half of the FFT, which is mostly symmetric for this data
-        displayed_power_spectrum = power_spectrum[1:max_freq_index]
+    # Draw the first frame here so the time it took to boot and the memory left after setting up can be reported
+    gc.collect()
+    if hasattr(gc, 'mem_free'):  # Only CircuitPython can report its free memory
+        print(f'Free memory after setup: {gc.mem_free()} bytes')
+    display_mode.show(pipeline.process())
+    print(f'First frame drawn {(time.monotonic_ns() - boot_start_ns) // 1000000}ms after boot')
 
-        # Show the FFT with our chosen display_mode
-        display_mode.show(displayed_power_spectrum)
-        # time.sleep(0.5)
+    # Record, analyze and draw forever.  print(scheduler) reports how often each stage missed its deadline.
+    await asyncio.gather(scheduler.run(), PollButtons())
 
 
-asyncio.run(Run())
+# CircuitPython runs code.py as __main__.  Importing it, as the host simulator does, only builds the displays.
+if __name__ == '__main__':
+    asyncio.run(Run())
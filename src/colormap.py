@@ -3,7 +3,47 @@ try:
 except ModuleNotFoundError:
     import numpy as np
 
+from spectrum_shared import map_normalized_power_to_range, map_normalized_value_to_color, \
+    map_float_color_to_neopixel_color
+
+# Number of brightness levels in a compiled color table.  A normalized value is quantized to one of these levels.
+num_levels = 256
+
+
+def choose_level_scale(range_cutoffs) -> int:
+    '''
+    Pick the number a normalized value is multiplied by, then truncated, to get its level.  Level i holds the values
+    from i / scale up to (i + 1) / scale.  When every cutoff times the scale is a whole number, each cutoff is the
+    edge of a level, so no level holds values from both sides of a cutoff.  The standard cutoffs are all multiples of
+    0.05 or 0.01, so they get 200.  Otherwise the levels are as fine as the tables allow.
+    :return: The largest scale below num_levels that puts every cutoff on the edge of a level, or num_levels - 1
+    '''
+    for scale in range(num_levels - 1, (num_levels >> 1) - 1, -1):
+        aligned = True
+        for cutoff in range_cutoffs:
+            edge = cutoff * scale
+            if abs(edge - round(edge)) > 1e-6:
+                aligned = False
+                break
+        if aligned:
+            return scale
+
+    return num_levels - 1
+
+
 class ColorMap:
+    _lut: np.ndarray | None  # num_levels x 3 uint8 RGB, compiled on first use
+    _dimmed_lut: np.ndarray | None  # Same as _lut with each color also scaled by its value
+    _packed_colors: tuple[int] | None  # _lut rows packed into 0xRRGGBB integers
+    _packed_dimmed_colors: tuple[int] | None  # _dimmed_lut rows packed into 0xRRGGBB integers
+
+    @property
+    def level_scale(self) -> int:
+        '''
+        Multiply a normalized value from 0 to 1 by this and truncate it to get its level in the color tables
+        '''
+        return self._level_scale
+
     @property
     def range_cutoffs(self):
         return self._range_cutoffs
@@ -16,6 +56,39 @@ class ColorMap:
     def colors(self):
         return self._colors
 
+    @property
+    def lut(self) -> np.ndarray:
+        '''
+        num_levels x 3 table of uint8 RGB colors, indexed by level(normalized_value).  Used for the body of a bar.
+        '''
+        if self._lut is None:
+            self._compile()
+        return self._lut
+
+    @property
+    def dimmed_lut(self) -> np.ndarray:
+        '''
+        Like lut, but each color is also dimmed by its value within its range.  Used for the top pixel of a bar and
+        for displays where each pixel is a single value.
+        '''
+        if self._dimmed_lut is None:
+            self._compile()
+        return self._dimmed_lut
+
+    @property
+    def packed_colors(self) -> tuple[int]:
+        '''lut as 0xRRGGBB integers, which can be assigned directly to a pixel'''
+        if self._packed_colors is None:
+            self._compile()
+        return self._packed_colors
+
+    @property
+    def packed_dimmed_colors(self) -> tuple[int]:
+        '''dimmed_lut as 0xRRGGBB integers, which can be assigned directly to a pixel'''
+        if self._packed_dimmed_colors is None:
+            self._compile()
+        return self._packed_dimmed_colors
+
     def __init__(self, colors: list[tuple[float, float, float]], ranges: list[float] | None):
         if len(ranges) != len(colors):
             raise ValueError("Number of range entries must match number of color entries")
@@ -28,4 +101,55 @@ class ColorMap:
 
         self._range_deltas = [self._range_cutoffs[i] - self._range_cutoffs[i-1] for i in range(1, len(self._range_cutoffs))]
         self._range_deltas.insert(0, self._range_cutoffs[0])
-        #print(f'{self._range_deltas}')
\ No newline at end of file
+        #print(f'{self._range_deltas}')
+
+        self._level_scale = choose_level_scale(self._range_cutoffs)
+
+        # The tables are compiled the first time a display asks for them, so unused colormaps cost nothing at boot
+        self._lut = None
+        self._dimmed_lut = None
+        self._packed_colors = None
+        self._packed_dimmed_colors = None
+
+    def level(self, normalized_value: float) -> int:
+        '''
+        Quantize a normalized value from 0 to 1 into an index for the color tables.  Values outside 0 to 1 are clipped.
+        '''
+        if normalized_value <= 0:
+            return 0
+        if normalized_value >= 1.0:
+            return num_levels - 1
+        return int(normalized_value * self._level_scale)
+
+    def _compile(self) -> None:
+        '''
+        Run every level through the same helpers the displays used per pixel and store the results.  Each level is
+        sampled at the center of the values it holds.  Sampling at an edge would put a cutoff on the sample, and give
+        the values just above the cutoff the brightest color below it instead of the darkest color above it.  Levels
+        above level_scale only hold values above 1 and repeat the last color.
+        '''
+        lut = np.zeros((num_levels, 3), dtype=np.uint8)
+        dimmed_lut = np.zeros((num_levels, 3), dtype=np.uint8)
+        packed_colors = []
+        packed_dimmed_colors = []
+
+        last_cutoff = self._range_cutoffs[len(self._range_cutoffs) - 1]
+        for i_level in range(num_levels):
+            # Stay inside the last cutoff so a colormap that stops short of 1.0 still has a color for every level
+            value = min((i_level + 0.5) / self._level_scale, last_cutoff)
+            i_range, norm_value = map_normalized_power_to_range(value, range_cutoffs=self._range_cutoffs)
+            color = map_normalized_value_to_color(normalized_value=norm_value, colormap_index=i_range,
+                                                  color_map=self._colors)
+
+            full = map_float_color_to_neopixel_color(color)
+            dimmed = map_float_color_to_neopixel_color(color, norm_value)
+
+            lut[i_level, 0], lut[i_level, 1], lut[i_level, 2] = full
+            dimmed_lut[i_level, 0], dimmed_lut[i_level, 1], dimmed_lut[i_level, 2] = dimmed
+            packed_colors.append((full[0] << 16) | (full[1] << 8) | full[2])
+            packed_dimmed_colors.append((dimmed[0] << 16) | (dimmed[1] << 8) | dimmed[2])
+
+        self._lut = lut
+        self._dimmed_lut = dimmed_lut
+        self._packed_colors = tuple(packed_colors)
+        self._packed_dimmed_colors = tuple(packed_dimmed_colors)
@@ -41,3 +41,35 @@ def ShowRowColumnOrder(pixels: neopixel.NeoPixel, settings: DisplaySettings, del
             i = settings.indexer(irow, icol, settings)
             pixels[i] = (0, 0, 0)
     pixels.show()
+
+def BenchmarkDisplayModes(display_modes, spectrum_len: int = 100, num_frames: int = 50):
+    '''
+    Feed each display mode the same changing synthetic spectra and print the frames per second it can draw.  The
+    first frames only prime the display range, so they are shown before timing starts.
+    :param display_modes: Display modes to time, such as display.display_modes in code.py
+    :param spectrum_len: Number of bins in each spectrum
+    :param num_frames: Number of frames to time for each mode
+    '''
+    import math
+    import ulab.numpy as np
+
+    bins = np.arange(0, spectrum_len)
+    spectra = []
+    for i_frame in range(8):
+        # A peak that sweeps across the spectrum on top of a gently sloping floor
+        center = (i_frame + 0.5) * spectrum_len / 8.0
+        spectrum = 1.0 / (1.0 + ((bins - center) / 4.0) ** 2) + 0.1 / (1.0 + bins * 0.05)
+        spectra.append(spectrum)
+
+    for i_mode, display_mode in enumerate(display_modes):
+        for spectrum in spectra:
+            display_mode.show(spectrum)
+
+        start = time.monotonic_ns()
+        for i_frame in range(num_frames):
+            display_mode.show(spectra[i_frame % len(spectra)])
+        elapsed_s = (time.monotonic_ns() - start) / 1000000000
+
+        fps = num_frames / elapsed_s if elapsed_s > 0 else math.inf
+        print(f'{i_mode}: {type(display_mode).__name__} {display_mode.settings.num_rows}x'
+              f'{display_mode.settings.num_cols}: {fps:0.1f} fps')
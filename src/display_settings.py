@@ -5,6 +5,9 @@ class DisplaySettings():
     _num_neo_rows: int
     _indexer: Callable[[int, int], int]
     _log_scale: bool
+    _filterbank_scale: str | None
+    _normalization: str
+    _min_frame_delta: int
 
     @property
     def num_cols(self) -> int:
@@ -26,6 +29,30 @@ class DisplaySettings():
     def log_scale(self) -> bool:
         return self._log_scale
 
+    @property
+    def filterbank_scale(self) -> str | None:
+        '''
+        None to sum the power in hard edged frequency ranges.  'log', 'linear' or 'mel' to use overlapping triangular
+        filters spaced on that scale instead.  See filterbank.py
+        '''
+        return self._filterbank_scale
+
+    @property
+    def normalization(self) -> str:
+        '''
+        How group powers are scaled to 0 to 1 over time.  'peak decay', 'ema', 'window', 'percentile' or 'total power',
+        see normalization.py
+        '''
+        return self._normalization
+
+    @property
+    def min_frame_delta(self) -> int:
+        '''
+        Frames whose largest color channel change is this many steps or fewer are only sent to the pixels every
+        framebuffer.tiny_delta_interval_ms.  0 sends every frame that changes.
+        '''
+        return self._min_frame_delta
+
     @property
     def indexer(self):
         return self._indexer
@@ -35,15 +62,19 @@ class DisplaySettings():
         return self.num_rows * self.num_cols
 
     def __init__(self, num_rows: int, num_cols: int, pixel_indexer, log_scale: bool,
-                 num_neo_rows: int = None, num_neo_cols: int = None):
+                 num_neo_rows: int = None, num_neo_cols: int = None, filterbank_scale: str | None = None,
+                 min_frame_delta: int = 0, normalization: str = 'peak decay'):
         self._num_cols = num_cols
         self._num_rows = num_rows
         self._num_neo_rows = num_rows if num_neo_rows is None else num_neo_rows
         self._num_neo_cols = num_cols if num_neo_cols is None else num_neo_cols
         self._indexer = pixel_indexer
         self._log_scale = log_scale
+        self._filterbank_scale = filterbank_scale
+        self._min_frame_delta = min_frame_delta
+        self._normalization = normalization
 
     def __str__(self):
-        return f'cols: {self.num_cols} rows: {self.num_rows} log: {self.log_scale} neo_cols: {self.num_neo_cols} neo_rows: {self.num_neo_rows}'
+        return f'cols: {self.num_cols} rows: {self.num_rows} log: {self.log_scale} neo_cols: {self.num_neo_cols} neo_rows: {self.num_neo_rows} filterbank: {self.filterbank_scale} normalization: {self.normalization} min_frame_delta: {self.min_frame_delta}'
 
 
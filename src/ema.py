@@ -1,3 +1,9 @@
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
+
 class EMA:
     '''
     Accumulates values over time, calculating an exponential moving average over time
@@ -18,6 +24,11 @@ class EMA:
         self._num_samples = num_samples
         self._num_samples_collected = 0
 
+    @property
+    def num_samples_collected(self) -> int:
+        '''Number of samples added, up to num_samples'''
+        return self._num_samples_collected
+
     @property
     def ema_value(self) -> float:
         '''Current exponential moving average'''
@@ -43,4 +54,95 @@ class EMA:
         self._last_ema_value = value
         self._num_samples_collected = self._num_samples
         self._current_value = value
-        self._current_ema_value = value
\ No newline at end of file
+        self._current_ema_value = value
+
+class EMABank:
+    '''
+    Exponential moving averages of several channels, such as the columns of a display, held in one array and updated
+    together with array operations.  Each channel follows the same rules as EMA: the newest value is weighted by
+    smooth / (1 + n), where n counts the values added, up to num_samples.
+
+    With instant_attack a channel whose new value is above its average jumps straight to the value, like EMA.reset,
+    and only falls back down gradually.  This is the attack/release behaviour of a peak meter.
+    '''
+
+    _values: np.ndarray  # Current average of each channel
+    _counts: np.ndarray  # Number of values each channel has collected, up to num_samples
+    _scalars: np.ndarray  # Weight of the newest value for each channel
+    _decays: np.ndarray  # Weight of each channel's previous average, 1 - _scalars
+    _weighted: np.ndarray  # Scratch space for the weighted new values
+    _saturated: bool  # True once every count is num_samples, so _scalars no longer change
+
+    @property
+    def values(self) -> np.ndarray:
+        '''Current average of each channel.  The array is updated in place by add.'''
+        return self._values
+
+    @property
+    def num_channels(self) -> int:
+        return len(self._values)
+
+    def __init__(self, num_channels: int, num_samples: int, smooth: float = 2, initial_value: float | None = None,
+                 instant_attack: bool = False):
+        '''
+        :param initial_value: Start every channel as if it had collected this value, like EMA.add(initial_value).
+        None starts each channel at the first value added.
+        :param instant_attack: Channels jump up to higher values immediately and only average on the way down
+        '''
+        self._num_samples = num_samples
+        self._smooth = smooth
+        self._instant_attack = instant_attack
+        self._values = np.zeros(num_channels)
+        self._counts = np.zeros(num_channels)
+        self._scalars = np.zeros(num_channels)
+        self._decays = np.zeros(num_channels)
+        self._weighted = np.zeros(num_channels)
+        self._saturated = False
+        self._empty = initial_value is None
+        if initial_value is not None:
+            self._values[:] = initial_value
+            self._counts[:] = 1
+
+    def add(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Add one value to every channel
+        :param values: New value of each channel
+        :return: The updated averages, see values
+        '''
+        averages = self._values
+        if self._empty:
+            # An empty EMA's previous average is the first value it is given
+            averages[:] = values
+            self._empty = False
+
+        rising = values > averages if self._instant_attack else None
+
+        if not self._saturated:
+            counts = self._counts
+            counts += 1
+            counts[counts > self._num_samples] = self._num_samples
+            self._scalars[:] = self._smooth / (counts + 1)
+            self._decays[:] = 1.0 - self._scalars
+            self._saturated = np.min(counts) >= self._num_samples
+
+        # value * scalar + average * (1 - scalar), the same arithmetic as EMA.ema_value
+        weighted = self._weighted
+        weighted[:] = values
+        weighted *= self._scalars
+        averages *= self._decays
+        averages += weighted
+
+        if rising is not None and np.any(rising):
+            averages[rising] = values[rising]
+            if not self._saturated:
+                self._counts[rising] = self._num_samples
+
+        return averages
+
+    def reset(self, values) -> None:
+        '''Set every channel's average to values, as if it had collected num_samples of them'''
+        self._values[:] = values
+        self._counts[:] = self._num_samples
+        self._scalars[:] = self._smooth / (self._num_samples + 1)
+        self._saturated = True
+        self._empty = False
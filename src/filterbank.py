@@ -0,0 +1,220 @@
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
+import math
+import time
+from spectrum_shared import RangeAggregator, cumulative_sum, log_range, float_to_indicies, space_indicies, \
+    get_freq_powers_by_range
+
+# Width of a spectrum bin in Hz.  Only the mel scale needs it, set it once the recording settings are known.
+_bin_width_hz = None
+
+# Filterbanks already built, keyed by (spectrum length, number of groups, scale, bin width)
+_filterbanks = {}
+
+scales = ('log', 'linear', 'mel')
+
+
+def set_bin_width(bin_width_hz: float) -> None:
+    '''
+    Tell the mel filterbanks the width of each spectrum bin in Hz
+    '''
+    global _bin_width_hz
+    _bin_width_hz = bin_width_hz
+
+
+def hz_to_mel(hz: float) -> float:
+    return 2595.0 * math.log10(1.0 + hz / 700.0)
+
+
+def mel_to_hz(mel: float) -> float:
+    return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+
+def _filter_centers(spectrum_len: int, num_groups: int, scale: str, bin_width_hz: float | None) -> list[float]:
+    '''
+    Positions of the left edge, each filter's peak and the right edge, num_groups + 2 values, measured in spectrum
+    indicies.  Index 0 of the spectrum is bin 1 of the FFT since the DC bin is dropped before display.
+    '''
+    num_points = num_groups + 2
+    if scale == 'linear':
+        return [(spectrum_len - 1) * i / (num_points - 1) for i in range(num_points)]
+
+    if scale == 'log':
+        # Space the FFT bin numbers, 1 to spectrum_len, evenly in log space
+        log_max = math.log(spectrum_len)
+        return [math.exp(log_max * i / (num_points - 1)) - 1.0 for i in range(num_points)]
+
+    if scale == 'mel':
+        if bin_width_hz is None:
+            raise ValueError("The mel scale needs the bin width, call set_bin_width first")
+
+        mel_min = hz_to_mel(bin_width_hz)
+        mel_max = hz_to_mel(bin_width_hz * spectrum_len)
+        mel_spacing = (mel_max - mel_min) / (num_points - 1)
+        return [mel_to_hz(mel_min + (mel_spacing * i)) / bin_width_hz - 1.0 for i in range(num_points)]
+
+    raise ValueError(f"Unknown filterbank scale {scale}, expected one of {scales}")
+
+
+class FilterBank:
+    '''
+    Sums the power of the spectrum into groups using overlapping triangular filters rather than hard edged ranges.
+    Each filter peaks at its center, fades to zero at its neighbors' centers and may fall between bins, in which case
+    the bins on either side share its weight.  When a display has more columns than there are low frequency bins
+    each column still gets its own blend of the nearby bins instead of a duplicate.
+
+    A filter only has weight on the few bins under its triangle, so only those taps are kept: the bin and weight of
+    every tap, filter after filter.  Each frame gathers the tapped bins, weights them, and sums each filter's taps
+    with a running total like RangeAggregator does.  That is the same handful of array operations however many
+    filters there are, and every array is allocated here.  Use get_filterbank to share filterbanks between displays
+    with the same layout.
+    '''
+
+    _bins: np.ndarray  # Spectrum index of every tap, grouped by filter
+    _weights: np.ndarray  # Weight of every tap
+    _products: np.ndarray  # Weighted power of every tap
+    _running_total: np.ndarray  # Entry i is the sum of _products[0:i]
+    _upper: np.ndarray  # Index into the running total for the end of each filter's taps
+    _lower: np.ndarray  # Index into the running total for the start of each filter's taps
+    _lower_totals: np.ndarray
+
+    @property
+    def num_groups(self) -> int:
+        return self._num_groups
+
+    @property
+    def spectrum_len(self) -> int:
+        return self._spectrum_len
+
+    @property
+    def num_taps(self) -> int:
+        '''Number of weights kept, across every filter'''
+        return len(self._weights)
+
+    def __init__(self, spectrum_len: int, num_groups: int, scale: str = 'log', bin_width_hz: float | None = None):
+        '''
+        :param spectrum_len: Length of the spectra that will be passed to aggregate
+        :param num_groups: Number of filters
+        :param scale: 'log', 'linear' or 'mel' spacing of the filter centers
+        :param bin_width_hz: Width of each spectrum bin, only used by the mel scale
+        '''
+        self._spectrum_len = spectrum_len
+        self._num_groups = num_groups
+
+        centers = _filter_centers(spectrum_len, num_groups, scale, bin_width_hz)
+
+        bins = []
+        weights = []
+        lower = []
+        for i_group in range(num_groups):
+            left, center, right = centers[i_group], centers[i_group + 1], centers[i_group + 2]
+
+            # A filter narrower than a bin would miss every bin, so each side spans at least one bin.  At that width
+            # the weights are a linear interpolation between the two bins around the center.
+            rise = max(center - left, 1.0)
+            fall = max(right - center, 1.0)
+
+            lower.append(len(weights))
+            for i_bin in range(max(0, math.floor(center - rise)), min(spectrum_len, math.ceil(center + fall) + 1)):
+                if i_bin <= center:
+                    weight = 1.0 - (center - i_bin) / rise
+                else:
+                    weight = 1.0 - (i_bin - center) / fall
+
+                if weight > 0:
+                    bins.append(i_bin)
+                    weights.append(weight)
+
+        num_taps = len(weights)
+        self._bins = np.array(bins, dtype=np.uint16)
+        self._weights = np.array(weights)
+        self._products = np.zeros(num_taps)
+        self._running_total = np.zeros(num_taps + 1)
+        self._running_total_after_first = self._running_total[1:]
+        self._lower = np.array(lower, dtype=np.uint16)
+        self._upper = np.array(lower[1:] + [num_taps], dtype=np.uint16)
+        self._lower_totals = np.zeros(num_groups)
+
+    def aggregate(self, spectrum: np.ndarray[float], out: np.ndarray[float] | None = None) -> np.ndarray[float]:
+        '''
+        :param spectrum: Power spectrum, must be spectrum_len long
+        :param out: Optional, array of num_groups floats to write the filtered power of each group into
+        :return: Filtered power of each group
+        '''
+        if out is None:
+            out = np.zeros(self._num_groups)
+        elif len(out) != self._num_groups:
+            raise ValueError("Output array has the wrong shape")
+
+        if len(spectrum) != self._spectrum_len:
+            raise ValueError("Spectrum length does not match the length the filterbank was built for")
+
+        products = self._products
+        np.take(spectrum, self._bins, out=products)
+        products *= self._weights
+        cumulative_sum(products, out=self._running_total_after_first)
+        np.take(self._running_total, self._upper, out=out)
+        np.take(self._running_total, self._lower, out=self._lower_totals)
+        out -= self._lower_totals
+        return out
+
+
+def get_filterbank(spectrum_len: int, num_groups: int, scale: str = 'log') -> FilterBank:
+    '''
+    Return a filterbank for the layout, building it the first time it is requested
+    '''
+    bin_width_hz = _bin_width_hz if scale == 'mel' else None
+    key = (spectrum_len, num_groups, scale, bin_width_hz)
+    filterbank = _filterbanks.get(key)
+    if filterbank is None:
+        filterbank = FilterBank(spectrum_len, num_groups, scale, bin_width_hz)
+        _filterbanks[key] = filterbank
+
+    return filterbank
+
+
+def build_aggregator(scale: str | None, range_cutoffs: np.ndarray[int], spectrum_len: int):
+    '''
+    Create the object a display uses to sum its spectrum into groups.  Both have the same aggregate method.
+    :param scale: A DisplaySettings.filterbank_scale.  None sums hard edged ranges with a RangeAggregator.
+    :param range_cutoffs: The display's range indicies, one more than the number of groups
+    :param spectrum_len: Length of the spectra that will be passed to aggregate
+    '''
+    if scale is None:
+        return RangeAggregator(range_cutoffs, spectrum_len)
+
+    return get_filterbank(spectrum_len, len(range_cutoffs) - 1, scale)
+
+
+def benchmark_filterbank(spectrum_len: int = 101, group_counts=(8, 12, 32, 72, 128, 256), iterations: int = 50):
+    '''
+    Compare the time per frame of get_freq_powers_by_range, RangeAggregator and a log FilterBank.  Also prints how
+    many groups each approach leaves without any power.
+    '''
+    spectrum = np.arange(0, spectrum_len) * 0.01 + 1.0
+    for num_groups in group_counts:
+        range_cutoffs = space_indicies(float_to_indicies(log_range(spectrum_len, num_groups)))
+        filterbank = FilterBank(spectrum_len, num_groups, 'log')
+        out = np.zeros(num_groups)
+
+        timings = []
+        for aggregate in (lambda values, out: get_freq_powers_by_range(values, range_cutoffs, out=out),
+                          RangeAggregator(range_cutoffs, spectrum_len).aggregate,
+                          filterbank.aggregate):
+            start = time.monotonic_ns()
+            for i in range(iterations):
+                aggregate(spectrum, out=out)
+            timings.append((time.monotonic_ns() - start) / iterations / 1000000)
+
+        # Spaced range indicies run past the end of the spectrum when there are more groups than bins
+        num_empty_ranges = sum(1 for i in range(num_groups) if range_cutoffs[i] >= spectrum_len)
+        num_empty_filters = sum(1 for value in filterbank.aggregate(spectrum) if value <= 0)
+        print(f'groups: {num_groups} loop: {timings[0]:0.3f}ms aggregator: {timings[1]:0.3f}ms '
+              f'filterbank: {timings[2]:0.3f}ms empty ranges: {num_empty_ranges} empty filters: {num_empty_filters}')
+
+
+if __name__ == '__main__':
+    benchmark_filterbank()
@@ -0,0 +1,136 @@
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
+import time
+import neopixel
+import stage_timing
+
+# A frame with only tiny changes is sent at most this often, so slow fades still reach the pixels
+tiny_delta_interval_ms = 100
+
+# The FrameBuffer that last sent a frame to each pixel object, keyed by id(pixels).  Display modes share pixels, so a
+# frame only matches what the strip shows if the same FrameBuffer sent the last one.
+_last_senders = {}
+
+
+class FrameBuffer:
+    '''
+    Holds a whole frame of pixel colors, in the strip's pixel order, as a num_pixels x 3 array of uint8 RGB.  A display
+    draws the frame with array operations and then sends it to the strip with a single slice assignment, so the pixel
+    library converts the colors and applies brightness in C instead of once per Python assignment.
+
+    The last frame sent is kept so show can skip frames identical to what the strip already displays, which is common
+    in quiet passages and at the end of fades.  Optionally, frames that change no color channel by more than
+    min_delta steps are rate limited as well.
+
+    The pixel libraries only accept a flat buffer with exactly bpp bytes per pixel, read as (r, g, b, w) colors.
+    DotStars and RGBW NeoPixels have 4, so for them the frame is copied into a wider buffer whose fourth byte is the
+    DotStar's per-pixel brightness, always full, or the NeoPixel's white channel, always off.
+    '''
+
+    pixels: neopixel.NeoPixel
+    _frame: np.ndarray  # num_pixels x 3 uint8 RGB, in pixel index order
+    _last_frame: np.ndarray  # The frame most recently sent to the strip
+    _send_buffer: np.ndarray | None  # num_pixels x bpp uint8 sent to strips with more than 3 bytes per pixel
+    _last_sent_ns: int
+    _frames_sent: int
+    _frames_skipped: int
+
+    @property
+    def num_pixels(self) -> int:
+        return self._num_pixels
+
+    @property
+    def frame(self) -> np.ndarray:
+        return self._frame
+
+    @property
+    def frames_sent(self) -> int:
+        '''Number of frames sent to the strip'''
+        return self._frames_sent
+
+    @property
+    def frames_skipped(self) -> int:
+        '''Number of frames not sent because the strip already showed them, or nearly did'''
+        return self._frames_skipped
+
+    def __init__(self, pixels: neopixel.NeoPixel, min_delta: int = 0):
+        '''
+        :param pixels: NeoPixel or DotStar object the frames are sent to
+        :param min_delta: Frames whose largest channel change is this many steps or fewer are sent at most every
+        tiny_delta_interval_ms.  0 sends every frame that changes.
+        '''
+        self.pixels = pixels
+        self.min_delta = min_delta
+        self._num_pixels = len(pixels)
+        self._frame = np.zeros((self._num_pixels, 3), dtype=np.uint8)
+        self._last_frame = np.zeros((self._num_pixels, 3), dtype=np.uint8)
+        self._send_buffer = None
+        bpp = getattr(pixels, 'bpp', 3)
+        if bpp > 3:
+            self._send_buffer = np.zeros((self._num_pixels, bpp), dtype=np.uint8)
+            # DotStar byte orders start with P, the brightness byte
+            if str(getattr(pixels, 'byteorder', '')).startswith('P'):
+                self._send_buffer[:, 3] = 255
+        self._last_sent_ns = 0
+        self._frames_sent = 0
+        self._frames_skipped = 0
+
+    def build_source_index(self, pixel_map: dict[int, int], num_values: int) -> np.ndarray:
+        '''
+        Invert a map of value index -> pixel index into, for each pixel, the index of the value it shows.  Pixels
+        without a value point at num_values, so callers should keep one extra value that is always off at the end.
+        :param pixel_map: Dictionary of value index -> pixel index
+        :param num_values: Number of values the display draws
+        :return: uint16 array of num_pixels value indicies
+        '''
+        source_index = np.zeros(self._num_pixels, dtype=np.uint16)
+        source_index[:] = num_values
+        for i_value, i_pixel in pixel_map.items():
+            source_index[i_pixel] = i_value
+
+        return source_index
+
+    def draw_levels(self, levels: np.ndarray, lut: np.ndarray) -> None:
+        '''
+        Color every pixel in one step
+        :param levels: uint16 array of num_pixels colormap levels, in pixel index order
+        :param lut: num_levels x 3 uint8 table, such as ColorMap.dimmed_lut
+        '''
+        np.take(lut, levels, axis=0, out=self._frame)
+
+    def _largest_change(self) -> int:
+        '''Largest change of any color channel between the frame and the last frame sent'''
+        # Subtracting the smaller value from the larger keeps the uint8 difference from wrapping around
+        difference = np.maximum(self._frame, self._last_frame) - np.minimum(self._frame, self._last_frame)
+        return int(np.max(difference))
+
+    def show(self) -> None:
+        '''Send the frame to the strip, unless the strip already shows it'''
+        start_ns = stage_timing.start()
+        now_ns = time.monotonic_ns()
+        if _last_senders.get(id(self.pixels)) is self:
+            change = self._largest_change()
+            if change == 0 or \
+                    (change <= self.min_delta and now_ns - self._last_sent_ns < tiny_delta_interval_ms * 1000000):
+                self._frames_skipped += 1
+                stage_timing.stop('show', start_ns)
+                return
+
+        if self._send_buffer is None:
+            self.pixels[:] = self._frame.tobytes()
+        else:
+            self._send_buffer[:, 0:3] = self._frame
+            self.pixels[:] = self._send_buffer.tobytes()
+        self.pixels.show()
+        stage_timing.stop('show', start_ns)
+
+        self._last_frame[:] = self._frame
+        self._last_sent_ns = now_ns
+        self._frames_sent += 1
+        _last_senders[id(self.pixels)] = self
+
+    def __str__(self) -> str:
+        return f'sent: {self._frames_sent} skipped: {self._frames_skipped}'
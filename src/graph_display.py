@@ -1,16 +1,14 @@
-import math
-
 import neopixel
-import ema
-import spectrum_shared
 from interfaces import IDisplay
+import stage_timing
+import filterbank
+from filterbank import FilterBank
 import ulab.numpy as np
 from display_settings import DisplaySettings
-from spectrum_shared import map_power_to_range, map_normalized_value_to_color, linear_range, \
-    map_float_color_to_neopixel_color, log_range, float_to_indicies, get_freq_powers_by_range, clip, space_indicies, \
-    map_normalized_power_to_range
-import display_range
-import simple_display_range
+from framebuffer import FrameBuffer
+from bar_graph import BarGraphRasterizer, map_columns_to_groups
+from spectrum_shared import linear_range, log_range, float_to_indicies, RangeAggregator, space_indicies
+import normalization
 import colormap
 from standard_colormaps import default_colormap
 
@@ -23,6 +21,11 @@ class GraphDisplay(IDisplay):
     pixel_values: list[list[tuple[int, int, int]]]  # Stores the values
     _range_indicies: np.array[int]
     _group_power: np.array[float]
+    _normalizer: normalization.Normalizer  # Scales _group_power to 0 to 1
+    _range_aggregator: RangeAggregator | FilterBank
+    _rasterizer: BarGraphRasterizer
+    _column_groups: np.array[int]  # Group shown by each column that has a range
+    _column_values: np.array[float]  # Normalized value of each column
     settings: DisplaySettings
 
     @property
@@ -33,6 +36,11 @@ class GraphDisplay(IDisplay):
     def num_total_groups(self) -> int:
         return self.num_visible_groups
 
+    @property
+    def framebuffer(self) -> FrameBuffer:
+        '''Holds the frames sent to the pixels, and counts how many were sent and skipped'''
+        return self._rasterizer.framebuffer
+
     @property
     def num_cols(self) -> int:
         return self.settings.num_cols
@@ -45,13 +53,18 @@ class GraphDisplay(IDisplay):
         self.pixels = pixels
         self.settings = settings
         self.pixel_indexer = settings.indexer
-        self._display_range = simple_display_range.SimpleDisplayRange(self.num_cols)
+        self._normalizer = normalization.build_normalizer(settings.normalization, self.num_cols)
         self._colormap = cmap if cmap is not None else default_colormap
 
         # self.pixel_indexer = self.default_row_column_indexer if row_column_indexer is None else row_column_indexer
         self._range_indicies = None
+        self._range_aggregator = None
         self._group_power = None
         self._pixel_map = self._build_pixel_map()
+        self._rasterizer = BarGraphRasterizer(pixels, self._pixel_map, self._colormap,
+                                              settings.min_frame_delta)
+        self._column_groups = None
+        self._column_values = np.zeros(self.num_cols)
 
     def _build_pixel_map(self):
         '''
@@ -84,15 +97,21 @@ class GraphDisplay(IDisplay):
         # display time
         if self._range_indicies is None:
             self._range_indicies = self._build_range_indicies(len(power_spectrum))
+            self._range_aggregator = filterbank.build_aggregator(self.settings.filterbank_scale,
+                                                                 self._range_indicies, len(power_spectrum))
+            self._group_power = np.zeros(self._range_aggregator.num_groups)
+            self._column_groups = np.array(map_columns_to_groups(self._range_indicies, len(self._group_power)),
+                                           dtype=np.uint16)
 
         # Create a histogram of power by
-        self._group_power = get_freq_powers_by_range(power_spectrum,
-                                                     self._range_indicies,
-                                                     out=self._group_power)
+        start_ns = stage_timing.start()
+        self._range_aggregator.aggregate(power_spectrum, out=self._group_power)
+        stage_timing.stop('aggregate', start_ns)
 
-        norm_values = self._display_range.get_normalized_values(self._group_power)
+        start_ns = stage_timing.start()
+        norm_values = self._normalizer.normalize(self._group_power)
+        stage_timing.stop('normalize', start_ns)
         if norm_values is None:
-            self._display_range.add(self._group_power)
             return
 
         # self._group_power = self._group_power * (self._group_power / 2.0)
@@ -104,70 +123,10 @@ class GraphDisplay(IDisplay):
 
         # print(f'n_groups: {len(self._group_power)} n_cutoff: {self.num_cutoff_groups}')
         # print(f'Min: {self.last_min_group_power} Max: {self.last_max_group_power}')
-        for i_col in range(0, len(self._group_power)):
-            i = i_col
-
-            if i + 1 >= len(self._range_indicies):
-                break
-
-            # Duplicate the previous columns output if there is no range available for this column
-            # This is not used when there are enough columns to display  or if the space_indicies is
-            # used on the _range_indicies
-            while self._range_indicies[i] == self._range_indicies[i + 1]:
-                i += 1
-                if i + 1 >= len(self._range_indicies):
-                    break
-
-            if i >= len(self._range_indicies) or i >= len(self._group_power):
-                break
-
-            # print(f"iCol: {i} Power: {self._group_power[i]}")
-
-            # Use the min/max values from the last loop.  We are comparing the new power spectrum to the past, not to
-            # its current value.
-
-            # min_val, max_val = self._display_range.get_group_minmax(i)
-            #
-            # #Rarely, (at startup), we have an identical min/max value.  For this case we do not light any column LEDs
-            # if min_val == max_val:
-            #     norm_value = 0
-            # else:
-            #     norm_value = (self._group_power[i] - min_val) / (max_val - min_val)
-            #     norm_value = clip(norm_value)
-
-            norm_value = norm_values[i]
-
-            # Calculate how many LEDs in the column will be illuminated
-            num_leds = int(math.ceil(self.num_rows * norm_value))
-            if num_leds > self.num_rows:
-                num_leds = self.num_rows
-
-            # Convert the power to an LED color.  To do this we determine which entry in the color lookup table is used.
-            # print(f'{norm_value} -> {self._range_indicies}')
-            i_range, norm_value = map_normalized_power_to_range(norm_value,
-                                                                range_cutoffs=self._colormap.range_cutoffs)
-            neo_color = map_normalized_value_to_color(normalized_value=norm_value, colormap_index=i_range,
-                                                      color_map=self._colormap.colors)
-
-            # Light each pixel in the column.  Look up the pixel's index, scale top pixel brightness according to normalized
-            # value and set all pixels below the top to full brightness
-            col_map = self._pixel_map[i_col]
-            for i_row in range(0, num_leds):
-                i_pixel = col_map[i_row]
-                if i_row == num_leds - 1:  # Dim the highest point of the bar graph according to normalized value to simulate extra range
-                    self.pixels[i_pixel] = map_float_color_to_neopixel_color(neo_color, norm_value)
-                else:
-                    self.pixels[i_pixel] = map_float_color_to_neopixel_color(neo_color)
-
-                # print(f'{i_col},{i_row}: num_leds {num_leds} norm_val: {norm_value} neo_color: {neo_color} pix: {self.pixels[i_pixel]}')
-
-            # Any pixels not illuminated are now turned off
-            for i_row in range(num_leds, self.num_rows):
-                i_pixel = col_map[i_row]
-                self.pixels[i_pixel] = (0, 0, 0)
-
-        # print(f'min: {self.last_min_group_power} max: {self.last_max_group_power}')
-        # Send the all pixel values to the NeoPixel display
-        self.pixels.show()
-
-        self._display_range.add(self._group_power)
+
+        # Each column shows the group chosen for it when the range indicies were built.  Columns without a range stay off.
+        num_drawn = len(self._column_groups)
+        np.take(norm_values, self._column_groups, out=self._column_values[:num_drawn])
+
+        # Light each column to a height set by its normalized value and send the pixel values to the display
+        self._rasterizer.draw(self._column_values)
@@ -0,0 +1,60 @@
+import gc
+
+from interfaces import IDisplay
+
+
+def display_mode_factory(module_name: str, class_name: str, *args, **kwargs) -> Callable[[], IDisplay]:
+    '''
+    Describe a display mode without building it, or importing the module it is in
+    :param module_name: Module the display class is in, such as 'graph_display'
+    :param class_name: Name of the display class, such as 'GraphDisplay'
+    :param args: Passed to the display class along with kwargs
+    :return: A function that imports the module and builds the display mode
+    '''
+    def build() -> IDisplay:
+        module = __import__(module_name)
+        return getattr(module, class_name)(*args, **kwargs)
+
+    return build
+
+
+class LazyDisplayModes:
+    '''
+    The display modes of a board, each built the first time it is selected.  Boards have several modes, and each one
+    allocates its pixel maps, color tables and normalizer, so building them all at boot is slow and holds memory for
+    modes that are not being shown.  Only the selected mode is kept.  Selecting another one lets the previous mode be
+    collected, and selecting it again later builds it from scratch.
+
+    Indexing and iterating work like the tuple of display modes this replaces.
+    '''
+
+    _factories: tuple
+    _index: int | None  # Index of the mode that is built
+    _mode: IDisplay | None
+
+    def __init__(self, factories):
+        '''
+        :param factories: A function for each mode that builds it, such as display_mode_factory returns
+        '''
+        self._factories = tuple(factories)
+        self._index = None
+        self._mode = None
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def __getitem__(self, index: int) -> IDisplay:
+        if index < 0:
+            index += len(self._factories)
+        if index < 0 or index >= len(self._factories):
+            raise IndexError('display mode index out of range')
+
+        if index != self._index:
+            # Free the previous mode before building the next, so both are never in memory at once
+            self._mode = None
+            self._index = None
+            gc.collect()
+            self._mode = self._factories[index]()
+            self._index = index
+
+        return self._mode
@@ -0,0 +1,135 @@
+import array
+import math
+
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
+
+class LogHistogram:
+    '''
+    Running percentiles, such as the noise floor and the peak level, of one or more channels of positive values
+    without keeping any history.  Each channel counts its values in num_bins bins spaced evenly on a log scale from
+    min_value to max_value, so the memory used never grows.  Values outside of the range count in the first or last
+    bin.
+
+    Old values are forgotten exponentially: a value counts half as much after half_life more values are added.  Rather
+    than scaling every count down each time, each new value counts for more than the last, and the counts are scaled
+    down together only when the weight gets large.
+
+    Each percentile remembers the bin it is in and the total count of the bins below it.  A new value moves it by a
+    bin or two at most, so adding a value is a bucket increment and a few comparisons per channel, however many bins
+    there are.  The percentile is interpolated within its bin, which keeps it from jumping a whole bin at a time.
+    '''
+
+    _counts: list[array.array]  # Weighted count of the values in each bin, for each channel
+    _total: float  # Sum of the counts of one channel.  Every channel has the same total.
+    _weight: float  # What the next value adds to its bin
+    _percentile_bins: list[list[int]]  # For each percentile, the bin each channel's percentile is in
+    _counts_below: list[list[float]]  # For each percentile, the total count of the bins below its bin
+    _levels: list[np.ndarray]  # Latest estimate of each percentile for each channel
+
+    @property
+    def num_channels(self) -> int:
+        return len(self._counts)
+
+    @property
+    def is_empty(self) -> bool:
+        '''True until a value is added.  The levels are 0 until then.'''
+        return self._total == 0
+
+    @property
+    def levels(self) -> list[np.ndarray]:
+        '''
+        The value of each channel at each of the percentiles.  The arrays are updated in place.
+        '''
+        return self._levels
+
+    def __init__(self, num_channels: int, percentiles=(0.1, 0.98), min_value: float = 1.0,
+                 max_value: float = 32768.0, num_bins: int = 64, half_life: float = 350):
+        '''
+        :param percentiles: Fractions from 0 to 1 to estimate, such as 0.1 for the 10th percentile
+        :param min_value: Lower edge of the first bin.  Must be larger than 0.
+        :param max_value: Upper edge of the last bin
+        :param half_life: Number of values after which a value counts half as much
+        '''
+        self._percentiles = tuple(percentiles)
+        self._log_min_value = math.log(min_value)
+        self._bins_per_log = num_bins / (math.log(max_value) - self._log_min_value)
+        self._num_bins = num_bins
+        self._growth = 2 ** (1.0 / half_life)
+
+        self._counts = [array.array('f', [0.0] * num_bins) for i_channel in range(num_channels)]
+        self._total = 0
+        self._weight = 1.0
+        self._percentile_bins = [[0] * num_channels for percentile in self._percentiles]
+        self._counts_below = [[0.0] * num_channels for percentile in self._percentiles]
+        self._levels = [np.zeros(num_channels) for percentile in self._percentiles]
+        self._bins = np.zeros(num_channels)
+
+    def add(self, values) -> None:
+        '''
+        Count one value for every channel and move the percentiles
+        :param values: ndarray with a value for each channel.  Values of 0 or less count in the first bin.
+        '''
+        bins = self._bins
+        bins[:] = values
+        bins[bins < 1e-30] = 1e-30
+        bins[:] = np.log(bins)
+        bins -= self._log_min_value
+        bins *= self._bins_per_log
+        bins[bins < 0] = 0
+        bins[bins > self._num_bins - 1] = self._num_bins - 1
+
+        weight = self._weight
+        self._total += weight
+        for i_channel in range(len(self._counts)):
+            counts = self._counts[i_channel]
+            i_bin = int(bins[i_channel])
+            counts[i_bin] += weight
+
+            for i_percentile in range(len(self._percentiles)):
+                target = self._percentiles[i_percentile] * self._total
+                percentile_bins = self._percentile_bins[i_percentile]
+                counts_below = self._counts_below[i_percentile]
+                percentile_bin = percentile_bins[i_channel]
+                below = counts_below[i_channel]
+                if i_bin < percentile_bin:
+                    below += weight
+
+                # Step down while the bins below hold more than the target, then up while this bin does not reach it
+                while percentile_bin > 0 and below > target:
+                    percentile_bin -= 1
+                    below -= counts[percentile_bin]
+                while percentile_bin < self._num_bins - 1 and below + counts[percentile_bin] < target:
+                    below += counts[percentile_bin]
+                    percentile_bin += 1
+
+                percentile_bins[i_channel] = percentile_bin
+                counts_below[i_channel] = below
+                in_bin = counts[percentile_bin]
+                fraction = (target - below) / in_bin if in_bin > 0 else 0
+                fraction = 0 if fraction < 0 else 1 if fraction > 1 else fraction
+                self._levels[i_percentile][i_channel] = math.exp(self._log_min_value +
+                                                                 (percentile_bin + fraction) / self._bins_per_log)
+
+        # Scale everything down before the weights lose precision in float32
+        self._weight *= self._growth
+        if self._weight > 1000:
+            self._rescale(1.0 / self._weight)
+            self._weight = 1.0
+
+    def _rescale(self, scale: float) -> None:
+        '''Multiply every count by scale, and sum the counts below each percentile again to drop rounding errors'''
+        self._total *= scale
+        for i_channel in range(len(self._counts)):
+            counts = self._counts[i_channel]
+            for i_bin in range(self._num_bins):
+                counts[i_bin] *= scale
+
+            for percentile_bins, counts_below in zip(self._percentile_bins, self._counts_below):
+                below = 0.0
+                for i_bin in range(percentile_bins[i_channel]):
+                    below += counts[i_bin]
+                counts_below[i_channel] = below
@@ -0,0 +1,293 @@
+import ema
+import ulab.numpy as np
+from log_histogram import LogHistogram
+
+
+class Normalizer:
+    '''
+    Tracks groups of numbers, such as a display's group powers, and scales each frame of them to 0 to 1 relative to
+    the level they have had over time.  The device exists in an environment with a variable amount of noise, so the
+    display should be relative to the ambient level rather than to a fixed range.
+
+    normalize scales a frame with the state built from the frames before it, then adds the frame to that state.  The
+    frame is raised to exponent once, and both steps use that one transformed vector.  Every array is allocated when
+    the normalizer is built and updated in place.
+
+    Subclasses are the strategies.  They implement _start, which sets the state from the first frame,
+    _normalize_into, which writes the scaled frame, and _update, which adds a frame to the state.
+    '''
+
+    num_groups: int
+    _exponent: float
+    _transformed: np.ndarray  # The latest frame raised to exponent
+    _normalized: np.ndarray  # Returned by normalize, overwritten every frame
+    _started: bool
+
+    @property
+    def exponent(self) -> float:
+        '''Power each value is raised to before it is tracked.  Above 1 stretches the loud end of the range.'''
+        return self._exponent
+
+    @property
+    def transformed(self) -> np.ndarray:
+        '''The latest frame raised to exponent'''
+        return self._transformed
+
+    def __init__(self, num_groups: int, exponent: float = 1.0):
+        self.num_groups = num_groups
+        self._exponent = exponent
+        self._transformed = np.zeros(num_groups)
+        self._normalized = np.zeros(num_groups)
+        self._started = False
+
+    def normalize(self, group_power: np.ndarray) -> np.ndarray | None:
+        '''
+        Scale a frame to 0 to 1, then add it to the tracked range
+        :param group_power: Value of each group
+        :return: The normalized values, clipped to 0 to 1, or None for the first frame, which only starts the range.
+        The array is reused by the next call.
+        '''
+        if len(group_power) != self.num_groups:
+            raise ValueError("Expected group length to match num_groups")
+
+        transformed = self._transformed
+        transformed[:] = group_power
+        if self._exponent != 1:
+            transformed **= self._exponent
+
+        if not self._started:
+            self._start(transformed)
+            self._started = True
+            return None
+
+        result = self._normalized
+        self._normalize_into(transformed, result)
+        # A group that has only ever been silent has a range of 0, and 0 / 0 is NaN, which fails every comparison.  It
+        # is shown as 0 rather than left for the displays to turn into a level.
+        result[result != result] = 0
+        result[result > 1] = 1.0
+        result[result < 0] = 0
+        self._update(transformed)
+        return result
+
+    def _start(self, transformed: np.ndarray) -> None:
+        raise NotImplementedError()
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        raise NotImplementedError()
+
+    def _update(self, transformed: np.ndarray) -> None:
+        raise NotImplementedError()
+
+
+class PeakDecayNormalizer(Normalizer):
+    '''
+    Each group is scaled between the lowest value it has had and its peak, which slowly decays so the display
+    recovers after loud sounds.  Values are raised to 1.5 first.  This is what SimpleDisplayRange did.
+    '''
+
+    _groups_max_power: np.ndarray
+    _groups_min_power: np.ndarray
+
+    def __init__(self, num_groups: int, exponent: float = 1.5, decay: float = 0.999):
+        '''
+        :param decay: The peaks are multiplied by this every frame
+        '''
+        super().__init__(num_groups, exponent)
+        self._decay = decay
+        self._groups_max_power = np.zeros(num_groups)
+        self._groups_min_power = np.zeros(num_groups)
+
+    def _start(self, transformed: np.ndarray) -> None:
+        self._groups_max_power[:] = transformed
+        self._groups_min_power[:] = transformed
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        out[:] = transformed
+        out -= self._groups_min_power
+        out /= self._groups_max_power
+
+    def _update(self, transformed: np.ndarray) -> None:
+        groups_max_power = self._groups_max_power
+        groups_max_power *= self._decay
+        rising = transformed > groups_max_power
+        groups_max_power[rising] = transformed[rising]
+
+        groups_min_power = self._groups_min_power
+        falling = transformed < groups_min_power
+        groups_min_power[falling] = transformed[falling]
+
+
+class EMANormalizer(Normalizer):
+    '''
+    Each group is scaled by a ceiling that jumps up to new peaks immediately and falls back as an exponential moving
+    average, see ema.EMABank.  Unlike PeakDecayNormalizer there is no floor, and quiet groups recover quickly.
+    '''
+
+    _ceilings: ema.EMABank
+
+    def __init__(self, num_groups: int, exponent: float = 1.5, num_samples: int = 200, smooth: float = 2):
+        '''
+        :param num_samples: Frames the ceilings average over on their way down
+        '''
+        super().__init__(num_groups, exponent)
+        self._ceilings = ema.EMABank(num_groups, num_samples, smooth, instant_attack=True)
+
+    def _start(self, transformed: np.ndarray) -> None:
+        self._ceilings.reset(transformed)
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        out[:] = transformed
+        out /= self._ceilings.values
+
+    def _update(self, transformed: np.ndarray) -> None:
+        self._ceilings.add(transformed)
+
+
+class WindowNormalizer(Normalizer):
+    '''
+    Each group is scaled between the lowest and highest values it had in the last num_frames frames, which are kept in
+    a ring of rows.  A loud sound stops affecting the range as soon as it leaves the window.
+    '''
+
+    _window: np.ndarray  # num_frames x num_groups ring of the latest transformed frames
+    _head: int  # Row of the newest frame
+    _groups_min_power: np.ndarray
+    _groups_power_range: np.ndarray  # Max - min of each group
+
+    def __init__(self, num_groups: int, exponent: float = 1.5, num_frames: int = 64):
+        super().__init__(num_groups, exponent)
+        self._window = np.zeros((num_frames, num_groups))
+        self._head = 0
+        self._groups_min_power = np.zeros(num_groups)
+        self._groups_power_range = np.zeros(num_groups)
+
+    def _start(self, transformed: np.ndarray) -> None:
+        for i in range(len(self._window)):
+            self._window[i, :] = transformed
+        self._groups_min_power[:] = transformed
+        self._groups_power_range[:] = 0
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        out[:] = transformed
+        out -= self._groups_min_power
+        out /= self._groups_power_range
+
+    def _update(self, transformed: np.ndarray) -> None:
+        self._head = self._head + 1 if self._head + 1 < len(self._window) else 0
+        self._window[self._head, :] = transformed
+        self._groups_min_power[:] = np.min(self._window, axis=0)
+        self._groups_power_range[:] = np.max(self._window, axis=0)
+        self._groups_power_range -= self._groups_min_power
+
+
+class PercentileNormalizer(Normalizer):
+    '''
+    Each group is scaled between its noise floor and its peak level, the 10th and 98th percentiles of its values over
+    the last few hundred frames.  They come from a histogram that takes the same memory however long it runs, see
+    log_histogram.py.  A click or a single loud frame barely moves either of them.
+    '''
+
+    _levels: LogHistogram
+    _groups_power_range: np.ndarray  # Peak level - noise floor of each group
+
+    def __init__(self, num_groups: int, exponent: float = 1.5, floor: float = 0.1, peak: float = 0.98,
+                 half_life: float = 350):
+        '''
+        :param floor: Percentile shown as 0
+        :param peak: Percentile shown as 1
+        :param half_life: Frames after which a frame counts half as much towards the percentiles
+        '''
+        super().__init__(num_groups, exponent)
+        # Group powers raised to exponent span many decades, and squared ones even more
+        self._levels = LogHistogram(num_groups, percentiles=(floor, peak), min_value=1e-6, max_value=1e12,
+                                    num_bins=72, half_life=half_life)
+        self._groups_power_range = np.zeros(num_groups)
+
+    def _start(self, transformed: np.ndarray) -> None:
+        self._levels.add(transformed)
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        floor, peak = self._levels.levels
+        power_range = self._groups_power_range
+        power_range[:] = peak
+        power_range -= floor
+
+        out[:] = transformed
+        out -= floor
+        out /= power_range
+
+    def _update(self, transformed: np.ndarray) -> None:
+        self._levels.add(transformed)
+
+
+class TotalPowerNormalizer(Normalizer):
+    '''
+    All groups share one scale, set by where the total power sits between a slowly decaying min and max, and each
+    group is shown relative to the loudest group.  This is what DisplayRange did.
+    '''
+
+    _ema_total_power: ema.EMA
+    _max_individual_group_power: float
+    _scaled_total_power: float
+    last_min_total_power: float
+    last_max_total_power: float
+
+    def __init__(self, num_groups: int, exponent: float = 1.0):
+        super().__init__(num_groups, exponent)
+        self.last_max_total_power = 0
+        self.last_min_total_power = 1 << 15
+        self._max_individual_group_power = 0
+        self._scaled_total_power = 0
+        self._ema_total_power = ema.EMA(500, 1.1)
+
+    def _start(self, transformed: np.ndarray) -> None:
+        self._update(transformed)
+
+    def _normalize_into(self, transformed: np.ndarray, out: np.ndarray) -> None:
+        out[:] = transformed
+        out /= self._ema_total_power.ema_value
+        out /= self._max_individual_group_power
+        out *= self._scaled_total_power
+
+    def _update(self, transformed: np.ndarray) -> None:
+        '''
+        Track the min/max total power, but have them slowly decay to the mean power level.  The current total power
+        moves the min/max if it is outside of them.
+        '''
+        total_power = np.sum(transformed)
+        self._ema_total_power.add(total_power)
+        ema_total_power = self._ema_total_power.ema_value
+        self._max_individual_group_power = np.max(transformed) / ema_total_power
+
+        self.last_min_total_power = min(self.last_min_total_power * 1.005, total_power, ema_total_power, 300)
+        self.last_max_total_power = max(self.last_max_total_power * .995, total_power, ema_total_power)
+        if self.last_min_total_power < 200:
+            self.last_min_total_power = 200
+
+        min_power = self.last_min_total_power
+        scaled_power_range = self.last_max_total_power - min_power
+        if scaled_power_range != 0:
+            self._scaled_total_power = (total_power - min_power) / scaled_power_range
+        else:
+            self._scaled_total_power = total_power / ema_total_power
+
+
+normalizers = {
+    'peak decay': PeakDecayNormalizer,
+    'ema': EMANormalizer,
+    'window': WindowNormalizer,
+    'percentile': PercentileNormalizer,
+    'total power': TotalPowerNormalizer,
+}
+
+
+def build_normalizer(name: str, num_groups: int) -> Normalizer:
+    '''
+    Create the normalizer a display scales its group powers with
+    :param name: A DisplaySettings.normalization, one of the keys of normalizers
+    '''
+    if name not in normalizers:
+        raise ValueError(f'Unknown normalization {name}.  Expected one of {", ".join(normalizers)}')
+
+    return normalizers[name](num_groups)
@@ -1,3 +1,8 @@
+try:
+    import ulab.numpy as np
+except ModuleNotFoundError:
+    import numpy as np
+
 import ema
 
 
@@ -6,21 +11,20 @@ class PixelEMA:
     Accumulates values over time, calculating an exponential moving average over time
     '''
 
-    _R: ema.EMA
-    _G: ema.EMA
-    _B: ema.EMA
+    _channels: ema.EMABank  # Red, green and blue
+    _value: np.ndarray  # The color being added, as the array the bank takes
 
     def __init__(self, num_samples: int, smooth: float = 2):
-        self._R = ema.EMA(num_samples, smooth)
-        self._G = ema.EMA(num_samples, smooth)
-        self._B = ema.EMA(num_samples, smooth)
+        self._channels = ema.EMABank(3, num_samples, smooth)
+        self._value = np.zeros(3)
 
     @property
     def ema_value(self) -> tuple[float, float, float]:
-        return self._R.ema_value, self._G.ema_value, self._B.ema_value
+        values = self._channels.values
+        return values[0], values[1], values[2]
 
     def add(self, value: tuple[float, float, float]):
         #print(f'add {value}')
-        self._R.add(value[0])
-        self._G.add(value[1])
-        self._B.add(value[2])
+        channels = self._value
+        channels[0], channels[1], channels[2] = value
+        self._channels.add(channels)
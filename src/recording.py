@@ -1,5 +1,8 @@
 import math
+import time
 import ulab.numpy as np
+import ulab.utils
+from ulab.scipy import signal
 import recording_settings
 
 def get_frequencies(settings: recording_settings.RecordingSettings):
@@ -9,9 +12,9 @@ def get_frequencies(settings: recording_settings.RecordingSettings):
     :param settings:
     :return:
     '''
-    frequency_bin_width = settings.sample_rate / settings.sample_size
-    frequencies = np.arange(0, (frequency_bin_width * settings.sample_size) / 2.0, frequency_bin_width)
-    print(f"bin width: {frequency_bin_width} n_samples: {settings.sample_size}\nfrequencies: {frequencies}")
+    frequency_bin_width = settings.analysis_sample_rate / settings.analysis_size
+    frequencies = np.arange(0, (frequency_bin_width * settings.analysis_size) / 2.0, frequency_bin_width)
+    # print(f"bin width: {frequency_bin_width} n_samples: {settings.analysis_size}\nfrequencies: {frequencies}")
     return frequencies
 
 def get_frequency_index(frequencies: np.array,  value: float):
@@ -72,4 +75,308 @@ def get_cutoff_frequency_index(settings: recording_settings.RecordingSettings):
     :return:
     '''
     frequencies = get_cutoff_frequency_index(settings)
-    return get_frequency_index(frequencies, settings.frequency_cutoff)
\ No newline at end of file
+    return get_frequency_index(frequencies, settings.frequency_cutoff)
+
+
+def calculate_lowpass_sos(cutoff_hz: float, sample_rate: float, order: int = 4) -> np.ndarray:
+    '''
+    Calculates a Butterworth low-pass filter as second order sections for ulab.scipy.signal.sosfilt.  Each row is
+    b0, b1, b2, a0, a1, a2.  The filter is built from biquads whose Q values place the poles of a Butterworth filter.
+    :param cutoff_hz: Frequency where the response is down 3dB
+    :param sample_rate: Rate of the samples the filter will be applied to
+    :param order: Must be even
+    :return: order / 2 rows of six coefficients
+    '''
+    if order < 2 or order % 2 != 0:
+        raise ValueError("Low-pass filter order must be an even number")
+
+    w0 = 2.0 * math.pi * cutoff_hz / sample_rate
+    cos_w0 = math.cos(w0)
+    sections = []
+    for k in range(1, (order // 2) + 1):
+        q = 1.0 / (2.0 * math.cos((2 * k - 1) * math.pi / (2 * order)))
+        alpha = math.sin(w0) / (2.0 * q)
+        a0 = 1.0 + alpha
+        b0 = (1.0 - cos_w0) / 2.0 / a0
+        sections.append([b0, 2.0 * b0, b0, 1.0, -2.0 * cos_w0 / a0, (1.0 - alpha) / a0])
+
+    return np.array(sections)
+
+
+class Decimator:
+    '''
+    Anti-alias filters and downsamples a stream of recordings.  The filter state carries over between calls so
+    consecutive recordings are filtered as one continuous signal.
+    '''
+
+    _sos: np.ndarray
+    _zi: np.ndarray | None  # Filter state, None until the first recording primes it
+    _work: np.ndarray
+
+    @property
+    def factor(self) -> int:
+        return self._factor
+
+    def __init__(self, settings: recording_settings.RecordingSettings, order: int = 4):
+        '''
+        :param settings: Decimation factor, frequency cutoff and hop size are taken from the settings
+        :param order: Order of the Butterworth anti-alias filter
+        '''
+        self._factor = settings.decimation
+        self._sos = calculate_lowpass_sos(settings.frequency_cutoff, settings.sample_rate, order)
+        self._zi = None
+        self._work = np.zeros(settings.hop_size)
+
+    def _prime(self, value: float) -> None:
+        '''
+        Set the filter state as if it had been fed value forever.  Without this the DC offset of the microphone
+        arrives as a step and rings through the first windows.
+        '''
+        self._zi = np.zeros((len(self._sos), 2))
+        for i, section in enumerate(self._sos):
+            b0, b1, b2, a0, a1, a2 = section
+            output = value * (b0 + b1 + b2) / (1.0 + a1 + a2)
+            self._zi[i, 0] = output - b0 * value
+            self._zi[i, 1] = b2 * value - a2 * output
+            value = output
+
+    def process(self, samples) -> np.ndarray:
+        '''
+        :param samples: array.array("H") from the ADC or an ndarray, length must be a multiple of the factor
+        :return: Filtered samples, one for every factor input samples
+        '''
+        if not isinstance(samples, np.ndarray):
+            samples = np.frombuffer(samples, dtype=np.uint16)
+
+        work = self._work if len(samples) == len(self._work) else np.zeros(len(samples))
+        work[:] = samples
+
+        if self._zi is None:
+            self._prime(work[0])
+
+        filtered, self._zi = signal.sosfilt(self._sos, work, zi=self._zi)
+        return filtered[::self._factor]
+
+
+class RealSpectrum:
+    '''
+    Calculates the magnitude spectrum of a real valued recording, but only for the bins we display.
+
+    A real recording of N samples is packed into N/2 complex values, even samples as the real part and odd samples as
+    the imaginary part.  This halves the size of the FFT.  The spectrum of the real recording is then untangled from
+    the packed FFT, but only for the first num_bins bins.  The bins above the frequency cutoff are never calculated.
+    The result matches ulab.utils.spectrogram(samples)[0:num_bins].
+
+    Optionally the Hanning filter is applied to the spectrum instead of the recording.  Multiplying by the Hanning
+    filter in time is the same as mixing each bin with its neighbors, X[k] / 2 - (X[k-1] + X[k+1]) / 4, so the
+    recording can go to the FFT as integers without a pass to convert and filter it.
+    '''
+
+    _cos: np.ndarray  # Twiddle factors for bins 1 to num_computed - 1
+    _sin: np.ndarray
+    _x_real: np.ndarray  # Twice the complex spectrum for bins 0 to num_computed - 1
+    _x_imag: np.ndarray
+    _sample_sum: float  # Sum of the last recording, which is bin 0 of its FFT
+
+    @property
+    def fft_size(self) -> int:
+        return self._fft_size
+
+    @property
+    def num_bins(self) -> int:
+        return self._num_bins
+
+    @property
+    def hanning(self) -> bool:
+        '''True if the Hanning filter is applied to the spectrum'''
+        return self._hanning
+
+    @property
+    def sample_sum(self) -> float:
+        '''Sum of the samples of the last recording computed.  The FFT's bin 0 is this sum, so it costs nothing.'''
+        return self._sample_sum
+
+    def __init__(self, fft_size: int, num_bins: int, hanning: bool = False):
+        '''
+        :param fft_size: Number of real samples in each recording, must be a power of two
+        :param num_bins: Number of bins to calculate, starting with bin 0.  Usually get_frequency_index(...).
+        :param hanning: Apply the Hanning filter to the spectrum.  Do not also filter the recording.
+        '''
+        half_size = fft_size >> 1
+        max_bins = half_size - 1 if hanning else half_size
+        if num_bins < 1 or num_bins > max_bins:
+            raise ValueError(f"num_bins must be between 1 and {max_bins}")
+
+        self._fft_size = fft_size
+        self._num_bins = num_bins
+        self._hanning = hanning
+
+        # The Hanning filter needs the bin above the last one we display
+        num_computed = num_bins + 1 if hanning else num_bins
+        self._num_computed = num_computed
+
+        angles = np.arange(1, num_computed) * (2.0 * math.pi / fft_size)
+        self._cos = np.cos(angles)
+        self._sin = np.sin(angles)
+
+        self._even_real = np.zeros(num_computed - 1)
+        self._even_imag = np.zeros(num_computed - 1)
+        self._odd_real = np.zeros(num_computed - 1)
+        self._odd_imag = np.zeros(num_computed - 1)
+        self._x_real = np.zeros(num_computed)
+        self._x_imag = np.zeros(num_computed)
+        self._sample_sum = 0.0
+
+        # Views are created once here rather than every frame
+        self._x_real_above_dc = self._x_real[1:]
+        self._x_imag_above_dc = self._x_imag[1:]
+
+        if hanning:
+            self._y_real = np.zeros(num_bins)
+            self._y_imag = np.zeros(num_bins)
+            self._y_real_above_dc = self._y_real[1:]
+            self._y_imag_above_dc = self._y_imag[1:]
+            self._x_real_below = self._x_real[0:num_bins - 1]
+            self._x_imag_below = self._x_imag[0:num_bins - 1]
+            self._x_real_center = self._x_real[0:num_bins]
+            self._x_imag_center = self._x_imag[0:num_bins]
+
+        # Every step leaves the spectrum doubled, this undoes it inside the square root
+        self._magnitude_scale = 0.0625 if hanning else 0.25
+
+    def _untangle(self, samples: np.ndarray) -> None:
+        '''
+        Fill _x_real and _x_imag with twice the complex spectrum of the recording
+        '''
+        half_size = self._fft_size >> 1
+        num_computed = self._num_computed
+
+        z_real, z_imag = np.fft.fft(samples[0::2], samples[1::2])
+
+        # DC is the sum of the even and odd halves
+        self._sample_sum = float(z_real[0] + z_imag[0])
+        self._x_real[0] = 2.0 * self._sample_sum
+        self._x_imag[0] = 0
+        if num_computed == 1:
+            return
+
+        # For bin k the packed FFT mixes Z[k] with the conjugate of Z[N/2 - k].  Read both as slices.
+        a_real = z_real[1:num_computed]
+        a_imag = z_imag[1:num_computed]
+        b_real = z_real[half_size - 1:half_size - num_computed:-1]
+        b_imag = z_imag[half_size - 1:half_size - num_computed:-1]
+
+        # The arithmetic below is done in place in preallocated arrays so each frame does not create garbage
+        even_real = self._even_real
+        even_real[:] = a_real
+        even_real += b_real
+
+        even_imag = self._even_imag
+        even_imag[:] = a_imag
+        even_imag -= b_imag
+
+        odd_real = self._odd_real
+        odd_real[:] = a_imag
+        odd_real += b_imag
+
+        odd_imag = self._odd_imag
+        odd_imag[:] = b_real
+        odd_imag -= a_real
+
+        # X[k] = (even + exp(-2 pi i k / N) * odd) / 2
+        # x_real = even_real + cos * odd_real + sin * odd_imag
+        x_real = self._x_real_above_dc
+        x_real[:] = self._cos
+        x_real *= odd_real
+        x_real += even_real
+        even_real[:] = self._sin  # even_real is no longer needed, reuse it as scratch space
+        even_real *= odd_imag
+        x_real += even_real
+
+        # x_imag = even_imag + cos * odd_imag - sin * odd_real
+        x_imag = self._x_imag_above_dc
+        x_imag[:] = self._cos
+        x_imag *= odd_imag
+        x_imag += even_imag
+        odd_real *= self._sin
+        x_imag -= odd_real
+
+    def _mix_neighbors(self, y: np.ndarray, y_above_dc: np.ndarray,
+                       x: np.ndarray, x_above: np.ndarray, x_below: np.ndarray) -> None:
+        '''
+        y[k] = x[k] - (x[k-1] + x[k+1]) / 2, without the x[k-1] term for bin 0
+        '''
+        y[:] = x_above
+        y_above_dc += x_below
+        y *= -0.5
+        y += x
+
+    def _apply_hanning(self) -> None:
+        '''
+        Fill _y_real and _y_imag with twice the filtered spectrum, X[k] - (X[k-1] + X[k+1]) / 2
+        '''
+        self._mix_neighbors(self._y_real, self._y_real_above_dc,
+                            self._x_real_center, self._x_real_above_dc, self._x_real_below)
+        self._mix_neighbors(self._y_imag, self._y_imag_above_dc,
+                            self._x_imag_center, self._x_imag_above_dc, self._x_imag_below)
+
+        # The bin below DC is the conjugate of bin 1
+        self._y_real[0] -= 0.5 * self._x_real[1]
+        self._y_imag[0] += 0.5 * self._x_imag[1]
+
+    def compute(self, samples: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        '''
+        :param samples: fft_size real samples
+        :param out: Optional, array of num_bins floats to write the magnitudes into
+        :return: Magnitude of bins 0 to num_bins - 1
+        '''
+        if out is None:
+            out = np.zeros(self._num_bins)
+
+        self._untangle(samples)
+
+        if self._hanning:
+            self._apply_hanning()
+            real, imag = self._y_real, self._y_imag
+        else:
+            real, imag = self._x_real, self._x_imag
+
+        # Magnitude, with the scaling moved inside the square root
+        real *= real
+        imag *= imag
+        real += imag
+        real *= self._magnitude_scale
+        real **= 0.5
+        out[:] = real
+        return out
+
+
+def benchmark_spectrum_engines(settings_by_name: dict, iterations: int = 20):
+    '''
+    Compare the full ulab.utils.spectrogram followed by a crop against RealSpectrum for each RecordingSettings.
+    Prints the mean time per frame for each and the largest difference between their results.
+    :param settings_by_name: Dictionary of name -> RecordingSettings, such as sampling_settings in code.py
+    :param iterations: Number of frames to time for each engine
+    '''
+    for name, settings in settings_by_name.items():
+        frequencies = get_frequencies(settings)
+        max_freq_index = get_frequency_index(frequencies, settings.frequency_cutoff)
+        engine = RealSpectrum(settings.analysis_size, max_freq_index)
+        out = np.zeros(max_freq_index)
+
+        angles = np.arange(0, settings.analysis_size) * (2.0 * math.pi * 37.0 / settings.analysis_size)
+        samples = np.sin(angles) * calculate_hanning_filter(settings.analysis_size)
+
+        start = time.monotonic_ns()
+        for i in range(iterations):
+            full_spectrum = ulab.utils.spectrogram(samples)[0:max_freq_index]
+        full_ns = (time.monotonic_ns() - start) // iterations
+
+        start = time.monotonic_ns()
+        for i in range(iterations):
+            engine.compute(samples, out=out)
+        real_ns = (time.monotonic_ns() - start) // iterations
+
+        max_error = np.max(abs(full_spectrum - out))
+        print(f'{name}: bins: {max_freq_index} spectrogram: {full_ns / 1000000:0.2f}ms '
+              f'real fft: {real_ns / 1000000:0.2f}ms max error: {max_error}')
@@ -1,8 +1,15 @@
+# Largest factor the decimating front-end may divide the sample rate by
+max_decimation = 32
+
 
 class RecordingSettings():
     _sample_size: int #Must be a power of two
     _sample_rate: int
     _freq_cutoff: int #The highest frequency we want to display
+    _hop_size: int #Number of new samples captured for each frame
+    _decimation: int #The sample rate is divided by this factor before the FFT, 1 disables decimation
+    _analysis_size: int #Number of samples in the FFT after decimation
+    _fixed_point: bool #Keep samples as int16 until after the FFT
 
     @property
     def sample_rate(self) -> int:
@@ -12,6 +19,16 @@ class RecordingSettings():
     def sample_size(self) -> int:
         return self._sample_size
 
+    @property
+    def hop_size(self) -> int:
+        '''Number of new samples recorded each frame.  The rest of the analysis window is reused from earlier frames'''
+        return self._hop_size
+
+    @property
+    def frame_rate(self) -> float:
+        '''Upper limit on frames per second imposed by recording hop_size samples for each frame'''
+        return self._sample_rate / self._hop_size
+
     @property
     def frequency_cutoff(self) -> int:
         return self._freq_cutoff
@@ -20,13 +37,88 @@ class RecordingSettings():
     def max_detectable_frequency(self) -> int:
         return self._sample_rate / 2.0
 
-    def __init__(self, sampling_freq_hz: int, frequency_cutoff: int, sample_size_exp: int):
+    @property
+    def decimation(self) -> int:
+        '''Factor the recording is downsampled by before the FFT.  1 when decimation is disabled'''
+        return self._decimation
+
+    @property
+    def analysis_sample_rate(self) -> float:
+        '''Sample rate of the samples passed to the FFT'''
+        return self._sample_rate / self._decimation
+
+    @property
+    def analysis_size(self) -> int:
+        '''Number of samples passed to the FFT'''
+        return self._analysis_size
+
+    @property
+    def fixed_point(self) -> bool:
+        '''True if samples stay int16 until after the FFT, and the Hanning filter is applied to the spectrum'''
+        return self._fixed_point
+
+    def __init__(self, sampling_freq_hz: int, frequency_cutoff: int, sample_size_exp: int, hop_size: int | None = None,
+                 decimate: bool = False, fixed_point: bool = False):
+        '''
+        :param hop_size: Optional, number of new samples to record for each frame.  Defaults to sample_size, a full new
+        recording each frame.  Smaller values slide the analysis window forward by hop_size samples, so the display
+        updates more often with the same frequency resolution.
+        :param decimate: Low-pass filter and downsample the recording before the FFT.  The factor is chosen from the
+        frequency cutoff.  Useful when the cutoff is far below the sample rate.
+        :param fixed_point: Center the recording into int16 and only convert to float after the FFT.  Halves the
+        memory the analysis window uses and skips converting and filtering every sample each frame.
+        '''
+        self._sample_size_exp = sample_size_exp
         self._sample_size = 1 << sample_size_exp
         self._sample_rate = sampling_freq_hz * 2
         self._freq_cutoff = frequency_cutoff
+        self._hop_size = self._sample_size if hop_size is None else hop_size
+        self._fixed_point = fixed_point
 
         if self._freq_cutoff > self.max_detectable_frequency:
             raise ValueError("Maximum frequency below requested frequency cutoff")
 
+        if self._hop_size < 1 or self._hop_size > self._sample_size:
+            raise ValueError("hop_size must be between 1 and sample_size")
+
+        self._decimate = decimate
+        self._decimation = self._choose_decimation() if decimate else 1
+
+        # Split the decimation between a shorter FFT and a longer window.  For example, decimating by 16 gives an FFT
+        # a quarter of the size covering four times as much time, so each bin is four times narrower.
+        decimation_exp = 0
+        while (1 << decimation_exp) < self._decimation:
+            decimation_exp += 1
+        self._analysis_size = self._sample_size >> ((decimation_exp + 1) // 2)
+
+        if self._hop_size % self._decimation != 0:
+            raise ValueError(f"hop_size must be a multiple of the decimation factor {self._decimation}")
+
+    def _choose_decimation(self) -> int:
+        '''
+        Largest power of two we can divide the sample rate by and still have the decimated nyquist frequency at
+        twice the frequency cutoff.  The extra octave leaves room for the anti-alias filter to roll off.
+        '''
+        decimation = 1
+        while decimation < max_decimation and \
+                self._sample_rate / (4.0 * decimation) >= 2 * self._freq_cutoff:
+            decimation <<= 1
+
+        return decimation
+
+    def copy(self, **kwargs) -> 'RecordingSettings':
+        '''
+        Create a new RecordingSettings with the same values, except for any constructor arguments passed
+        '''
+        args = {'sampling_freq_hz': self._sample_rate // 2,
+                'frequency_cutoff': self._freq_cutoff,
+                'sample_size_exp': self._sample_size_exp,
+                'hop_size': self._hop_size,
+                'decimate': self._decimate,
+                'fixed_point': self._fixed_point}
+        args.update(kwargs)
+        return RecordingSettings(**args)
+
     def __str__(self) -> str:
-        return f'max freq: {self.max_detectable_frequency} sample size: {self.sample_size}'
\ No newline at end of file
+        return f'max freq: {self.max_detectable_frequency} sample size: {self.sample_size} hop size: {self.hop_size} ' \
+               f'decimation: {self.decimation} analysis size: {self.analysis_size} fixed point: {self.fixed_point}'
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import time
+from sound_rec import SampleCapture
+from spectrum_pipeline import SpectrumPipeline
+import stage_timing
+
+# The ADC stage misses its deadline when a capture finishes this much later than the hop takes to record
+capture_tolerance = 1.25
+
+
+class Mailbox:
+    '''
+    Passes the latest item from one stage to the next.  It holds a single item, so a stage that falls behind reads
+    the newest item rather than a queue of stale ones.  Putting an item before the last one was taken replaces it.
+    '''
+
+    _item: object | None
+    _put_ns: int  # When the item was put
+
+    @property
+    def is_empty(self) -> bool:
+        return self._item is None
+
+    @property
+    def age_ns(self) -> int:
+        '''How long the current item has been waiting'''
+        return time.monotonic_ns() - self._put_ns
+
+    @property
+    def items_dropped(self) -> int:
+        '''Number of items replaced before they were taken'''
+        return self._items_dropped
+
+    def __init__(self):
+        self._item = None
+        self._put_ns = 0
+        self._items_dropped = 0
+
+    def put(self, item) -> None:
+        if self._item is not None:
+            self._items_dropped += 1
+
+        self._item = item
+        self._put_ns = time.monotonic_ns()
+
+    def take(self):
+        '''Remove and return the item, or None if the mailbox is empty'''
+        item = self._item
+        self._item = None
+        return item
+
+    async def get(self):
+        '''Wait for an item, then remove and return it'''
+        while self._item is None:
+            await asyncio.sleep(0)
+
+        return self.take()
+
+
+class StageStats:
+    '''
+    Counts how often a stage ran and how often it took longer than its deadline
+    '''
+
+    @property
+    def runs(self) -> int:
+        return self._runs
+
+    @property
+    def deadline_misses(self) -> int:
+        return self._deadline_misses
+
+    @property
+    def max_ns(self) -> int:
+        '''Longest time the stage took'''
+        return self._max_ns
+
+    def __init__(self, name: str, deadline_ns: int | None):
+        '''
+        :param name: Name of the stage, used when printing
+        :param deadline_ns: Time the stage may take.  None never misses.
+        '''
+        self.name = name
+        self.deadline_ns = deadline_ns
+        self._runs = 0
+        self._deadline_misses = 0
+        self._max_ns = 0
+
+    def record(self, elapsed_ns: int) -> None:
+        self._runs += 1
+        if elapsed_ns > self._max_ns:
+            self._max_ns = elapsed_ns
+
+        if self.deadline_ns is not None and elapsed_ns > self.deadline_ns:
+            self._deadline_misses += 1
+
+    def __str__(self) -> str:
+        return f'{self.name}: runs: {self._runs} misses: {self._deadline_misses} max: {self._max_ns / 1000000:0.2f}ms'
+
+
+class StagedScheduler:
+    '''
+    Runs capture, analysis and rendering as separate asyncio tasks so a slow stage does not hold the others to its
+    pace.  The capture stage fills SampleCapture's buffer pool, which only keeps the latest complete recording.  A
+    recording blocks until it is complete, so capture takes turns with the other stages rather than running alongside
+    them.  The analysis stage slides every recording into the pipeline and hands spectra to the render stage through a
+    single slot Mailbox.  The render stage draws the newest spectrum at the target frame rate.
+
+    No stage queues work.  If rendering falls behind, the analysis stage waits for the render stage to take the
+    waiting spectrum, or replaces it once it is a whole frame old.  If the render stage misses a frame it skips ahead
+    to the next frame time instead of rushing to catch up.
+
+    Each stage counts its deadline misses.  Capture misses its deadline when a recording takes noticeably longer
+    than the hop, which means the ADC sat idle.  Analysis and rendering miss when they take longer than one frame, or
+    when the render stage starts a frame a whole frame late.
+    '''
+
+    _capture_task: asyncio.Task | None
+    _spectra: Mailbox  # Analysis -> render
+    _frame_ns: int | None  # Time between frames at the target frame rate, None renders as fast as spectra arrive
+
+    @property
+    def capture_stats(self) -> StageStats:
+        return self._capture_stats
+
+    @property
+    def analyze_stats(self) -> StageStats:
+        return self._analyze_stats
+
+    @property
+    def render_stats(self) -> StageStats:
+        return self._render_stats
+
+    @property
+    def spectra_dropped(self) -> int:
+        '''Number of spectra replaced by a newer spectrum before they were rendered'''
+        return self._spectra.items_dropped
+
+    def __init__(self, capture: SampleCapture, pipeline: SpectrumPipeline, get_display_mode,
+                 target_fps: float | None = None, report_interval_s: float | None = None):
+        '''
+        :param capture: Microphone capture
+        :param pipeline: Turns recordings into spectra
+        :param get_display_mode: Function returning the display mode to render with, so buttons can change it
+        :param target_fps: Frames to render per second.  None renders every spectrum as soon as it is ready.
+        :param report_interval_s: Optional, print the stage statistics this often
+        '''
+        self._capture = capture
+        self._pipeline = pipeline
+        self._get_display_mode = get_display_mode
+        self._frame_ns = None if target_fps is None else int(1000000000 / target_fps)
+        self._report_interval_ns = None if report_interval_s is None else int(report_interval_s * 1000000000)
+        self._capture_task = None
+        self._spectra = Mailbox()
+
+        hop_ns = (capture.sample_size * 1000000000) // capture.sample_rate
+        self._capture_stats = StageStats('capture', int(hop_ns * capture_tolerance))
+        self._analyze_stats = StageStats('analyze', self._frame_ns)
+        self._render_stats = StageStats('render', self._frame_ns)
+
+    def start_capture(self) -> asyncio.Task:
+        '''
+        Start the capture stage, if it is not already running.  Call this early so the pipeline can be filled before
+        run() starts the other stages.
+        '''
+        if self._capture_task is None:
+            self._capture_task = asyncio.create_task(self._capture_stage())
+
+        return self._capture_task
+
+    async def run(self) -> None:
+        '''
+        Run every stage forever
+        '''
+        self.start_capture()
+        await asyncio.gather(self._capture_task, self._analyze_stage(), self._render_stage())
+
+    async def _capture_stage(self) -> None:
+        last_end_ns = None
+        while True:
+            start_ns = stage_timing.start()
+            self._capture.capture()
+            stage_timing.stop('capture', start_ns)
+            end_ns = time.monotonic_ns()
+            if last_end_ns is not None:
+                self._capture_stats.record(end_ns - last_end_ns)
+            last_end_ns = end_ns
+
+            # Let the other stages run between recordings
+            await asyncio.sleep(0)
+
+    async def _analyze_stage(self) -> None:
+        while True:
+            samples = await self._capture.next_frame()
+            start_ns = time.monotonic_ns()
+
+            # Every recording goes into the sliding window, even if it is not analyzed, so the window stays current
+            self._pipeline.push(samples)
+
+            # Only calculate a spectrum if the render stage will use it.  A spectrum left waiting for a whole frame is
+            # stale, so it is replaced by a fresh one.
+            if self._pipeline.is_ready and (self._spectra.is_empty or self._frame_ns is None or
+                                            self._spectra.age_ns > self._frame_ns):
+                self._spectra.put(self._pipeline.process())
+                self._analyze_stats.record(time.monotonic_ns() - start_ns)
+
+    async def _render_stage(self) -> None:
+        next_frame_ns = time.monotonic_ns()
+        next_report_ns = None if self._report_interval_ns is None else next_frame_ns + self._report_interval_ns
+        while True:
+            if self._frame_ns is not None:
+                # Wait for the frame's time to arrive
+                wait_ns = next_frame_ns - time.monotonic_ns()
+                if wait_ns > 0:
+                    await asyncio.sleep(wait_ns / 1000000000)
+
+            spectrum = await self._spectra.get()
+            start_ns = time.monotonic_ns()
+            self._get_display_mode().show(spectrum)
+            end_ns = time.monotonic_ns()
+            stage_timing.stop('frame', start_ns)
+
+            if self._frame_ns is None:
+                self._render_stats.record(end_ns - start_ns)
+            else:
+                # Starting a whole frame late counts as a miss, as does taking longer than a frame to draw
+                self._render_stats.record(max(end_ns - start_ns, start_ns - next_frame_ns))
+
+                # Skip ahead to the next frame time rather than drawing a burst of frames to catch up
+                next_frame_ns += self._frame_ns
+                if next_frame_ns < end_ns:
+                    next_frame_ns = end_ns + self._frame_ns - ((end_ns - next_frame_ns) % self._frame_ns)
+
+            if next_report_ns is not None and end_ns >= next_report_ns:
+                print(self)
+                next_report_ns = end_ns + self._report_interval_ns
+
+            stage_timing.report_if_due()
+
+    def __str__(self) -> str:
+        return f'{self._capture_stats} | {self._analyze_stats} | {self._render_stats} | ' \
+               f'spectra dropped: {self._spectra.items_dropped} | {self._capture}'
@@ -2,8 +2,8 @@ import analogio
 import analogbufio
 import array
 import time
+import asyncio
 import ulab.numpy as np
-import random
 
 async def record_sample_array(adcbuf: analogbufio.BufferedIn, sample_size: int, sample_rate: int, buffer = None):
     if buffer is None:
@@ -33,11 +33,219 @@ async def record_sample_numpy(adc: analogio.AnalogIn, sample_size: int, sample_r
     #print(f"Time to collect sample: {elapsed_ns / 1000000}ms sample_rate: {sample_size * (1 / (elapsed_ns / 1000000000))}")
     return buffer, min_val, max_val
 
-async def record_random_sample(sample_size: int, buffer: np.array = None):
+async def record_synthetic_sample(signal: 'synthetic_signals.Signal', sample_size: int, buffer: array.array = None):
+    '''
+    Record from a synthetic signal instead of the microphone.  See synthetic_signals.standard_signals.
+    '''
     if buffer is None:
         buffer = array.array("H", [0x0000] * sample_size)
 
-    for i in range(0, sample_size):
-        buffer[i] = random.randint(0, (1 << 16) - 1)
+    signal.readinto(buffer)
+    return buffer
+
+
+class SampleCapture:
+    '''
+    Owns a small pool of preallocated sample buffers.  capture() fills a buffer the analysis code is not reading and
+    publishes it as the latest complete recording.  The main loop asks for that recording with next_frame() or
+    latest_frame(); neither allocates.  Recordings that are replaced before they are read are counted as dropped, and
+    having to fill the buffer being read is counted as overlapped.
+
+    This is not gap-free capture.  readinto() blocks until the buffer is full, and nothing records between calls, so
+    the ADC is idle while the analysis and rendering run.  The samples that fall in those gaps are estimated and
+    reported as samples_lost.  A steadily growing count is expected, not a bug.
+    '''
+
+    _buffers: tuple[array.array]
+    _i_latest: int | None  # Most recent complete buffer not yet handed out
+    _i_reading: int | None  # Buffer the analysis stage is holding
+
+    @property
+    def sample_size(self) -> int:
+        return self._sample_size
+
+    @property
+    def sample_rate(self) -> int:
+        return self._sample_rate
+
+    @property
+    def frames_captured(self) -> int:
+        '''Number of buffers the ADC has filled'''
+        return self._frames_captured
+
+    @property
+    def frames_dropped(self) -> int:
+        '''Number of complete buffers overwritten before the analysis stage read them'''
+        return self._frames_dropped
+
+    @property
+    def frames_overlapped(self) -> int:
+        '''Number of times the ADC had to fill the buffer the analysis stage was still reading'''
+        return self._frames_overlapped
+
+    @property
+    def samples_lost(self) -> int:
+        '''Estimated number of samples that occurred while the ADC was not recording'''
+        return self._samples_lost
+
+    def __init__(self, adcbuf: analogbufio.BufferedIn, sample_size: int, sample_rate: int, num_buffers: int = 3):
+        '''
+        :param adcbuf: ADC to read from
+        :param sample_size: Number of samples in each buffer
+        :param sample_rate: Rate the ADC was configured with, used to estimate lost samples
+        :param num_buffers: Three buffers lets the ADC always have a free buffer while the analysis stage holds one
+        and another complete frame is waiting.  Two is the classic ping-pong arrangement.
+        '''
+        if num_buffers < 1:
+            raise ValueError("num_buffers must be at least 1")
+
+        self._adcbuf = adcbuf
+        self._sample_size = sample_size
+        self._sample_rate = sample_rate
+        self._buffers = tuple(array.array("H", [0x0000] * sample_size) for i in range(num_buffers))
+        self._i_latest = None
+        self._i_reading = None
+
+        self._frames_captured = 0
+        self._frames_dropped = 0
+        self._frames_overlapped = 0
+        self._samples_lost = 0
+        self._last_capture_end_ns = None
+
+    def _choose_write_buffer(self) -> int:
+        '''
+        Pick the buffer the ADC fills next.  Prefer a buffer nobody is using, then the unread frame (dropping it), and
+        only as a last resort the buffer the analysis stage is still reading.
+        '''
+        for i in range(len(self._buffers)):
+            if i != self._i_latest and i != self._i_reading:
+                return i
+
+        if self._i_latest is not None and self._i_latest != self._i_reading:
+            self._frames_dropped += 1
+            i = self._i_latest
+            self._i_latest = None
+            return i
+
+        self._frames_overlapped += 1
+        return self._i_reading
+
+    def capture(self) -> None:
+        '''
+        Fill the next free buffer from the ADC and publish it as the latest complete frame.  Blocks until the buffer
+        is full.
+        '''
+        i = self._choose_write_buffer()
+
+        start = time.monotonic_ns()
+        if self._last_capture_end_ns is not None:
+            gap_ns = start - self._last_capture_end_ns
+            self._samples_lost += (gap_ns * self._sample_rate) // 1000000000
+
+        self._adcbuf.readinto(self._buffers[i])
+
+        self._last_capture_end_ns = time.monotonic_ns()
+
+        if self._i_latest is not None:
+            self._frames_dropped += 1
+
+        self._i_latest = i
+        self._frames_captured += 1
+
+    async def run(self) -> None:
+        '''
+        Capture forever, yielding to other tasks between buffers
+        '''
+        while True:
+            self.capture()
+            await asyncio.sleep(0)
+
+    def latest_frame(self) -> array.array | None:
+        '''
+        Hand the latest complete frame to the caller, or None if no new frame completed since the last call.  The
+        previously returned frame is released back to the pool, so callers must finish with a frame before asking
+        for the next one.
+        '''
+        if self._i_latest is None:
+            return None
+
+        self._i_reading = self._i_latest
+        self._i_latest = None
+        return self._buffers[self._i_reading]
+
+    async def next_frame(self) -> array.array:
+        '''
+        Wait for a new complete frame and return it.  See latest_frame.
+        '''
+        while self._i_latest is None:
+            await asyncio.sleep(0)
+
+        return self.latest_frame()
+
+    def __str__(self) -> str:
+        return f'captured: {self._frames_captured} dropped: {self._frames_dropped} ' \
+               f'overlapped: {self._frames_overlapped} samples lost: {self._samples_lost}'
+
+
+class SlidingWindow:
+    '''
+    A ring buffer holding the most recent window_size samples.  Each frame only the newest samples are pushed, and the
+    full window is copied out in time order for analysis.  This lets frames overlap so the display can update more
+    often than once per window_size samples.
+    '''
+
+    _ring: np.ndarray
+    _head: int  # Index of the oldest sample, which is also where the next sample is written
+    _num_filled: int
+
+    @property
+    def window_size(self) -> int:
+        return self._window_size
+
+    @property
+    def is_full(self) -> bool:
+        '''True once window_size samples have been pushed'''
+        return self._num_filled >= self._window_size
+
+    def __init__(self, window_size: int, dtype=np.uint16):
+        self._window_size = window_size
+        self._ring = np.zeros(window_size, dtype=dtype)
+        self._head = 0
+        self._num_filled = 0
+
+    def push(self, samples) -> None:
+        '''
+        Add new samples to the window, replacing the oldest samples
+        :param samples: array.array("H") from the ADC or an ndarray.  Must not be longer than the window.
+        '''
+        if not isinstance(samples, np.ndarray):
+            samples = np.frombuffer(samples, dtype=self._ring.dtype)
+
+        num_samples = len(samples)
+        if num_samples > self._window_size:
+            raise ValueError("Cannot push more samples than the window holds")
+
+        num_to_end = self._window_size - self._head
+        if num_samples <= num_to_end:
+            self._ring[self._head:self._head + num_samples] = samples
+        else:
+            self._ring[self._head:] = samples[:num_to_end]
+            self._ring[:num_samples - num_to_end] = samples[num_to_end:]
+
+        self._head += num_samples
+        if self._head >= self._window_size:
+            self._head -= self._window_size
+
+        if self._num_filled < self._window_size:
+            self._num_filled += num_samples
+
+    def copy_to(self, out: np.ndarray) -> np.ndarray:
+        '''
+        Copy the window, oldest sample first, into a preallocated array.  The copy also converts to the dtype of out.
+        '''
+        num_to_end = self._window_size - self._head
+        out[:num_to_end] = self._ring[self._head:]
+        if self._head > 0:
+            out[num_to_end:] = self._ring[:self._head]
 
-    return buffer
\ No newline at end of file
+        return out
@@ -0,0 +1,277 @@
+import array
+import math
+import time
+import ulab.numpy as np
+import ema
+from log_histogram import LogHistogram
+import recording
+import stage_timing
+from recording_settings import RecordingSettings
+from sound_rec import SlidingWindow
+
+
+class SpectrumPipeline:
+    '''
+    Turns recordings from the microphone into the power spectrum we display.  All of the work buffers are allocated
+    once, up front, and every step runs in place so a frame leaves little garbage behind for the collector.  ulab's
+    FFT, and the filter of decimated presets, always return new arrays, so their outputs are the only sizable
+    allocations left.  python -m host.allocations checks this on the host.
+
+    New samples are converted to float and centered as they are pushed, which only touches hop_size samples.  The
+    full window is copied out and windowed once per frame.  Gain is applied to the small cropped spectrum rather
+    than the full recording, which gives the same result because the FFT is linear.
+
+    When settings.fixed_point is set the samples are centered into int16 and passed to the FFT as integers.  The
+    Hanning filter is applied to the cropped spectrum instead of the recording, so nothing touches every sample as a
+    float except the FFT itself.
+    '''
+
+    _decimator: recording.Decimator | None
+    _window: SlidingWindow  # Centered samples, float or int16
+    _chunk: np.ndarray  # New samples being converted and centered
+    _signed_chunk: np.ndarray | None  # int16 view of _chunk, fixed point only
+    _work: np.ndarray  # Copy of the samples passed to the FFT
+    _hanning: np.ndarray | None  # None when the engine filters the spectrum
+    _engine: recording.RealSpectrum
+    _spectrum: np.ndarray
+    _displayed_spectrum: np.ndarray  # View of _spectrum without bin 0
+    _dc_offset: ema.EMA  # Average ADC value over the last few seconds, which is what silence reads as
+    _dc_weight: float  # Sum of the window's weights, which turns the sum of a window into its average
+    _peak_levels: LogHistogram  # Running 98th percentile of the frame peaks, which sets the gain
+    _frame_peak: np.ndarray  # The latest frame's peak, as the array the histogram adds
+    _peak: float  # Largest centered sample magnitude pushed since the last frame
+    _bin_levels: LogHistogram  # Running 10th percentile of the frames' median bin, before gain: the noise floor
+    _frame_level: np.ndarray  # The latest frame's median bin, as the array the histogram adds
+
+    @property
+    def settings(self) -> RecordingSettings:
+        return self._settings
+
+    @property
+    def is_ready(self) -> bool:
+        '''True once enough samples have been pushed to fill the analysis window'''
+        return self._window.is_full
+
+    @property
+    def gain(self) -> float:
+        '''The spectrum is divided by this value to normalize the volume'''
+        return float(self._peak_levels.levels[0][0])
+
+    @property
+    def noise_floor(self) -> float:
+        '''
+        How loud a bin of the background is, on the same scale as the spectra process returns.  Bins near this level
+        are hum and hiss rather than sound worth showing.  0 until a frame is processed.
+        '''
+        if self._peak_levels.is_empty:
+            return float(self._bin_levels.levels[0][0])
+        return float(self._bin_levels.levels[0][0]) / self.gain
+
+    def __init__(self, settings: RecordingSettings, num_bins: int, buffer_mean: float | None = None):
+        '''
+        :param settings: Recording settings
+        :param num_bins: Number of bins to calculate, usually recording.get_frequency_index(...)
+        :param buffer_mean: ADC value that represents silence.  None starts from the first recording pushed.  Either
+        way it follows the microphone's DC offset from then on.
+        '''
+        self._settings = settings
+
+        # The microphone's DC offset drifts with temperature and supply voltage.  An offset that is not removed ends
+        # up in the lowest bins, so it is tracked as an average of every window analyzed.  It averages over a few
+        # seconds, which is far longer than the period of any frequency displayed.
+        self._dc_offset = ema.EMA(num_samples=256, smooth=1)
+        self.buffer_mean = 0
+        if buffer_mean is not None:
+            self._dc_offset.reset(buffer_mean)
+            self.buffer_mean = buffer_mean
+
+        self._decimator = recording.Decimator(settings) if settings.decimation > 1 else None
+        chunk_size = settings.hop_size // settings.decimation
+
+        if settings.fixed_point:
+            # Raw ADC values are centered as uint16.  Subtracting the mean wraps around exactly like int16 math, so
+            # reading the same memory as int16 gives the signed, centered sample.  Decimated samples are already
+            # float and are centered before being rounded into int16.
+            sample_dtype = np.int16
+            if self._decimator is None:
+                self._chunk = np.zeros(chunk_size, dtype=np.uint16)
+                self._signed_chunk = np.frombuffer(self._chunk, dtype=np.int16)
+            else:
+                self._chunk = np.zeros(chunk_size, dtype=np.float)
+                self._signed_chunk = np.zeros(chunk_size, dtype=np.int16)
+            self._hanning = None
+        else:
+            sample_dtype = np.float
+            self._chunk = np.zeros(chunk_size, dtype=np.float)
+            self._signed_chunk = None
+            self._hanning = recording.calculate_hanning_filter(settings.analysis_size)
+        self._dc_weight = settings.analysis_size if self._hanning is None else float(np.sum(self._hanning))
+
+        self._window = SlidingWindow(settings.analysis_size, dtype=sample_dtype)
+        self._work = np.zeros(settings.analysis_size, dtype=sample_dtype)
+        self._engine = recording.RealSpectrum(settings.analysis_size, num_bins, hanning=settings.fixed_point)
+        self._spectrum = np.zeros(num_bins)
+        self._displayed_spectrum = self._spectrum[1:]
+
+        # The gain normalizes the recorded signal.  It follows the 98th percentile of the frames' peaks over the last
+        # few hundred frames, so it slowly adjusts the volume range that the microphone is focusing on.  A percentile
+        # ignores the odd click or bump that an average of the peaks would jump for, and adapting slowly keeps quiet
+        # stretches of music or conversations from setting a range that saturates the display when the volume
+        # increases.  The histogram only keeps counts, so this takes the same memory however long it runs.
+        self._peak_levels = build_peak_levels()
+        self._frame_peak = np.zeros(1)
+        self._peak = 0
+
+        # The noise floor comes from the spectrum the FFT already calculated.  A frame's median bin ignores the few bins
+        # a tone lights up, and the quietest frames are only background, so the floor is the 10th percentile of every
+        # frame's median bin.  It is taken before the gain, so a change of volume range does not move it.
+        self._bin_levels = build_bin_levels()
+        self._frame_level = np.zeros(1)
+
+    def calibrate(self, samples) -> None:
+        '''
+        Set the ADC value that represents silence from a recording.  This is optional, since push follows the DC
+        offset, but the first frames are centered better when the recording is known to be quiet.
+        :param samples: array.array("H") from the ADC or an ndarray
+        '''
+        if not isinstance(samples, np.ndarray):
+            samples = np.frombuffer(samples, dtype=np.uint16)
+
+        self._dc_offset.reset(float(np.mean(samples)))
+        self._update_buffer_mean()
+
+    def _update_buffer_mean(self) -> None:
+        '''Center new samples with the tracked DC offset.  Fixed point centers with integer math, so it is rounded.'''
+        self.buffer_mean = self._dc_offset.ema_value
+        if self._signed_chunk is not None:
+            self.buffer_mean = int(round(self.buffer_mean))
+
+    def push(self, samples) -> None:
+        '''
+        Add a new recording of hop_size samples to the analysis window
+        :param samples: array.array("H") from the ADC or an ndarray
+        '''
+        start_ns = stage_timing.start()
+        if self._decimator is not None:
+            samples = self._decimator.process(samples)
+        elif not isinstance(samples, np.ndarray):
+            samples = np.frombuffer(samples, dtype=np.uint16)
+
+        # Center the samples so the value of 0 represents no sound.  process keeps the offset up to date, but until a
+        # window is analyzed there is nothing to follow, so the first recording sets it.
+        chunk = self._chunk
+        chunk[:] = samples
+        if self._dc_offset.num_samples_collected == 0:
+            self._dc_offset.reset(float(np.mean(chunk)))
+            self._update_buffer_mean()
+        chunk -= self.buffer_mean
+
+        if self._signed_chunk is not None:
+            if self._decimator is not None:
+                self._signed_chunk[:] = chunk
+            chunk = self._signed_chunk
+
+        peak = max(float(np.max(chunk)), -float(np.min(chunk)))
+        if peak > self._peak:
+            self._peak = peak
+
+        self._window.push(chunk)
+        stage_timing.stop('push', start_ns)
+
+    def process(self) -> np.ndarray:
+        '''
+        Calculate the spectrum of the current analysis window
+        :return: Normalized power for bins 1 to num_bins - 1.  The array is reused by the next call.
+        '''
+        # Copy the window, oldest sample first, and filter it to reduce spectral leakage.  In fixed point the engine
+        # filters the spectrum instead.
+        start_ns = stage_timing.start()
+        work = self._window.copy_to(self._work)
+        if self._hanning is not None:
+            work *= self._hanning
+        stage_timing.stop('window', start_ns)
+
+        # Calculate the FFT (determine which frequencies compose the recording).  Half of a full FFT is mostly
+        # symmetric for this data, and we do not display frequencies above the cutoff, so the engine skips those bins.
+        start_ns = stage_timing.start()
+        self._engine.compute(work, out=self._spectrum)
+        stage_timing.stop('fft', start_ns)
+
+        # Bin 0 of the FFT is the sum of the window, so the average the centering left behind comes with the FFT
+        # rather than from another pass over the samples.  Adding it to the offset gives the window's DC level.
+        self._dc_offset.add(self.buffer_mean + self._engine.sample_sum / self._dc_weight)
+        self._update_buffer_mean()
+
+        # Silence has no peak, so keep the previous gain rather than adapting towards zero
+        if self._peak > 0:
+            self._frame_peak[0] = self._peak
+            self._peak_levels.add(self._frame_peak)
+            self._peak = 0
+
+        self._frame_level[0] = np.median(self._displayed_spectrum)
+        self._bin_levels.add(self._frame_level)
+
+        # Scaling the spectrum is the same as scaling the recording, and the spectrum is much shorter
+        if not self._peak_levels.is_empty:
+            self._spectrum *= 1.0 / self.gain
+
+        # Remove the first bin, which is the average volume rather than a frequency
+        return self._displayed_spectrum
+
+
+def build_peak_levels() -> LogHistogram:
+    '''
+    Create the running percentile of frame peaks that gives a SpectrumPipeline's gain, the 98th.  Peaks are centered
+    ADC values, so they range up to 1 << 15.
+    '''
+    return LogHistogram(1, percentiles=(0.98,), min_value=1, max_value=1 << 15, half_life=350)
+
+
+def build_bin_levels() -> LogHistogram:
+    '''
+    Create the running percentile of each frame's median bin that gives a SpectrumPipeline's noise floor, the 10th.
+    Bins are FFT magnitudes of centered ADC values, which range far beyond a single sample.
+    '''
+    return LogHistogram(1, percentiles=(0.1,), min_value=1, max_value=1 << 28, half_life=350)
+
+
+def compare_fixed_point(settings_by_name: dict, iterations: int = 20):
+    '''
+    Runs the float and fixed point pipelines on the same synthetic recording for each RecordingSettings.  Prints the
+    mean time to process a frame with each, and how far the fixed point spectrum is from the float spectrum as a
+    percentage of the largest bin.
+    :param settings_by_name: Dictionary of name -> RecordingSettings, such as sampling_settings in code.py
+    :param iterations: Number of frames to time for each pipeline
+    '''
+    for name, settings in settings_by_name.items():
+        frequencies = recording.get_frequencies(settings)
+        num_bins = recording.get_frequency_index(frequencies, settings.frequency_cutoff)
+
+        # A few tones spread across the displayed range, on top of the microphone's DC offset
+        hop = array.array("H", [0x0000] * settings.hop_size)
+        for i in range(settings.hop_size):
+            t = i / settings.sample_rate
+            value = 32768
+            for tone in (0.1, 0.35, 0.8):
+                value += 4000 * math.sin(2.0 * math.pi * tone * settings.frequency_cutoff * t)
+            hop[i] = int(value)
+
+        results = []
+        for fixed_point in (False, True):
+            pipeline = SpectrumPipeline(settings.copy(fixed_point=fixed_point), num_bins)
+            pipeline.calibrate(hop)
+            while not pipeline.is_ready:
+                pipeline.push(hop)
+
+            start = time.monotonic_ns()
+            for i in range(iterations):
+                pipeline.push(hop)
+                spectrum = pipeline.process()
+            elapsed_ns = (time.monotonic_ns() - start) // iterations
+            results.append((elapsed_ns, spectrum))
+
+        (float_ns, float_spectrum), (fixed_ns, fixed_spectrum) = results
+        max_error = np.max(abs(float_spectrum - fixed_spectrum)) / np.max(float_spectrum)
+        print(f'{name}: float: {float_ns / 1000000:0.2f}ms fixed point: {fixed_ns / 1000000:0.2f}ms '
+              f'max error: {max_error * 100:0.4f}% of peak')
+
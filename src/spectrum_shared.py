@@ -1,10 +1,13 @@
 
 try:
     import ulab.numpy as np
+    from ulab.scipy import signal
 except ModuleNotFoundError:
     import numpy as np
+    signal = None
 
 import math
+import time
 
 
 default_range_cutoffs = (0.03, 0.2, 0.4, 0.6, .8, 1.0)
@@ -90,6 +93,106 @@ def get_freq_powers_by_range(spectrum: np.ndarray[float], range_cutoffs: np.ndar
     return out
 
 
+# A single second order section that adds each input to the previous output, y[n] = x[n] + y[n-1]
+_running_total_sos = [[1.0, 0.0, 0.0, 1.0, -1.0, 0.0]]
+
+
+def cumulative_sum(values: np.ndarray[float], out: np.ndarray[float]) -> np.ndarray[float]:
+    '''
+    Running total of values, written into out.  ulab has no cumsum, but a filter that feeds its output back into
+    itself computes the same running total in C.
+    '''
+    if signal is None:
+        return np.cumsum(values, out=out)
+
+    out[:] = signal.sosfilt(_running_total_sos, values)
+    return out
+
+
+class RangeAggregator:
+    '''
+    Sums the power in each frequency range with one pass over the spectrum.  A running total of the spectrum is
+    calculated, then the sum of each range is the running total at its upper cutoff minus the running total at its
+    lower cutoff.  This replaces a python loop with a slice and sum for every group.
+    '''
+
+    _upper: np.ndarray[int]  # Index into the running total for the end of each range
+    _lower: np.ndarray[int]  # Index into the running total for the start of each range
+    _running_total: np.ndarray[float]  # Entry i is the sum of spectrum[0:i]
+    _lower_totals: np.ndarray[float]
+
+    @property
+    def num_groups(self) -> int:
+        return len(self._upper)
+
+    @property
+    def spectrum_len(self) -> int:
+        return self._spectrum_len
+
+    def __init__(self, range_cutoffs: np.ndarray[int], spectrum_len: int):
+        '''
+        :param range_cutoffs: Pre-calculated indicies for each range, as used by get_freq_powers_by_range
+        :param spectrum_len: Length of the spectra that will be passed to aggregate
+        '''
+        # Cutoffs past the end of the spectrum sum nothing, just as a slice past the end would
+        cutoffs = [min(int(cutoff), spectrum_len) for cutoff in range_cutoffs]
+
+        self._spectrum_len = spectrum_len
+        self._upper = np.array(cutoffs[1:], dtype=np.uint16)
+        self._lower = np.array(cutoffs[:-1], dtype=np.uint16)
+        self._running_total = np.zeros(spectrum_len + 1)
+        self._running_total_after_first = self._running_total[1:]
+        self._lower_totals = np.zeros(len(self._lower))
+
+    def aggregate(self, spectrum: np.ndarray[float], out: np.ndarray[float] | None = None) -> np.ndarray[float]:
+        '''
+        :param spectrum: Power spectrum, must be spectrum_len long
+        :param out: Optional, array of num_groups floats to write the summed power of each range into
+        :return: Summed power of each range
+        '''
+        if out is None:
+            out = np.zeros(self.num_groups)
+        elif len(out) != self.num_groups:
+            raise ValueError("Output array has the wrong shape")
+
+        if len(spectrum) != self._spectrum_len:
+            raise ValueError("Spectrum length does not match the length the aggregator was built for")
+
+        cumulative_sum(spectrum, out=self._running_total_after_first)
+        np.take(self._running_total, self._upper, out=out)
+        np.take(self._running_total, self._lower, out=self._lower_totals)
+        out -= self._lower_totals
+        return out
+
+
+def benchmark_range_aggregation(spectrum_len: int = 101, group_counts=(8, 16, 32, 64, 72, 128, 256),
+                                iterations: int = 50):
+    '''
+    Compare get_freq_powers_by_range with RangeAggregator for log spaced groups.  Prints the mean time per frame
+    for each and the largest difference between their results.
+    '''
+    spectrum = np.arange(0, spectrum_len) * 0.01 + 1.0
+    for num_groups in group_counts:
+        range_cutoffs = space_indicies(float_to_indicies(log_range(spectrum_len, num_groups)))
+        aggregator = RangeAggregator(range_cutoffs, spectrum_len)
+        loop_out = np.zeros(num_groups)
+        aggregate_out = np.zeros(num_groups)
+
+        start = time.monotonic_ns()
+        for i in range(iterations):
+            get_freq_powers_by_range(spectrum, range_cutoffs, out=loop_out)
+        loop_ns = (time.monotonic_ns() - start) // iterations
+
+        start = time.monotonic_ns()
+        for i in range(iterations):
+            aggregator.aggregate(spectrum, out=aggregate_out)
+        aggregate_ns = (time.monotonic_ns() - start) // iterations
+
+        max_error = np.max(abs(loop_out - aggregate_out))
+        print(f'groups: {num_groups} loop: {loop_ns / 1000000:0.3f}ms aggregator: {aggregate_ns / 1000000:0.3f}ms '
+              f'max error: {max_error}')
+
+
 # default_range_cutoffs = [0.15, 0.35, 0.65, 0.85, 1.0]
 # default_base_color = [(0, 0, 0), #Red, Green, Blue weights for each range
 #               (1, 0, 0),
@@ -209,3 +312,5 @@ if __name__ == '__main__':
     print(f'range indicies: {range_indicies}')
     si = space_indicies(range_indicies)
     print(f'spaced indicies: {si}')
+
+    benchmark_range_aggregation()
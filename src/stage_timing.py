@@ -0,0 +1,144 @@
+# Times named stages of the hot path and prints min/mean/p95/max for each over serial.
+#
+# Time a stage with:
+#     start_ns = stage_timing.start()
+#     ...
+#     stage_timing.stop('fft', start_ns)
+#
+# Always call start and stop through the module, never import them directly.  Timing is off until enable() is called.
+# While it is off, start and stop are functions that return immediately, so instrumented code only pays for an empty
+# function call.
+import array
+import time
+
+# Number of timings kept for each stage
+default_ring_size = 128
+
+_enabled = False
+_ring_size = default_ring_size
+_stages = {}  # Stage name -> StageTimings
+_report_interval_ns = None
+_next_report_ns = 0
+
+
+class StageTimings:
+    '''
+    The most recent timings of a stage, in microseconds, kept in a fixed size ring buffer
+    '''
+
+    _ring: array.array
+    _head: int  # Where the next timing is written
+    _num_filled: int
+
+    def __init__(self, name: str, ring_size: int):
+        self.name = name
+        self._ring = array.array("L", [0] * ring_size)
+        self._head = 0
+        self._num_filled = 0
+
+    def add(self, elapsed_us: int) -> None:
+        self._ring[self._head] = elapsed_us
+        self._head += 1
+        if self._head >= len(self._ring):
+            self._head = 0
+
+        if self._num_filled < len(self._ring):
+            self._num_filled += 1
+
+    def summary(self) -> tuple[int, float, int, int] | None:
+        '''
+        :return: min, mean, 95th percentile and max timing in microseconds, or None if the stage has not run
+        '''
+        if self._num_filled == 0:
+            return None
+
+        timings = sorted(self._ring[:self._num_filled])
+        i_p95 = (len(timings) * 95 + 99) // 100 - 1
+        return timings[0], sum(timings) / len(timings), timings[i_p95], timings[-1]
+
+    def __str__(self) -> str:
+        summary = self.summary()
+        if summary is None:
+            return f'{self.name}: no timings'
+
+        min_us, mean_us, p95_us, max_us = summary
+        return f'{self.name}: min {min_us / 1000:0.2f}ms mean {mean_us / 1000:0.2f}ms ' \
+               f'p95 {p95_us / 1000:0.2f}ms max {max_us / 1000:0.2f}ms n {self._num_filled}'
+
+
+def _start_disabled() -> int:
+    return 0
+
+
+def _stop_disabled(name: str, start_ns: int) -> None:
+    pass
+
+
+def _start_enabled() -> int:
+    return time.monotonic_ns()
+
+
+def _stop_enabled(name: str, start_ns: int) -> None:
+    elapsed_us = (time.monotonic_ns() - start_ns) // 1000
+    timings = _stages.get(name)
+    if timings is None:
+        timings = StageTimings(name, _ring_size)
+        _stages[name] = timings
+
+    timings.add(elapsed_us)
+
+
+start = _start_disabled
+stop = _stop_disabled
+
+
+def enable(report_interval_s: float | None = 5.0, ring_size: int = default_ring_size) -> None:
+    '''
+    Start timing stages
+    :param report_interval_s: Print the timings this often from report_if_due.  None only reports when report is
+    called.
+    :param ring_size: Number of timings kept for each stage
+    '''
+    global _enabled, _ring_size, _report_interval_ns, _next_report_ns, start, stop
+    _enabled = True
+    _ring_size = ring_size
+    _stages.clear()
+    _report_interval_ns = None if report_interval_s is None else int(report_interval_s * 1000000000)
+    _next_report_ns = 0 if _report_interval_ns is None else time.monotonic_ns() + _report_interval_ns
+    start = _start_enabled
+    stop = _stop_enabled
+
+
+def disable() -> None:
+    '''Stop timing stages.  Instrumented code goes back to calling functions that return immediately.'''
+    global _enabled, start, stop
+    _enabled = False
+    start = _start_disabled
+    stop = _stop_disabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def get_timings(name: str) -> StageTimings | None:
+    return _stages.get(name)
+
+
+def report() -> None:
+    '''Print the timings of every stage'''
+    print('Stage timings:')
+    for timings in _stages.values():
+        print(f'  {timings}')
+
+
+def report_if_due() -> None:
+    '''Print the timings if the report interval has passed.  Call once per frame.'''
+    global _next_report_ns
+    if not _enabled or _report_interval_ns is None:
+        return
+
+    now_ns = time.monotonic_ns()
+    if now_ns >= _next_report_ns:
+        report()
+        _next_report_ns = now_ns + _report_interval_ns
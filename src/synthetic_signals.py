@@ -0,0 +1,371 @@
+import array
+import math
+import random
+import ulab.numpy as np
+from recording_settings import RecordingSettings
+
+# Reading the ADC reports for silence, the middle of its unsigned 16 bit range
+adc_mid_scale = 1 << 15
+adc_max = (1 << 16) - 1
+
+# Number of samples in the tables noise is read from.  The tables repeat, but at 40kHz this one lasts about 0.2s,
+# much longer than an analysis window.
+default_noise_table_size = 8192
+
+
+class Signal:
+    '''
+    A synthetic recording, generated with array operations so it is cheap enough to feed benchmarks and soak tests.
+    Signals can be read like analogbufio.BufferedIn, so a SampleCapture can record from one in place of the
+    microphone.  Every signal is deterministic.  Signals with randomness take a seed, and the same seed always
+    produces the same samples.
+
+    Subclasses implement _generate, which returns samples from -1 to 1 scaled by level.  readinto converts them into
+    the unsigned 16 bit readings the ADC returns, centered on adc_mid_scale.
+    '''
+
+    _i_sample: int  # Index of the next sample generated
+    _indicies: np.ndarray | None  # 0, 1, 2 ... as floats, cached for the most recent length generated
+
+    @property
+    def settings(self) -> RecordingSettings:
+        return self._settings
+
+    @property
+    def sample_rate(self) -> int:
+        return self._settings.sample_rate
+
+    def __init__(self, settings: RecordingSettings, level: float = 0.5):
+        '''
+        :param settings: The signal is sampled at settings.sample_rate, and read() returns settings.hop_size samples
+        :param level: Peak of the signal as a fraction of the ADC's range from the middle to either end
+        '''
+        self._settings = settings
+        self.level = level
+        self._i_sample = 0
+        self._indicies = None
+
+    def _index(self, num_samples: int) -> np.ndarray:
+        '''An array of 0 to num_samples - 1, reused between calls of the same length'''
+        if self._indicies is None or len(self._indicies) != num_samples:
+            self._indicies = np.arange(0, num_samples, dtype=np.float)
+        return self._indicies
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        raise NotImplementedError()
+
+    def generate(self, num_samples: int) -> np.ndarray:
+        '''
+        :return: The next num_samples samples as floats from -level to level
+        '''
+        samples = self._generate(num_samples)
+        self._i_sample += num_samples
+        return samples
+
+    def readinto(self, buffer) -> int:
+        '''
+        Fill buffer with ADC readings, like analogbufio.BufferedIn.readinto
+        :param buffer: array.array("H") or uint16 ndarray
+        '''
+        samples = self.generate(len(buffer))
+        samples *= adc_mid_scale - 1
+        samples += adc_mid_scale
+        samples = np.clip(samples, 0, adc_max)
+
+        # The view shares memory with the buffer, so assigning to it fills the buffer without a Python loop
+        view = buffer if isinstance(buffer, np.ndarray) else np.frombuffer(buffer, dtype=np.uint16)
+        view[:] = samples
+        return len(buffer)
+
+    def read(self, buffer=None):
+        '''
+        :param buffer: Optional buffer to fill.  Defaults to a new array.array("H") of settings.hop_size samples.
+        :return: The buffer, filled with the next ADC readings
+        '''
+        if buffer is None:
+            buffer = array.array("H", [0x0000] * self._settings.hop_size)
+
+        self.readinto(buffer)
+        return buffer
+
+    def _periodic_segments(self, num_samples: int, period: int):
+        '''
+        Split the next num_samples samples into pieces that do not cross the end of a period
+        :return: Yields the offset of each piece in the output, its position within the period and its length
+        '''
+        i_out = 0
+        position = self._i_sample % period
+        while i_out < num_samples:
+            count = min(num_samples - i_out, period - position)
+            yield i_out, position, count
+            i_out += count
+            position = 0
+
+
+class Silence(Signal):
+    def __init__(self, settings: RecordingSettings):
+        super().__init__(settings, 0)
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        return np.zeros(num_samples, dtype=np.float)
+
+
+class Tone(Signal):
+    '''A sine wave'''
+
+    def __init__(self, settings: RecordingSettings, frequency: float, level: float = 0.5):
+        super().__init__(settings, level)
+        self.frequency = frequency
+        # Phase is kept wrapped between frames so float32 boards do not lose precision as the signal runs for hours
+        self._phase = 0.0
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        step = 2.0 * math.pi * self.frequency / self.sample_rate
+        samples = np.sin(self._index(num_samples) * step + self._phase)
+        samples *= self.level
+        self._phase = math.fmod(self._phase + step * num_samples, 2.0 * math.pi)
+        return samples
+
+
+class DcDrift(Tone):
+    '''
+    A slow wander of the level the ADC reads for silence, like a microphone's bias settling or a supply sagging.
+    Add it to another signal with Mix.
+    '''
+
+    def __init__(self, settings: RecordingSettings, depth: float = 0.05, period_s: float = 10.0):
+        '''
+        :param depth: Largest offset from the middle of the ADC's range, as a fraction of half the range
+        :param period_s: Time for the level to drift up, down and back
+        '''
+        super().__init__(settings, 1.0 / period_s, depth)
+
+
+class Chirp(Signal):
+    '''A tone sweeping from one frequency to another, starting over each time it reaches the end'''
+
+    def __init__(self, settings: RecordingSettings, start_frequency: float, end_frequency: float,
+                 duration_s: float, log_sweep: bool = True, level: float = 0.5):
+        '''
+        :param log_sweep: Spend the same time in each octave, which looks even on the log scaled displays.  False
+        sweeps linearly.
+        '''
+        super().__init__(settings, level)
+        self.start_frequency = start_frequency
+        self.end_frequency = end_frequency
+        self.duration_s = duration_s
+        self.log_sweep = log_sweep
+        self._period = max(1, int(duration_s * settings.sample_rate))
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        samples = np.zeros(num_samples, dtype=np.float)
+        f0 = self.start_frequency
+        f1 = self.end_frequency
+        for i_out, position, count in self._periodic_segments(num_samples, self._period):
+            t = (self._index(count) + position) / self.sample_rate
+
+            # Phase is the integral of the frequency over time
+            if self.log_sweep and f0 > 0 and f0 != f1:
+                rate = math.log(f1 / f0) / self.duration_s
+                phase = (np.exp(t * rate) - 1) * (2.0 * math.pi * f0 / rate)
+            else:
+                phase = (t * f0 + t * t * ((f1 - f0) / (2.0 * self.duration_s))) * (2.0 * math.pi)
+
+            samples[i_out:i_out + count] = np.sin(phase)
+
+        samples *= self.level
+        return samples
+
+
+def _uniform_table(size: int, seed: int) -> np.ndarray:
+    '''size uniformly distributed values from -1 to 1.  Only built once per signal, so the Python loop is fine.'''
+    if hasattr(random, 'Random'):
+        rng = random.Random(seed)
+    else:
+        # CircuitPython's random has a single generator
+        random.seed(seed)
+        rng = random
+
+    table = np.zeros(size, dtype=np.float)
+    for i in range(size):
+        table[i] = rng.random() * 2.0 - 1.0
+    return table
+
+
+def _pink_table(size: int, seed: int) -> np.ndarray:
+    '''
+    Noise with equal power in every octave, made by scaling the spectrum of white noise by 1 / sqrt(frequency).
+    The result repeats seamlessly because the inverse FFT is periodic.
+    '''
+    re, im = np.fft.fft(_uniform_table(size, seed))
+    scale = np.zeros(size, dtype=np.float)
+    half = size // 2
+    # Bin k and its mirror image size - k hold the same frequency
+    scale[1:half + 1] = 1.0 / np.sqrt(np.arange(1, half + 1, dtype=np.float))
+    scale[half + 1:] = scale[1:size - half][::-1]
+    re *= scale
+    im *= scale
+
+    table, im = np.fft.ifft(re, im)
+    table /= np.max(abs(table))
+    return table
+
+
+class Noise(Signal):
+    '''
+    White or pink noise.  The noise is generated once into a table, which is read in a loop, so each frame only copies
+    samples.
+    '''
+
+    def __init__(self, settings: RecordingSettings, pink: bool = True, seed: int = 0, level: float = 0.3,
+                 table_size: int = default_noise_table_size):
+        '''
+        :param pink: Equal power per octave, like most music.  False gives white noise, equal power per frequency.
+        :param table_size: Samples of noise before it repeats.  Pink noise uses the FFT, so this must be a power of
+        two.
+        '''
+        super().__init__(settings, level)
+        self.pink = pink
+        self.seed = seed
+        self._table = _pink_table(table_size, seed) if pink else _uniform_table(table_size, seed)
+        self._table *= level
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        samples = np.zeros(num_samples, dtype=np.float)
+        for i_out, position, count in self._periodic_segments(num_samples, len(self._table)):
+            samples[i_out:i_out + count] = self._table[position:position + count]
+        return samples
+
+
+class Drums(Signal):
+    '''
+    A kick drum on every beat and a snare on the second and fourth beat of each bar.  The kick is a sine that drops in
+    pitch as it decays, the snare a burst of white noise.
+    '''
+
+    kick_start_frequency = 150.0
+    kick_end_frequency = 50.0
+    kick_decay_s = 0.12
+    snare_decay_s = 0.06
+
+    def __init__(self, settings: RecordingSettings, bpm: float = 120.0, seed: int = 0, level: float = 0.8):
+        super().__init__(settings, level)
+        self.bpm = bpm
+        self._beat_samples = max(1, int(settings.sample_rate * 60.0 / bpm))
+        self._snare = Noise(settings, pink=False, seed=seed, level=1.0)
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        samples = np.zeros(num_samples, dtype=np.float)
+        beat_samples = self._beat_samples
+        i_beat = self._i_sample // beat_samples
+        for i_out, position, count in self._periodic_segments(num_samples, beat_samples):
+            t = (self._index(count) + position) / self.sample_rate
+
+            # The kick's frequency falls exponentially from start to end, so its phase is the integral of that curve
+            f0 = self.kick_start_frequency
+            f1 = self.kick_end_frequency
+            decay = self.kick_decay_s
+            phase = (t * f1 + (1 - np.exp(t * (-1.0 / decay))) * ((f0 - f1) * decay)) * (2.0 * math.pi)
+            hit = np.sin(phase) * np.exp(t * (-1.0 / decay))
+
+            if i_beat % 2 == 1:
+                # Leave room for the snare so the sum of the two stays within level
+                hit *= 0.7
+                hit += self._snare.generate(count) * np.exp(t * (-1.0 / self.snare_decay_s)) * 0.3
+
+            samples[i_out:i_out + count] = hit
+            if position + count >= beat_samples:
+                i_beat += 1
+
+        samples *= self.level
+        return samples
+
+
+class SilenceToLoud(Signal):
+    '''
+    Another signal, silent at first and then fading in.  Repeats so soak tests see the transition over and over,
+    which exercises the volume normalization's response to a sudden change in level.
+    '''
+
+    def __init__(self, signal: Signal, silence_s: float = 2.0, ramp_s: float = 0.5, loud_s: float = 4.0,
+                 floor_db: float = -60.0):
+        '''
+        :param signal: Signal that fades in
+        :param ramp_s: Time to fade in from floor_db to full level.  0 switches on instantly.
+        :param loud_s: Time spent at full level before going silent again
+        '''
+        super().__init__(signal.settings, signal.level)
+        self.signal = signal
+        self.silence_s = silence_s
+        self.ramp_s = ramp_s
+        self.floor_db = floor_db
+        sample_rate = signal.sample_rate
+        self._silence_samples = int(silence_s * sample_rate)
+        self._ramp_samples = int(ramp_s * sample_rate)
+        self._period = max(1, self._silence_samples + self._ramp_samples + int(loud_s * sample_rate))
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        samples = self.signal.generate(num_samples)
+        for i_out, position, count in self._periodic_segments(num_samples, self._period):
+            i = self._index(count) + (position - self._silence_samples)
+            if self._ramp_samples > 0:
+                # Fade in evenly in decibels, which sounds like a steady increase in volume
+                progress = np.clip(i / self._ramp_samples, 0, 1.0)
+                gain = np.exp((progress - 1) * (-self.floor_db * math.log(10) / 20.0))
+            else:
+                gain = np.ones(count, dtype=np.float)
+
+            samples[i_out:i_out + count] *= np.where(i < 0, 0.0, gain)
+
+        return samples
+
+
+class Mix(Signal):
+    '''The sum of several signals.  Levels add, so keep the sum of the signals' levels at or below 1 to avoid
+    clipping.'''
+
+    def __init__(self, signals: list[Signal]):
+        if len(signals) == 0:
+            raise ValueError("Mix needs at least one signal")
+
+        super().__init__(signals[0].settings, sum(signal.level for signal in signals))
+        self.signals = signals
+
+    def _generate(self, num_samples: int) -> np.ndarray:
+        samples = self.signals[0].generate(num_samples)
+        for signal in self.signals[1:]:
+            samples += signal.generate(num_samples)
+        return samples
+
+
+def standard_signals(settings: RecordingSettings, seed: int = 0) -> dict[str, Signal]:
+    '''
+    A named signal for each kind of sound the displays should handle, for benchmarks and soak tests
+    '''
+    return {
+        'silence': Silence(settings),
+        'tone': Tone(settings, 440.0),
+        'sweep': Chirp(settings, 50.0, min(8000.0, settings.max_detectable_frequency), 4.0),
+        'pink noise': Noise(settings, seed=seed),
+        'drums': Drums(settings, seed=seed),
+        'silence to loud': SilenceToLoud(Noise(settings, seed=seed, level=0.6)),
+        'dc drift': Mix([DcDrift(settings), Tone(settings, 220.0, level=0.3)]),
+        'music': Mix([Drums(settings, seed=seed, level=0.4), Noise(settings, seed=seed + 1, level=0.1),
+                      Chirp(settings, 110.0, 880.0, 8.0, level=0.2), Tone(settings, 2000.0, level=0.05)]),
+    }
+
+
+def benchmark_signals(settings: RecordingSettings, num_frames: int = 200, seed: int = 0) -> None:
+    '''
+    Print how many hops of each standard signal can be generated per second
+    '''
+    import time
+
+    buffer = array.array("H", [0x0000] * settings.hop_size)
+    for name, signal in standard_signals(settings, seed).items():
+        start = time.monotonic_ns()
+        for i in range(num_frames):
+            signal.readinto(buffer)
+        elapsed_s = (time.monotonic_ns() - start) / 1000000000
+        fps = num_frames / elapsed_s if elapsed_s > 0 else math.inf
+        print(f'{name}: {fps:0.0f} frames/s')
@@ -1,13 +1,13 @@
 import neopixel
 from interfaces import IDisplay
+import stage_timing
+import filterbank
+from filterbank import FilterBank
 import ulab.numpy as np
-import ema
 from display_settings import DisplaySettings
-from spectrum_shared import map_float_color_to_neopixel_color,  map_power_to_range, \
-    map_normalized_value_to_color, log_range, float_to_indicies, get_freq_powers_by_range, \
-    linear_range, space_indicies, map_normalized_power_to_range
-import display_range
-import simple_display_range
+from framebuffer import FrameBuffer
+from spectrum_shared import log_range, float_to_indicies, RangeAggregator, linear_range, space_indicies
+import normalization
 import colormap
 from standard_colormaps import default_waterfall_colormap
 
@@ -21,11 +21,25 @@ class WaterfallDisplay(IDisplay):
     pixel_values: list[list[tuple[int, int, int]]] #Stores the values
     _range_indicies: np.array[int]
     _group_power: np.array[float]
+    _normalizer: normalization.Normalizer  # Scales _group_power to 0 to 1
+    _range_aggregator: RangeAggregator | FilterBank
+    _framebuffer: FrameBuffer
+    _rows: np.array[int]  # Ring of colored rows, num_rows * num_cols x 3 uint8, plus an off color for unused pixels
+    _row_slots: tuple[np.array[int]]  # View of each row's slot in _rows
+    _head: int  # Slot in _rows holding the newest row
+    _permutations: tuple[np.array[int]]  # For each head position, the _rows entry each pixel displays
+    _row_levels: np.array[float]
+    _row_index: np.array[int]
 
     @property
     def num_visible_groups(self) -> int:
         return self.num_cols
 
+    @property
+    def framebuffer(self) -> FrameBuffer:
+        '''Holds the frames sent to the pixels, and counts how many were sent and skipped'''
+        return self._framebuffer
+
     @property
     def num_total_groups(self) -> int:
         return self.num_visible_groups
@@ -36,94 +50,87 @@ class WaterfallDisplay(IDisplay):
         self.num_rows = settings.num_rows
         self.num_cols = settings.num_cols
         self._colormap = cmap if cmap is not None else default_waterfall_colormap
-        self._display_range = simple_display_range.SimpleDisplayRange(self.num_cols)
+        self._normalizer = normalization.build_normalizer(settings.normalization, self.num_cols)
         self.pixel_indexer = settings.indexer
         self._range_indicies = None
+        self._range_aggregator = None
         self._group_power = None
-        self.move_up_one_row_map = self._build_move_pixel_map()
-
-        self._mean_group_power_ema = []
-        for i in range(0, self.num_cols):
-            self._mean_group_power_ema.append(ema.EMA(500, 1.5))
-
-    def _move_display_up_one_row(self) -> None:
+        self._framebuffer = FrameBuffer(pixels, settings.min_frame_delta)
+
+        num_cells = self.num_rows * self.num_cols
+        self._rows = np.zeros((num_cells + 1, 3), dtype=np.uint8)
+        self._row_slots = tuple(self._rows[i_slot * self.num_cols:(i_slot + 1) * self.num_cols]
+                                for i_slot in range(self.num_rows))
+        self._head = 0
+        self._permutations = self._build_permutations()
+        self._row_levels = np.zeros(self.num_cols)
+        self._row_index = np.zeros(self.num_cols, dtype=np.uint16)
+
+    def _build_permutations(self) -> tuple[np.array[int]]:
         '''
-        A helper function to move each row in the waterfall one step
-        :return:
+        Create, for each position of the newest row in the ring, a map from each pixel to the entry in _rows it
+        displays.  Row 0 of the display is the newest row, row 1 the one before it, and so on.  Scrolling is then just
+        moving the head, and no pixel is ever read back from the strip, so colors do not lose precision as they scroll.
         '''
+        num_cells = self.num_rows * self.num_cols
+        permutations = []
+        for i_head in range(self.num_rows):
+            pixel_map = {}
+            for i_row in range(self.num_rows):
+                i_slot = (i_head - i_row) % self.num_rows
+                for i_col in range(self.num_cols):
+                    pixel_map[i_slot * self.num_cols + i_col] = self.pixel_indexer(i_row, i_col, self.settings)
 
-        for i_row in range(self.num_rows-2, -1, -1):
-            col_map = self.move_up_one_row_map[i_row]
-            for i_col in range(0, self.num_cols):
-                i_source, i_target = col_map[i_col]
-                self.pixels[i_target] = self.pixels[i_source]
+            permutations.append(self._framebuffer.build_source_index(pixel_map, num_cells))
 
-                #i_source = self.pixel_indexer(i_row, i_col)
-                #i_target = self.pixel_indexer(i_row+1, i_col)
-                #self.pixels[i_target] = self.pixels[i_source]
-
-    def _build_move_pixel_map(self) -> tuple[tuple[int, int]]:
-        '''
-        Create a lookup map to move each pixel up one row.  This is considerably faster than calling a function
-        for each pixel to calculate an index
-        '''
-        row_map = []
-        for i_row in range(0, self.num_rows-1):
-            col_map = []
-            for i_col in range(0, self.num_cols):
-                i_source = self.pixel_indexer(i_row, i_col, self.settings)
-                i_target = self.pixel_indexer(i_row+1, i_col, self.settings)
-                col_map.append((i_source, i_target))
-            row_map.append(tuple(col_map))
-        return tuple(row_map)
+        return tuple(permutations)
 
     def show(self, power_spectrum: np.array):
         if self._range_indicies is None:
             if self.settings.log_scale:
-                range = log_range(len(power_spectrum), self.num_total_groups)
+                group_range = log_range(len(power_spectrum), self.num_total_groups)
             else:
-                range = linear_range(len(power_spectrum), self.num_total_groups)
+                group_range = linear_range(len(power_spectrum), self.num_total_groups)
 
-            self._range_indicies = float_to_indicies(range)
+            self._range_indicies = float_to_indicies(group_range)
             self._range_indicies = space_indicies(self._range_indicies)
+            self._range_aggregator = filterbank.build_aggregator(self.settings.filterbank_scale,
+                                                                 self._range_indicies, len(power_spectrum))
+            self._group_power = np.zeros(self._range_aggregator.num_groups)
 
-        self._group_power = get_freq_powers_by_range(power_spectrum,
-                                                     self._range_indicies,
-                                                     out=self._group_power)
+        start_ns = stage_timing.start()
+        self._range_aggregator.aggregate(power_spectrum, out=self._group_power)
+        stage_timing.stop('aggregate', start_ns)
 
-        self._group_power = self._group_power * self._group_power
+        self._group_power *= self._group_power
 
-
-        #First, take all old pixel values, and move them up one row, except for the last row, which steps off the display
-        self._move_display_up_one_row()
-
-        norm_values = self._display_range.get_normalized_values(self._group_power)
+        start_ns = stage_timing.start()
+        norm_values = self._normalizer.normalize(self._group_power)
+        stage_timing.stop('normalize', start_ns)
         if norm_values is None:
-            self._display_range.add(self._group_power)
             return
 
-        #next, write the new row of columns on the bottom row
-        #print(f'n_groups: {len(group_power)} n_cutoff: {self.num_cutoff_groups}')
-        for i in range(0, len(self._group_power)):
-            #print(f'i: {i}')
-            #self._mean_group_power_ema[i].add(self._group_power[i])
-            i_pixel = self.pixel_indexer(0, i, self.settings)
-            #min_val, max_val = self._display_range.get_group_minmax(i)
-            #print(f'min: {min_val:0.3f} max: {max_val:0.3f}')
-            norm_value = norm_values[i]
-
-            i_range, norm_value = map_normalized_power_to_range(norm_value,
-                                                                range_cutoffs=self._colormap.range_cutoffs)
-            #i_range, norm_value = map_power_to_range(self._group_power[i], min_val, max_val, range_cutoffs=waterfall_range_cutoffs)
-
-            if i_range is None:
-                self.pixels[i_pixel] = (0, 0, 0)
-            else:
-                neo_color = map_normalized_value_to_color(normalized_value=norm_value, colormap_index=i_range, color_map=self._colormap.colors)
+        self._draw_row(norm_values)
+
+    def _draw_row(self, norm_values: np.array[float]) -> None:
+        '''
+        Scroll the display up by a row, with a row colored by the normalized values as the newest, and send the frame
+        to the strip
+        '''
+        start_ns = stage_timing.start()
+
+        # The oldest row steps off the display, and its slot in the ring holds the new row
+        self._head = self._head + 1 if self._head + 1 < self.num_rows else 0
 
-                #print(f'i: {i_pixel} val: {group_power[i]:0.3f} norm: {norm_value:0.3f}')
-                self.pixels[i_pixel] = map_float_color_to_neopixel_color(neo_color, norm_value)
+        # Color the new row with the colormap's compiled table.  The normalized values are already clipped to 0 to 1.
+        row_levels = self._row_levels
+        row_levels[:] = norm_values
+        row_levels *= self._colormap.level_scale
+        self._row_index[:] = row_levels
+        np.take(self._colormap.dimmed_lut, self._row_index, axis=0, out=self._row_slots[self._head])
 
-        self.pixels.show()
+        # Arrange the rows, newest at the bottom, into pixel order and send them to the display
+        np.take(self._rows, self._permutations[self._head], axis=0, out=self._framebuffer.frame)
+        stage_timing.stop('color', start_ns)
 
-        self._display_range.add(self._group_power)
\ No newline at end of file
+        self._framebuffer.show()
\ No newline at end of file